@@ -0,0 +1,245 @@
+from __future__ import annotations
+
+import base64
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from argparse import ArgumentParser, Namespace
+from datetime import datetime, timedelta
+from typing import Callable
+from solana.blockhash import Blockhash
+from solana.keypair import Keypair
+
+import layout
+from hello_client import (
+    CounterAccount, TransactionProcessingData, DEFAULT_PROVIDER, get_correlation_store, update_in_shared_dict,
+    decode_counter_notification
+)
+from correlation import next_send_id
+from ws_subscriptions import json_loads
+from transactions import get_data_account_pubkey, get_counter_txn, get_txn_nonce_key
+
+# Micro-benchmarks of the client hot path, no network is needed.
+#
+# Every benchmark is timed in rounds of a calibrated number of calls, the best round gives ops/sec.
+# Allocations are measured in a separate run under tracemalloc (it slows the calls down considerably):
+# the peak of memory allocated while a single call runs and the memory still held after the calls.
+# Results are written as JSON, with --baseline they are compared to a previously saved run.
+
+RECENT_BLOCKHASH = Blockhash('EETubP5AKHgjPAhzPAFcb8BAY1hMH639CWCFTqi3hq1k')
+
+
+def get_args() -> Namespace:
+    parser = ArgumentParser(description="Micro-benchmarks of the Solana counter client hot path")
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        help="Path to a JSON file the results are written to.",
+        default="benchmark.json"
+    )
+    parser.add_argument(
+        "-b",
+        "--baseline",
+        type=str,
+        help="Path to a JSON file with saved results the current run is compared to.",
+        default=None
+    )
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        help="Percentage of ops/sec the benchmark may lose against the baseline before the run fails.",
+        default=10.0
+    )
+    parser.add_argument(
+        "--rounds",
+        type=int,
+        help="Number of timed rounds per benchmark, the best one is reported.",
+        default=5
+    )
+    parser.add_argument(
+        "--round-time",
+        type=float,
+        help="Approximate duration of one timed round in seconds.",
+        default=0.2
+    )
+    parser.add_argument(
+        "-f",
+        "--filter",
+        type=str,
+        help="Run only benchmarks which name contains the string.",
+        default=None
+    )
+    return parser.parse_args()
+
+
+def get_benchmarks() -> dict:
+    # name -> function of no arguments doing one operation
+    keypair = Keypair()
+    program_keypair = Keypair()
+    program_data_pubkey = get_data_account_pubkey(keypair.public_key, program_keypair.public_key)
+    client_time = datetime.utcnow()
+    account_data = layout.encode_counter_account(42, int(client_time.timestamp()), int(client_time.timestamp()))
+    account_json = {
+        'jsonrpc': '2.0',
+        'result': {
+            'context': {'slot': 52287},
+            'value': {
+                'data': [base64.b64encode(account_data).decode(), 'base64'],
+                'executable': False,
+                'lamports': 1141440,
+                'owner': str(program_keypair.public_key),
+                'rentEpoch': 0
+            }
+        },
+        'id': 1
+    }
+    # accountNotification as it comes over the websocket
+    notification_text = json.dumps({
+        'jsonrpc': '2.0',
+        'method': 'accountNotification',
+        'params': {'result': account_json['result'], 'subscription': 1}
+    })
+
+    def ws_notification_full():
+        params = json.loads(notification_text)['params']
+        return datetime.utcnow(), CounterAccount(params)
+
+    def ws_notification_fast():
+        received_at = time.monotonic()
+        return decode_counter_notification(received_at, json_loads(notification_text)['params'])
+
+    def sign_counter_txn():
+        txn = get_counter_txn(
+            public_key=keypair.public_key,
+            program_key=program_keypair.public_key,
+            program_data_key=program_data_pubkey,
+            client_time=client_time,
+            recent_blockhash=RECENT_BLOCKHASH,
+            nonce_key=get_txn_nonce_key()
+        )
+        txn.sign(keypair, program_keypair)
+        return txn.serialize()
+
+    sent = TransactionProcessingData(client_time, DEFAULT_PROVIDER, started_at=client_time, txn_id='txn', send_id=1)
+    notified = TransactionProcessingData(client_time, DEFAULT_PROVIDER, blockchain_counter=42, ws_time=client_time)
+    store = get_correlation_store()
+    times = iter(range(1 << 40))
+
+    def correlate_in_store():
+        # a record sent and a record notified over the websocket, the store completes it
+        at = client_time + timedelta(seconds=next(times))
+        update_in_shared_dict(store, TransactionProcessingData(
+            at, DEFAULT_PROVIDER, started_at=at, txn_id='txn', send_id=next_send_id()
+        ))
+        update_in_shared_dict(store, TransactionProcessingData(at, DEFAULT_PROVIDER, blockchain_counter=42, ws_time=at))
+
+    store.on_complete = lambda record: None
+    return {
+        'COUNTER_INSTRUCTION.build': lambda: layout.COUNTER_INSTRUCTION.build({'client_timestamp': client_time}),
+        'encode_counter_instruction': lambda: layout.encode_counter_instruction(client_time),
+        'COUNTER_ACCOUNT.parse': lambda: layout.COUNTER_ACCOUNT.parse(account_data),
+        'decode_counter_account': lambda: layout.decode_counter_account(account_data),
+        'CounterAccount.__init__': lambda: CounterAccount(account_json),
+        'ws notification full': ws_notification_full,
+        'ws notification fast': ws_notification_fast,
+        'get_counter_txn+sign': sign_counter_txn,
+        'get_data_account_pubkey': lambda: get_data_account_pubkey(keypair.public_key, program_keypair.public_key),
+        'TransactionProcessingData.merge': lambda: sent.merge(notified),
+        'update_in_shared_dict': correlate_in_store,
+    }
+
+
+def calibrate(operation: Callable, round_time: float) -> int:
+    number = 1
+    while True:
+        started_at = time.perf_counter()
+        for _ in range(number):
+            operation()
+        elapsed = time.perf_counter() - started_at
+        if elapsed >= round_time / 10:
+            return max(int(number * round_time / elapsed), 1)
+        number *= 10
+
+
+def measure_time(operation: Callable, rounds: int, round_time: float) -> dict:
+    number = calibrate(operation, round_time)
+    best = float('inf')
+    for _ in range(rounds):
+        started_at = time.perf_counter()
+        for _ in range(number):
+            operation()
+        best = min(best, time.perf_counter() - started_at)
+    return {'ops_per_sec': number / best, 'ns_per_op': best / number * 1e9, 'calls_per_round': number}
+
+
+def measure_allocations(operation: Callable, number: int = 1000) -> dict:
+    operation()  # warm up caches, they are not a per operation cost
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        operation()
+        _, peak = tracemalloc.get_traced_memory()
+        started_with, _ = tracemalloc.get_traced_memory()
+        for _ in range(number):
+            operation()
+        held, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'peak_bytes_per_op': peak - current, 'retained_bytes_per_op': (held - started_with) / number}
+
+
+def run(args: Namespace) -> dict:
+    results = {}
+    for name, operation in get_benchmarks().items():
+        if args.filter and args.filter not in name:
+            continue
+        result = measure_time(operation, args.rounds, args.round_time)
+        result.update(measure_allocations(operation))
+        results[name] = result
+        print(f'{name:>32}: {result["ops_per_sec"]:>12,.0f} ops/sec {result["ns_per_op"]:>12,.0f} ns/op '
+            f'{result["peak_bytes_per_op"]:>8} B peak/op {result["retained_bytes_per_op"]:>8.1f} B retained/op')
+    return results
+
+
+def compare(results: dict, baseline: dict, max_regression: float) -> bool:
+    # True when no benchmark lost more than max_regression percent of its ops/sec
+    passed = True
+    for name, result in results.items():
+        if name not in baseline:
+            print(f'{name:>32}: not in the baseline')
+            continue
+        change = (result['ops_per_sec'] / baseline[name]['ops_per_sec'] - 1) * 100
+        regression = change < -max_regression
+        passed = passed and not regression
+        print(f'{name:>32}: {change:+7.1f}% ops/sec, '
+            f'{result["peak_bytes_per_op"] - baseline[name]["peak_bytes_per_op"]:+6} B peak/op'
+            f'{"  REGRESSION" if regression else ""}')
+    return passed
+
+
+def main():
+    args = get_args()
+    results = run(args)
+    with open(args.output, 'w') as output:
+        json.dump({
+            'python': sys.version,
+            'platform': platform.platform(),
+            'created_at': datetime.utcnow().isoformat(),
+            'benchmarks': results
+        }, output, indent=2)
+    print(f'Results written to {args.output}')
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        print(f'Compared to baseline {args.baseline} ({baseline["created_at"]}):')
+        if not compare(results, baseline['benchmarks'], args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
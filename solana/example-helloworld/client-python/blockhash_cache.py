@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+from solana.blockhash import Blockhash
+from solana.rpc.async_api import AsyncClient
+from solana.rpc.commitment import Commitment, Finalized
+from solana.rpc.core import RPCException
+
+
+# JSON-RPC error codes of the Solana RPC server
+RPC_METHOD_NOT_FOUND = -32601
+RPC_SEND_TRANSACTION_PREFLIGHT_FAILURE = -32002
+
+# the fee of a signature since the fee calculator went away, getLatestBlockhash does not report it
+DEFAULT_LAMPORTS_PER_SIGNATURE = 5000
+
+
+def is_blockhash_not_found(error: Exception) -> bool:
+    # A refused send is raised as RPCException of the JSON-RPC error, e.g.,
+    # {'code': -32002, 'message': 'Transaction simulation failed: Blockhash not found',
+    #  'data': {'err': 'BlockhashNotFound', 'logs': [], ...}}
+    # the transaction error in 'data' is matched, the message text differs between the node versions.
+    rpc_error = error.args[0] if isinstance(error, RPCException) and error.args else None
+    if not isinstance(rpc_error, dict):
+        return False
+    data = rpc_error.get('data')
+    return rpc_error.get('code') == RPC_SEND_TRANSACTION_PREFLIGHT_FAILURE \
+        and isinstance(data, dict) and data.get('err') == 'BlockhashNotFound'
+
+
+class CachedBlockhash:
+    __slots__ = ('blockhash', 'slot', 'last_valid_slot', 'last_valid_block_height', 'lamports_per_signature', 'fetched_at')
+
+    def __init__(self, blockhash: Blockhash, slot: int, last_valid_slot: int,
+            last_valid_block_height: int, lamports_per_signature: int):
+        self.blockhash: Blockhash = blockhash
+        self.slot: int = slot  # context slot the blockhash was fetched at
+        self.last_valid_slot: int = last_valid_slot  # reported by getFees only, None otherwise
+        self.last_valid_block_height: int = last_valid_block_height
+        self.lamports_per_signature: int = lamports_per_signature
+        self.fetched_at: float = time.monotonic()
+
+    def age(self) -> float:
+        return time.monotonic() - self.fetched_at
+
+    def __str__(self):
+        return (f'CachedBlockhash(blockhash={self.blockhash}, slot={self.slot}, last_valid_slot={self.last_valid_slot}, '
+            f'last_valid_block_height={self.last_valid_block_height}, age={self.age():.2f}s)')
+
+
+class RecentBlockhashCache:
+    # Recent blockhash refreshed by a background task.
+    #
+    # Without a blockhash the solana AsyncClient.send_transaction fetches one before every send,
+    # i.e., two RPC round trips per transaction. The cache keeps the latest blockhash (fetched with
+    # getLatestBlockhash, which provides the last valid block height together with the hash) refreshed
+    # every 'refresh_interval' seconds, so that transaction builders get it synchronously.
+    # A node older than 1.9 does not know getLatestBlockhash, the deprecated getFees is used then.
+    # A blockhash the cluster does not know is invalidated and a new one is fetched immediately.
+    def __init__(
+        self,
+        client: AsyncClient,
+        refresh_interval: float = 2.0,
+        max_age: float = 60.0,
+        commitment: Commitment = Finalized
+    ) -> None:
+        self.client: AsyncClient = client
+        self.refresh_interval: float = refresh_interval
+        self.max_age: float = max_age  # a blockhash is valid for 150 blocks, i.e., roughly 60-90 seconds
+        self.commitment: Commitment = commitment
+        self._current: CachedBlockhash = None
+        self._refreshing: asyncio.Task = None
+        self._refresh_now: asyncio.Event = asyncio.Event()
+        self._task: asyncio.Task = None
+        self._latest_blockhash_supported: bool = True
+
+    async def start(self) -> RecentBlockhashCache:
+        if self._task is None:
+            await self.refresh()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def current(self) -> CachedBlockhash:
+        if self._current is None:
+            raise ValueError('No recent blockhash is cached')
+        if self._current.age() > self.max_age:
+            raise ValueError(f'Cached blockhash is too old to be used, {self._current}')
+        return self._current
+
+    def get(self) -> Blockhash:
+        return self.current().blockhash
+
+    def invalidate(self, blockhash: Blockhash = None) -> None:
+        if self._current is not None and (blockhash is None or self._current.blockhash == blockhash):
+            print(f'Invalidating blockhash {self._current}')
+            self._current = None
+            self._refresh_now.set()
+
+    async def refresh(self) -> CachedBlockhash:
+        # concurrent callers wait for the same single blockhash request
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.get_running_loop().create_task(self._fetch())
+        return await asyncio.shield(self._refreshing)
+
+    async def get_or_refresh(self) -> Blockhash:
+        try:
+            return self.get()
+        except ValueError:
+            return (await self.refresh()).blockhash
+
+    async def _fetch(self) -> CachedBlockhash:
+        if self._latest_blockhash_supported:
+            response = await self.client.get_latest_blockhash(self.commitment)
+            if response.get('error', {}).get('code') == RPC_METHOD_NOT_FOUND:
+                print('getLatestBlockhash is not supported by the RPC node, falling back to getFees')
+                self._latest_blockhash_supported = False
+        if not self._latest_blockhash_supported:
+            response = await self.client.get_fees(self.commitment)
+        if 'result' not in response:
+            raise RPCException(f'Cannot fetch recent blockhash: {response}')
+        value = response['result']['value']
+        fee_calculator = value.get('feeCalculator') or {}
+        self._current = CachedBlockhash(
+            blockhash=Blockhash(value['blockhash']),
+            slot=response['result']['context']['slot'],
+            last_valid_slot=value.get('lastValidSlot'),
+            last_valid_block_height=value.get('lastValidBlockHeight'),
+            lamports_per_signature=fee_calculator.get('lamportsPerSignature', DEFAULT_LAMPORTS_PER_SIGNATURE)
+        )
+        return self._current
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._refresh_now.wait(), timeout=self.refresh_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._refresh_now.clear()
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f'ERROR: cannot refresh recent blockhash: {e}')
+
+    async def close(self) -> None:
+        for task in (self._task, self._refreshing):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+        self._task = None
+        self._refreshing = None
+
+    async def __aenter__(self) -> RecentBlockhashCache:
+        return await self.start()
+
+    async def __aexit__(self, _exc_type, _exc, _tb) -> None:
+        await self.close()
@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import itertools
+import mmap
+import os
+import struct
+import time
+
+from datetime import datetime
+from typing import Iterator, NamedTuple
+
+# Capture of the RPC and websocket traffic of the client, a compact length-prefixed binary log.
+#
+# The file starts with CAPTURE_HEADER (magic and the offset of the wall clock to the monotonic clock
+# of the capturing process), a sequence of records follows. Every record is RECORD_HEADER
+# (payload length, kind, stream, monotonic time, correlation id) and the payload, the message
+# bytes as they went over the wire. A stream is an HTTP endpoint or a websocket, its url is written
+# once as a KIND_STREAM record. The correlation id of an HTTP request and its response is the
+# number of the exchange, the one of a websocket message is its JSON-RPC id (the subscription id
+# for a notification).
+CAPTURE_MAGIC = b'HWCAP\x01'
+CAPTURE_HEADER = struct.Struct('<6sd')  # magic, wall clock time at monotonic zero
+RECORD_HEADER = struct.Struct('<IBHdQ')  # payload length u32, kind u8, stream u16, monotonic time f64, correlation id u64
+
+KIND_STREAM = 0
+KIND_HTTP_REQUEST = 1
+KIND_HTTP_RESPONSE = 2
+KIND_WS_SEND = 3
+KIND_WS_RECEIVE = 4
+KIND_NAMES = {
+    KIND_STREAM: 'stream', KIND_HTTP_REQUEST: 'http request', KIND_HTTP_RESPONSE: 'http response',
+    KIND_WS_SEND: 'ws send', KIND_WS_RECEIVE: 'ws receive'
+}
+
+
+class CaptureRecord(NamedTuple):
+    kind: int
+    stream: int
+    at: float  # time.monotonic() of the capturing process
+    correlation_id: int
+    payload: bytes
+
+
+class CaptureWriter:
+    # Appends the records through a buffered file, a record is a single write to the buffer
+    # and the disk is written once per 'buffer_size' bytes. Not thread safe, it's written
+    # from the event loop only.
+    def __init__(self, path: str, buffer_size: int = 1 << 20) -> None:
+        self.path: str = path
+        self.records: int = 0
+        self.size: int = 0
+        self._file = open(path, 'wb', buffering=buffer_size)
+        self._file.write(CAPTURE_HEADER.pack(CAPTURE_MAGIC, time.time() - time.monotonic()))
+        self._streams: dict = {}  # url -> stream id
+        self._next_stream: int = 0
+        self._exchange_ids = itertools.count(1)
+
+    def stream(self, url: str, new: bool = False) -> int:
+        # HTTP requests to an endpoint share its stream, every websocket is a 'new' stream
+        # as the JSON-RPC ids are unique per socket only
+        stream = None if new else self._streams.get(url)
+        if stream is None:
+            stream = self._next_stream
+            self._next_stream += 1
+            self._streams.setdefault(url, stream)
+            self.write(KIND_STREAM, stream, 0, url.encode())
+        return stream
+
+    def exchange_id(self) -> int:
+        return next(self._exchange_ids)
+
+    def write(self, kind: int, stream: int, correlation_id: int, payload: bytes, at: float = None) -> None:
+        if self._file is None:
+            return
+        self._file.write(RECORD_HEADER.pack(
+            len(payload), kind, stream, time.monotonic() if at is None else at, correlation_id
+        ) + payload)
+        self.records += 1
+        self.size += RECORD_HEADER.size + len(payload)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            print(f'Capture {self.path}: {self.records} records, {self.size / (1 << 20):.1f} MiB')
+
+
+class CaptureReader:
+    # Streams the records of a capture file through a memory map, the file is never read whole,
+    # the pages are loaded by the OS on access and dropped under memory pressure.
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+        self.wall_clock_offset: float = None
+        self.streams: dict = {}  # stream id -> url, filled while the records are read
+        self.truncated: bool = False
+
+    def __iter__(self) -> Iterator[CaptureRecord]:
+        with open(self.path, 'rb') as capture_file:
+            if os.fstat(capture_file.fileno()).st_size < CAPTURE_HEADER.size:
+                raise ValueError(f'Capture {self.path} is empty')
+            with mmap.mmap(capture_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if hasattr(data, 'madvise'):
+                    data.madvise(mmap.MADV_SEQUENTIAL)
+                magic, self.wall_clock_offset = CAPTURE_HEADER.unpack_from(data, 0)
+                if magic != CAPTURE_MAGIC:
+                    raise ValueError(f'File {self.path} is not a capture, magic {magic}')
+                offset, size = CAPTURE_HEADER.size, len(data)
+                while offset < size:
+                    if offset + RECORD_HEADER.size > size:
+                        self.truncated = True
+                        break
+                    length, kind, stream, at, correlation_id = RECORD_HEADER.unpack_from(data, offset)
+                    offset += RECORD_HEADER.size
+                    if offset + length > size:
+                        # the capturing process was killed in the middle of a write
+                        self.truncated = True
+                        break
+                    payload = data[offset:offset + length]
+                    offset += length
+                    if kind == KIND_STREAM:
+                        self.streams[stream] = payload.decode()
+                    yield CaptureRecord(kind, stream, at, correlation_id, payload)
+        if self.truncated:
+            print(f'ERROR: capture {self.path} ends with an incomplete record, it was ignored')
+
+    def wall_time(self, at: float) -> datetime:
+        # same (naive UTC) time as datetime.utcnow() of the capturing process at the monotonic time
+        return datetime.utcfromtimestamp(self.wall_clock_offset + at)
@@ -0,0 +1,293 @@
+from __future__ import annotations
+
+import base64
+import heapq
+import itertools
+import json
+
+from argparse import ArgumentParser, Namespace
+from datetime import datetime
+from solana.rpc.commitment import Processed, Confirmed, Finalized
+
+import layout
+from capture import (
+    CaptureReader, CaptureRecord, KIND_NAMES, KIND_HTTP_REQUEST, KIND_HTTP_RESPONSE, KIND_WS_SEND, KIND_WS_RECEIVE
+)
+from confirmation_tracker import COMMITMENT_RANKS
+from processing_data import TransactionProcessingData, delta_time
+from metrics import (
+    MetricsRegistry, STAGE_RPC_ACCEPT, STAGE_CONFIRMED, STAGE_WS_NOTIFICATION, STAGE_SIGNATURE_NOTIFICATION
+)
+
+# Offline analysis of a capture written by 'hello_client.py --capture'.
+#
+# The capture is streamed record by record, only the state of the transactions in flight is kept in memory.
+# Every counter transaction sent gets its TransactionProcessingData timeline back: sent and accepted
+# (sendTransaction request and response), confirmed (the first getSignatureStatuses response
+# at confirmed), the commitment levels from the signature notifications and the account notification
+# with the counter. Latencies are put to histograms of the same stages as the live client reports.
+# A timeline is counted and evicted when it is finalized (and notified, when the capture has account
+# notifications) or 'horizon' seconds of the capture after its send, so are the requests never answered.
+
+STAGE_COMMITMENTS = (Processed, Confirmed, Finalized)
+
+
+def get_args() -> Namespace:
+    parser = ArgumentParser(description="Offline analysis of a hello_client traffic capture")
+    parser.add_argument(
+        "capture",
+        type=str,
+        help="Path to the capture file."
+    )
+    parser.add_argument(
+        "--slowest",
+        type=int,
+        help="Number of the transactions with the longest confirmation to print the timelines of.",
+        default=10
+    )
+    parser.add_argument(
+        "--horizon",
+        type=float,
+        help="Seconds of the capture after which a transaction or a request is not waited for anymore.",
+        default=120.0
+    )
+    return parser.parse_args()
+
+
+def counter_client_timestamp(wire: bytes) -> int:
+    # The counter instruction is the only (i.e., last) one of the transaction and its data ends the wire format,
+    # the data length (compact-u16 of one byte) precedes it. None for any other transaction.
+    size = layout.COUNTER_INSTRUCTION_FORMAT.size
+    if len(wire) <= size or wire[-size - 1] != size:
+        return None
+    instruction_type, client_timestamp = layout.COUNTER_INSTRUCTION_FORMAT.unpack_from(wire, len(wire) - size)
+    return client_timestamp if instruction_type == 1 else None
+
+
+def messages(payload: bytes) -> list:
+    data = json.loads(payload)
+    return data if isinstance(data, list) else [data]
+
+
+class CaptureAnalyzer:
+    def __init__(self, reader: CaptureReader, slowest: int = 10, horizon: float = 120.0) -> None:
+        self.reader: CaptureReader = reader
+        self.slowest: int = slowest
+        self.horizon: float = horizon
+        self.registry: MetricsRegistry = MetricsRegistry()
+        self.timelines: dict = {}  # signature -> TransactionProcessingData, in flight only
+        self.records: dict = {name: 0 for name in KIND_NAMES.values()}
+        self.stats: dict = {
+            'sent': 0, 'failed': 0, 'notified': 0, 'unmatched notifications': 0, 'confirmed': 0, 'finalized': 0,
+            'landed with error': 0, 'timed out': 0, 'unanswered requests': 0
+        }
+        self._started: dict = {}  # signature -> (monotonic time of the sendTransaction request, client timestamp), in send order
+        self._not_notified: dict = {}  # client timestamp -> signatures without the account notification, in send order
+        self._http_requests: dict = {}  # (stream, exchange id) -> (monotonic time, request payload), in request order
+        self._ws_requests: dict = {}  # (stream, JSON-RPC id) -> (monotonic time, request), in request order
+        self._ws_subscriptions: dict = {}  # (stream, subscription id) -> subscribe request
+        self._account_notifications: bool = False  # the capture has the account subscription, timelines wait for it
+        self._signature_notified: set = set()  # (signature, commitment), a poll may see the stage first
+        self._failed: set = set()  # signatures landed with an error, no latency of theirs is recorded
+        self._slowest: list = []  # min-heap of (confirmation seconds, sequence, timeline), the 'slowest' longest
+        self._sequence = itertools.count()
+
+    def run(self) -> CaptureAnalyzer:
+        for record in self.reader:
+            self.records[KIND_NAMES.get(record.kind, 'unknown')] += 1
+            try:
+                self._handle(record)
+            except (ValueError, KeyError, IndexError, TypeError) as e:
+                print(f'ERROR: cannot process {KIND_NAMES.get(record.kind)} record {record.correlation_id} '
+                    f'of stream {record.stream} at {record.at}: {e!r}')
+            self._expire(record.at)
+        for signature in list(self.timelines):
+            self._finish(signature)
+        return self
+
+    def _handle(self, record: CaptureRecord) -> None:
+        if record.kind == KIND_HTTP_REQUEST:
+            self._http_requests[(record.stream, record.correlation_id)] = (record.at, record.payload)
+        elif record.kind == KIND_HTTP_RESPONSE:
+            request = self._http_requests.pop((record.stream, record.correlation_id), None)
+            if request is not None:
+                self._on_http_exchange(record.stream, request[0], messages(request[1]), record.at, messages(record.payload))
+        elif record.kind == KIND_WS_SEND:
+            for request in messages(record.payload):
+                if request['method'].endswith('Unsubscribe'):
+                    self._ws_subscriptions.pop((record.stream, request['params'][0]), None)
+                self._ws_requests[(record.stream, request['id'])] = (record.at, request)
+        elif record.kind == KIND_WS_RECEIVE:
+            self._on_ws_message(record.stream, record.at, json.loads(record.payload))
+
+    def _expire(self, now: float) -> None:
+        # all the maps are in the order of the capture, only their oldest entries can be over the horizon
+        while self._started:
+            signature, (sent_at, _) = next(iter(self._started.items()))
+            if now - sent_at < self.horizon:
+                break
+            self.stats['timed out'] += 1
+            self._finish(signature)
+        for requests in (self._http_requests, self._ws_requests):
+            while requests:
+                key, (sent_at, _) = next(iter(requests.items()))
+                if now - sent_at < self.horizon:
+                    break
+                del requests[key]
+                self.stats['unanswered requests'] += 1
+
+    def _is_finished(self, signature: str) -> bool:
+        # a failed transaction does not change the counter, no account notification comes for it
+        timeline = self.timelines[signature]
+        return timeline.finalized_at is not None and (
+            timeline.ws_time is not None or not self._account_notifications or signature in self._failed
+        )
+
+    def _finish(self, signature: str) -> None:
+        # the timeline is counted and forgotten, a late message of the transaction is ignored
+        timeline = self.timelines.pop(signature)
+        _, client_timestamp = self._started.pop(signature)
+        signatures = self._not_notified.get(client_timestamp)
+        if signatures and signature in signatures:
+            signatures.remove(signature)
+            if not signatures:
+                del self._not_notified[client_timestamp]
+        for commitment in STAGE_COMMITMENTS:
+            self._signature_notified.discard((signature, str(commitment)))
+        if signature in self._failed:
+            self._failed.discard(signature)
+            self.stats['landed with error'] += 1
+            return
+        if timeline.finalized_at is not None:
+            self.stats['finalized'] += 1
+        if timeline.finished_at is None:
+            return
+        self.stats['confirmed'] += 1
+        if self.slowest:
+            slowest = (delta_time(timeline.started_at, timeline.finished_at), next(self._sequence), timeline)
+            if len(self._slowest) < self.slowest:
+                heapq.heappush(self._slowest, slowest)
+            else:
+                heapq.heappushpop(self._slowest, slowest)
+
+    def _on_http_exchange(self, stream: int, sent_at: float, requests: list, received_at: float, responses: list) -> None:
+        # a JSON-RPC batch is answered in any order, the responses are paired by the id
+        responses = {response.get('id'): response for response in responses}
+        for request in requests:
+            response = responses.get(request.get('id'), {})
+            if request['method'] == 'sendTransaction':
+                self._on_send(stream, sent_at, request, received_at, response)
+            elif request['method'] == 'getSignatureStatuses' and 'result' in response:
+                for signature, status in zip(request['params'][0], response['result']['value']):
+                    if status and signature in self.timelines and status.get('confirmationStatus'):
+                        self._on_status(signature, received_at, status)
+
+    def _on_send(self, stream: int, sent_at: float, request: dict, received_at: float, response: dict) -> None:
+        signature = response.get('result')
+        if not isinstance(signature, str):
+            self.stats['failed'] += 1
+            return
+        if signature in self.timelines:
+            return  # the same transaction sent again (retry, race), the first send counts
+        client_timestamp = counter_client_timestamp(base64.b64decode(request['params'][0]))
+        if client_timestamp is None:
+            return  # not a counter transaction, e.g., the data account creation
+        provider = self.reader.streams.get(stream, str(stream))
+        self.stats['sent'] += 1
+        self.timelines[signature] = TransactionProcessingData(
+            datetime.fromtimestamp(client_timestamp), provider, started_at=self.reader.wall_time(sent_at), txn_id=signature
+        )
+        self._started[signature] = (sent_at, client_timestamp)
+        self._not_notified.setdefault(client_timestamp, []).append(signature)
+        self.registry.observe(STAGE_RPC_ACCEPT, provider, Confirmed, received_at - sent_at)
+
+    def _record_stage(self, signature: str, commitment, at: float, slot: int) -> bool:
+        timeline = self.timelines[signature]
+        if getattr(timeline, f'{commitment}_at') is not None:
+            return False
+        setattr(timeline, f'{commitment}_at', self.reader.wall_time(at))
+        setattr(timeline, f'{commitment}_slot', slot)
+        return True
+
+    def _finish_if_done(self, signature: str) -> None:
+        if self._is_finished(signature):
+            self._finish(signature)
+
+    def _on_status(self, signature: str, at: float, status: dict) -> None:
+        # a poll sees only the highest commitment, the lower ones not seen yet were reached by then
+        timeline = self.timelines[signature]
+        rank = COMMITMENT_RANKS[status['confirmationStatus']]
+        for commitment in STAGE_COMMITMENTS[:rank + 1]:
+            self._record_stage(signature, commitment, at, status['slot'])
+        if status.get('err') is not None:
+            self._failed.add(signature)
+        elif timeline.finished_at is None and rank >= COMMITMENT_RANKS[Confirmed]:
+            timeline.finished_at = self.reader.wall_time(at)
+            self.registry.observe(STAGE_CONFIRMED, timeline.provider, Confirmed, at - self._started[signature][0])
+        self._finish_if_done(signature)
+
+    def _on_ws_message(self, stream: int, at: float, message: dict) -> None:
+        if 'id' in message:
+            _, request = self._ws_requests.pop((stream, message['id']), (None, None))
+            if request is not None and request['method'].endswith('Subscribe') and 'result' in message:
+                self._ws_subscriptions[(stream, message['result'])] = request
+                if request['method'] == 'accountSubscribe':
+                    self._account_notifications = True
+            return
+        params = message.get('params', {})
+        subscription = self._ws_subscriptions.get((stream, params.get('subscription')))
+        if subscription is None:
+            return
+        if message['method'] == 'signatureNotification':
+            # a signature subscription is notified once, the cluster cancels it then
+            del self._ws_subscriptions[(stream, params.get('subscription'))]
+            signature, commitment = subscription['params'][0], subscription['params'][1]['commitment']
+            if signature not in self.timelines or (signature, commitment) in self._signature_notified:
+                return
+            self._signature_notified.add((signature, commitment))
+            self._record_stage(signature, commitment, at, params['result']['context']['slot'])
+            if params['result']['value'].get('err') is not None:
+                self._failed.add(signature)
+            if signature not in self._failed:
+                self.registry.observe(STAGE_SIGNATURE_NOTIFICATION, self.timelines[signature].provider, commitment,
+                    at - self._started[signature][0])
+            self._finish_if_done(signature)
+        elif message['method'] == 'accountNotification':
+            self._on_account(at, params['result'])
+
+    def _on_account(self, at: float, result: dict) -> None:
+        counter_data = layout.decode_counter_account(base64.b64decode(result['value']['data'][0]))
+        # the on-chain client timestamp has seconds precision only (the same key as the live client correlates by),
+        # the notification goes to the first transaction of that second that was not notified yet
+        signatures = self._not_notified.get(counter_data.client_timestamp)
+        if not signatures:
+            self.stats['unmatched notifications'] += 1
+            return
+        signature = signatures.pop(0)
+        if not signatures:
+            del self._not_notified[counter_data.client_timestamp]
+        timeline = self.timelines[signature]
+        timeline.ws_time = self.reader.wall_time(at)
+        timeline.blockchain_time = counter_data.timestamp_datetime()
+        timeline.blockchain_counter = counter_data.counter
+        self.stats['notified'] += 1
+        self.registry.observe(STAGE_WS_NOTIFICATION, timeline.provider, Processed, at - self._started[signature][0])
+        self._finish_if_done(signature)
+
+    def print_report(self) -> None:
+        print(f'Capture {self.reader.path}: {self.records}, streams {self.reader.streams}')
+        print(f'Counter transactions: {self.stats}')
+        if self._slowest:
+            print(f'Slowest {len(self._slowest)} confirmations:')
+            for seconds, _, timeline in sorted(self._slowest, key=lambda slowest: slowest[:2], reverse=True):
+                print(f'  {seconds}: {timeline}')
+        self.registry.print_summary()
+
+
+def main():
+    args = get_args()
+    CaptureAnalyzer(CaptureReader(args.capture), slowest=args.slowest, horizon=args.horizon).run().print_report()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+
+import aiohttp
+import httpx
+
+from argparse import ArgumentParser, Namespace
+
+from capture import (
+    CaptureReader, CaptureRecord, CaptureWriter, KIND_HTTP_REQUEST, KIND_HTTP_RESPONSE, KIND_WS_SEND, KIND_WS_RECEIVE
+)
+from metrics import MetricsRegistry
+
+# Replay of a capture written by 'hello_client.py --capture', e.g., against the mock_validator.py.
+#
+# The HTTP requests and websocket messages the client sent are sent again with the original spacing
+# divided by --speed, every captured websocket gets its own socket. The responses and notifications
+# are only counted (and captured with --capture, the replay capture can be analyzed as the original
+# one). Transactions are sent as they were signed, the target refuses the ones with a blockhash it
+# does not know (the mock validator derives the blockhashes from the slot numbers, a fresh one started
+# with the same --slot-time accepts them).
+
+STAGE_REPLAY_RESPONSE = 'replay_response'  # request -> response of the replayed request, labelled by the method
+
+
+def get_args() -> Namespace:
+    parser = ArgumentParser(description="Replay of a hello_client traffic capture")
+    parser.add_argument(
+        "capture",
+        type=str,
+        help="Path to the capture file."
+    )
+    parser.add_argument(
+        "-u",
+        "--url",
+        type=str,
+        help="RPC endpoint the HTTP requests are sent to, the captured endpoint when not defined.",
+        default=None
+    )
+    parser.add_argument(
+        "--ws",
+        type=str,
+        help="Websocket endpoint the websocket messages are sent to, the captured endpoint when not defined.",
+        default=None
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        help="Pace of the replay, 1 for the original pace, 2 for twice as fast.",
+        default=1.0
+    )
+    parser.add_argument(
+        "--drain",
+        type=float,
+        help="Seconds the websockets are listened to after the last message is sent.",
+        default=5.0
+    )
+    parser.add_argument(
+        "--capture-output",
+        type=str,
+        help="Path to a file the replayed traffic is captured to.",
+        default=None
+    )
+    parser.add_argument(
+        "--max-connections",
+        type=int,
+        help="Maximum number of HTTP connections to the RPC endpoint.",
+        default=100
+    )
+    return parser.parse_args()
+
+
+class CaptureReplay:
+    def __init__(
+        self,
+        reader: CaptureReader,
+        url: str = None,
+        ws_url: str = None,
+        speed: float = 1.0,
+        drain: float = 5.0,
+        capture: CaptureWriter = None,
+        max_connections: int = 100
+    ) -> None:
+        if speed <= 0:
+            raise ValueError(f'Replay speed has to be a positive number but it is {speed}')
+        self.reader: CaptureReader = reader
+        self.url: str = url
+        self.ws_url: str = ws_url
+        self.speed: float = speed
+        self.drain: float = drain
+        self.capture: CaptureWriter = capture
+        self.max_connections: int = max_connections
+        self.registry: MetricsRegistry = MetricsRegistry()
+        self.stats: dict = {'http requests': 0, 'http errors': 0, 'ws sent': 0, 'ws received': 0}
+        self.max_lag: float = 0.0  # how much the replay fell behind the schedule
+        self._http: httpx.AsyncClient = None
+        self._ws_session: aiohttp.ClientSession = None
+        self._sockets: dict = {}  # captured stream -> (websocket, capture stream)
+        self._readers: list = []
+        self._tasks: set = set()
+
+    async def run(self) -> CaptureReplay:
+        self._http = httpx.AsyncClient(limits=httpx.Limits(max_connections=self.max_connections), timeout=30.0)
+        self._ws_session = aiohttp.ClientSession()
+        try:
+            first_at, started_at = None, time.monotonic()
+            for record in self.reader:
+                if record.kind not in (KIND_HTTP_REQUEST, KIND_WS_SEND):
+                    continue
+                if first_at is None:
+                    first_at, started_at = record.at, time.monotonic()
+                delay = started_at + (record.at - first_at) / self.speed - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    self.max_lag = max(self.max_lag, -delay)
+                if record.kind == KIND_HTTP_REQUEST:
+                    self._spawn(self._post(record))
+                else:
+                    await self._ws_send(record)
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            if self._sockets:
+                await asyncio.sleep(self.drain)
+        finally:
+            for reader in self._readers:
+                reader.cancel()
+            await asyncio.gather(*self._tasks, *self._readers, return_exceptions=True)
+            for ws, _ in self._sockets.values():
+                await ws.close()
+            await self._ws_session.close()
+            await self._http.aclose()
+        return self
+
+    def _spawn(self, coroutine) -> None:
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _post(self, record: CaptureRecord) -> None:
+        url = self.url if self.url else self.reader.streams[record.stream]
+        stream = self.capture.stream(url) if self.capture else None
+        method = self._method(record.payload)
+        self.stats['http requests'] += 1
+        sent_at = time.monotonic()
+        if self.capture:
+            self.capture.write(KIND_HTTP_REQUEST, stream, record.correlation_id, record.payload, sent_at)
+        try:
+            response = await self._http.post(url, headers={'Content-Type': 'application/json'}, content=record.payload)
+        except httpx.HTTPError as e:
+            self.stats['http errors'] += 1
+            print(f'ERROR: replayed {method} to {url} failed: {e!r}')
+            return
+        self.registry.observe(STAGE_REPLAY_RESPONSE, url, method, time.monotonic() - sent_at)
+        if response.status_code != 200:
+            self.stats['http errors'] += 1
+        if self.capture:
+            self.capture.write(KIND_HTTP_RESPONSE, stream, record.correlation_id, response.content)
+
+    @staticmethod
+    def _method(payload: bytes) -> str:
+        request = json.loads(payload)
+        return 'batch' if isinstance(request, list) else request.get('method', '')
+
+    async def _ws_send(self, record: CaptureRecord) -> None:
+        if record.stream not in self._sockets:
+            url = self.ws_url if self.ws_url else self.reader.streams[record.stream]
+            try:
+                ws = await self._ws_session.ws_connect(url)
+            except aiohttp.ClientError as e:
+                print(f'ERROR: cannot connect websocket {url}, its messages are skipped: {e!r}')
+                return
+            self._sockets[record.stream] = (ws, self.capture.stream(url, new=True) if self.capture else None)
+            self._readers.append(asyncio.get_running_loop().create_task(self._ws_read(ws, self._sockets[record.stream][1])))
+        ws, stream = self._sockets[record.stream]
+        if ws.closed:
+            return
+        if self.capture:
+            self.capture.write(KIND_WS_SEND, stream, record.correlation_id, record.payload)
+        await ws.send_str(record.payload.decode())
+        self.stats['ws sent'] += 1
+
+    async def _ws_read(self, ws: aiohttp.ClientWebSocketResponse, stream: int) -> None:
+        async for msg in ws:
+            received_at = time.monotonic()
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                continue
+            self.stats['ws received'] += 1
+            if self.capture:
+                data = json.loads(msg.data)
+                self.capture.write(
+                    KIND_WS_RECEIVE, stream,
+                    data.get('id') or data.get('params', {}).get('subscription') or 0, msg.data.encode(), received_at
+                )
+
+    def print_report(self) -> None:
+        print(f'Replay of {self.reader.path} at {self.speed}x: {self.stats}, max lag behind the schedule {self.max_lag * 1000:.1f}ms')
+        self.registry.print_summary()
+
+
+def main():
+    args = get_args()
+    capture = CaptureWriter(args.capture_output) if args.capture_output else None
+    try:
+        replay = CaptureReplay(
+            CaptureReader(args.capture),
+            url=args.url,
+            ws_url=args.ws,
+            speed=args.speed,
+            drain=args.drain,
+            capture=capture,
+            max_connections=args.max_connections
+        )
+        asyncio.run(replay.run())
+        replay.print_report()
+    finally:
+        if capture:
+            capture.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import time
+
+from datetime import datetime, date
+from solana.rpc.async_api import AsyncClient
+from solana.rpc.commitment import Commitment, Confirmed
+
+# getSignatureStatuses accepts up to 256 signatures in one call
+MAX_SIGNATURES_PER_REQUEST = 256
+
+COMMITMENT_RANKS = {'processed': 0, 'confirmed': 1, 'finalized': 2}
+
+
+class ConfirmationResult:
+    def __init__(self, txn_id: str, confirmed_at: date = None, slot: int = None,
+            confirmation_status: str = None, err = None, block_time: date = None, polls: int = 0, sends: int = 1):
+        self.txn_id: str = txn_id
+        self.confirmed_at: date = confirmed_at  # None when the transaction was not confirmed in time
+        self.slot: int = slot
+        self.confirmation_status: str = confirmation_status
+        self.err = err
+        self.block_time: date = block_time
+        self.polls: int = polls  # number of status polls the transaction was part of
+        self.sends: int = sends  # number of times the transaction was sent, see Rebroadcaster
+
+    def is_landed(self) -> bool:
+        # reached the commitment, executed successfully or not
+        return self.confirmed_at is not None
+
+    def is_confirmed(self) -> bool:
+        # a transaction that failed on-chain (non-null err) landed but it is no success
+        return self.confirmed_at is not None and self.err is None
+
+    def is_failed(self) -> bool:
+        return self.confirmed_at is not None and self.err is not None
+
+    def __str__(self):
+        return (f'ConfirmationResult(txn_id={self.txn_id}, confirmed_at={self.confirmed_at}, slot={self.slot}, '
+            f'status={self.confirmation_status}, err={self.err}, block_time={self.block_time}, polls={self.polls}, '
+            f'sends={self.sends})')
+
+
+class _PendingConfirmation:
+    __slots__ = ('txn_id', 'future', 'deadline', 'polls')
+
+    def __init__(self, txn_id: str, future: asyncio.Future, deadline: float):
+        self.txn_id = txn_id
+        self.future = future
+        self.deadline = deadline
+        self.polls = 0
+
+
+class ConfirmationTracker:
+    # Single component confirming all the outstanding transactions.
+    #
+    # Signatures of all sent transactions are collected and polled together with getSignatureStatuses,
+    # chunked by MAX_SIGNATURES_PER_REQUEST. The poll interval adapts: it shrinks while transactions
+    # are getting confirmed and grows while nothing changes. When a transaction reaches the requested
+    # commitment its future is resolved with ConfirmationResult, the blockTime is fetched only for the
+    # transactions confirmed without an error (once per slot). Transactions not confirmed within the timeout are resolved
+    # with a result where confirmed_at is None, a transaction landed with an error is resolved with its err.
+    def __init__(
+        self,
+        client: AsyncClient,
+        commitment: Commitment = Confirmed,
+        timeout: float = 30.0,
+        min_interval: float = 0.2,
+        max_interval: float = 2.0,
+        chunk_size: int = MAX_SIGNATURES_PER_REQUEST
+    ) -> None:
+        self.client: AsyncClient = client
+        self.commitment: Commitment = commitment
+        self.commitment_rank: int = COMMITMENT_RANKS[str(commitment)]
+        self.timeout: float = timeout
+        self.min_interval: float = min_interval
+        self.max_interval: float = max(max_interval, min_interval)
+        self.chunk_size: int = min(chunk_size, MAX_SIGNATURES_PER_REQUEST)
+        self.interval: float = min_interval
+        self._pending: dict = {}  # txn_id -> _PendingConfirmation
+        self._deadlines: list = []  # heap of (deadline, sequence, _PendingConfirmation), resolved ones included
+        self._sequence = itertools.count()
+        self._block_times: dict = {}  # slot -> block time
+        self._has_pending: asyncio.Event = asyncio.Event()
+        self._task: asyncio.Task = None
+
+    def track(self, txn_id: str, timeout: float = None) -> asyncio.Future:
+        if txn_id in self._pending:
+            return self._pending[txn_id].future
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        deadline = time.monotonic() + (timeout if timeout is not None else self.timeout)
+        pending = self._pending[txn_id] = _PendingConfirmation(txn_id, future, deadline)
+        heapq.heappush(self._deadlines, (deadline, next(self._sequence), pending))
+        self._has_pending.set()
+        # a new transaction is expected to be confirmed soon, polling gets fast again
+        self.interval = self.min_interval
+        return future
+
+    def untrack(self, txn_id: str) -> None:
+        # not waited for anymore, e.g., another signature of the same transaction landed
+        pending = self._pending.pop(txn_id, None)
+        if pending is not None:
+            pending.future.cancel()
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def _run(self) -> None:
+        while True:
+            if not self._pending:
+                self._has_pending.clear()
+                await self._has_pending.wait()
+            await asyncio.sleep(self.interval)
+            resolved = await self._poll()
+            self._expire()
+            if resolved:
+                self.interval = max(self.min_interval, self.interval / 2)
+            else:
+                self.interval = min(self.max_interval, self.interval * 1.5)
+
+    async def _poll(self) -> int:
+        txn_ids = list(self._pending.keys())
+        chunks = [txn_ids[i:i + self.chunk_size] for i in range(0, len(txn_ids), self.chunk_size)]
+        results = await asyncio.gather(*[self._poll_chunk(chunk) for chunk in chunks], return_exceptions=True)
+        confirmed: list = []
+        for result in results:
+            if isinstance(result, Exception):
+                print(f'ERROR: cannot get signature statuses: {result}')
+            else:
+                confirmed += result
+        if confirmed:
+            await self._resolve(confirmed)
+        return len(confirmed)
+
+    async def _poll_chunk(self, txn_ids: list) -> list:
+        response = await self.client.get_signature_statuses(txn_ids)
+        received_at = datetime.utcnow()
+        if 'result' not in response:
+            print(f'ERROR: cannot get signature statuses: {response}')
+            return []
+        confirmed = []
+        for txn_id, status in zip(txn_ids, response['result']['value']):
+            pending = self._pending.get(txn_id)
+            if pending is None:
+                continue
+            pending.polls += 1
+            if status is None or status.get('confirmationStatus') is None:
+                continue
+            if COMMITMENT_RANKS[status['confirmationStatus']] >= self.commitment_rank:
+                confirmed.append((pending, status, received_at))
+        return confirmed
+
+    async def _resolve(self, confirmed: list) -> None:
+        # a transaction failed on-chain has no latency to report, its block time is not needed
+        unknown_slots = {
+            status['slot'] for _, status, _ in confirmed
+            if status.get('err') is None and status['slot'] not in self._block_times
+        }
+        if unknown_slots:
+            slots = list(unknown_slots)
+            responses = await asyncio.gather(
+                *[self.client.get_block_time(slot) for slot in slots], return_exceptions=True
+            )
+            for slot, response in zip(slots, responses):
+                if isinstance(response, dict) and response.get('result') is not None:
+                    # naive UTC as all the client times are (datetime.utcnow), not the local time
+                    self._block_times[slot] = datetime.utcfromtimestamp(response['result'])
+        for pending, status, received_at in confirmed:
+            self._pending.pop(pending.txn_id, None)
+            if not pending.future.done():
+                pending.future.set_result(ConfirmationResult(
+                    txn_id=pending.txn_id,
+                    confirmed_at=received_at,
+                    slot=status['slot'],
+                    confirmation_status=status['confirmationStatus'],
+                    err=status.get('err'),
+                    block_time=self._block_times.get(status['slot']) if status.get('err') is None else None,
+                    polls=pending.polls
+                ))
+        if len(self._block_times) > 4 * MAX_SIGNATURES_PER_REQUEST:
+            # slots only grow, the oldest ones are not needed anymore
+            for slot in sorted(self._block_times)[:len(self._block_times) // 2]:
+                del self._block_times[slot]
+
+    def _expire(self) -> None:
+        # only the entries past their deadline are visited, the resolved ones are dropped on the way
+        now = time.monotonic()
+        while self._deadlines and self._deadlines[0][0] <= now:
+            _, _, pending = heapq.heappop(self._deadlines)
+            if self._pending.get(pending.txn_id) is not pending:
+                continue
+            del self._pending[pending.txn_id]
+            if not pending.future.done():
+                pending.future.set_result(ConfirmationResult(txn_id=pending.txn_id, polls=pending.polls))
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for pending in self._pending.values():
+            pending.future.cancel()
+        self._pending.clear()
+        self._deadlines.clear()
+
+    async def __aenter__(self) -> ConfirmationTracker:
+        return self
+
+    async def __aexit__(self, _exc_type, _exc, _tb) -> None:
+        await self.close()
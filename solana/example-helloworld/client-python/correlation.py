@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import itertools
+import math
+import time
+
+from datetime import date
+from typing import Callable
+
+# the provider index takes the lowest bits of the correlation key
+PROVIDER_BITS = 16
+
+
+class ProviderInterner:
+    # provider name -> small int, the same name always gets the same index
+    def __init__(self) -> None:
+        self._indexes: dict = {}
+        self._names: list = []
+
+    def index(self, provider: str) -> int:
+        index = self._indexes.get(provider)
+        if index is None:
+            index = len(self._names)
+            if index >= 1 << PROVIDER_BITS:
+                raise ValueError(f'Too many providers to be interned, cannot add {provider}')
+            self._indexes[provider] = index
+            self._names.append(provider)
+        return index
+
+    def name(self, index: int) -> str:
+        return self._names[index]
+
+
+PROVIDERS = ProviderInterner()
+
+
+_SEND_IDS = itertools.count(1)
+
+
+def next_send_id() -> int:
+    # every send of the process gets its own id, the records of the sender side are keyed by it
+    return next(_SEND_IDS)
+
+
+def correlation_key(send_id: int, provider: str) -> int:
+    return (send_id << PROVIDER_BITS) | PROVIDERS.index(provider)
+
+
+def split_correlation_key(key: int) -> tuple[int, str]:
+    return key >> PROVIDER_BITS, PROVIDERS.name(key & ((1 << PROVIDER_BITS) - 1))
+
+
+def join_key(client_time: date, provider: str, shard: int = None) -> tuple[int, int]:
+    # The client_time is saved on-chain with seconds precision only, a notification of the counter account
+    # is joined to a send by the second, the provider and the data account shard.
+    return (int(client_time.timestamp()) << PROVIDER_BITS) | PROVIDERS.index(provider), shard
+
+
+class TimingWheel:
+    # Hashed timing wheel with a fixed timeout. Every key sits in the bucket of the tick it expires at,
+    # scheduling, rescheduling and cancelling a key is O(1) and advancing the wheel touches only
+    # the buckets of the ticks that have passed. With 'timeout / tick' + 1 buckets a key never needs
+    # more than one revolution of the wheel. The wheel may lag behind the clock (an advance comes late),
+    # a bucket then holds keys of two revolutions, only the keys whose expiry tick has passed are expired.
+    def __init__(self, timeout: float, tick: float = 1.0) -> None:
+        self.timeout: float = timeout
+        self.tick: float = tick
+        self.buckets: list = [set() for _ in range(math.ceil(timeout / tick) + 1)]
+        self._expiry_of: dict = {}  # key -> absolute tick the key expires at
+        self._current_tick: int = self._tick_of(time.monotonic())
+
+    def _tick_of(self, monotonic_time: float) -> int:
+        return int(monotonic_time / self.tick)
+
+    def schedule(self, key: int) -> None:
+        self.cancel(key)
+        expiry = self._tick_of(time.monotonic() + self.timeout)
+        self.buckets[expiry % len(self.buckets)].add(key)
+        self._expiry_of[key] = expiry
+
+    def cancel(self, key: int) -> None:
+        expiry = self._expiry_of.pop(key, None)
+        if expiry is not None:
+            self.buckets[expiry % len(self.buckets)].discard(key)
+
+    def advance(self) -> list:
+        # returns keys expired since the last advance
+        now_tick = self._tick_of(time.monotonic())
+        expired = []
+        passed_ticks = min(now_tick - self._current_tick, len(self.buckets))
+        for tick in range(self._current_tick + 1, self._current_tick + 1 + passed_ticks):
+            bucket = self.buckets[tick % len(self.buckets)]
+            due = [key for key in bucket if self._expiry_of[key] <= now_tick]
+            for key in due:
+                bucket.discard(key)
+                del self._expiry_of[key]
+            expired += due
+        self._current_tick = now_tick
+        return expired
+
+    def __len__(self) -> int:
+        return len(self._expiry_of)
+
+
+class CorrelationStore:
+    # Correlation of the data gathered about a transaction from the different asyncio tasks
+    # (sender, confirmation, websocket). Records are kept under the integer correlation key,
+    # a record is completed as soon as 'is_complete' says so and it's handed to 'on_complete',
+    # a record not updated for 'timeout' seconds is handed to 'on_expire'. Nothing is ever scanned.
+    #
+    # The sender side knows the key of the send ('record.id()'), a notification of the counter account
+    # does not ('id()' is None), it knows the 'join_key()' only. It's merged into the oldest record
+    # of the join key not notified yet, or it waits (under a key of its own, expiring as any record)
+    # for such a record to come. Sends of the same join key cannot be told apart by the on-chain data,
+    # a join with more than one candidate is counted as ambiguous.
+    def __init__(
+        self,
+        is_complete: Callable,
+        on_complete: Callable,
+        on_expire: Callable,
+        timeout: float = 60.0,
+        tick: float = 1.0
+    ) -> None:
+        self.is_complete: Callable = is_complete
+        self.on_complete: Callable = on_complete
+        self.on_expire: Callable = on_expire
+        self.wheel: TimingWheel = TimingWheel(timeout, tick)
+        self.records: dict = {}  # correlation key -> record
+        self.completed: int = 0
+        self.expired: int = 0
+        self.joined: int = 0
+        self.ambiguous_joins: int = 0
+        self._join_key_of: dict = {}  # record key -> join key, once the record is joinable
+        self._not_notified: dict = {}  # join key -> keys of the records waiting for a notification, oldest first
+        self._waiting: dict = {}  # join key -> keys of the notifications waiting for a record, oldest first
+        self._waiting_keys = itertools.count(-1, -1)  # the waiting notifications take negative keys
+
+    def update(self, record) -> None:
+        key = record.id()
+        if key is None:
+            self._join(record)
+            return
+        saved_record = self.records.get(key)
+        if saved_record is not None:
+            record = saved_record.merge(record)
+        if key not in self._join_key_of:
+            record_join_key = record.join_key()
+            if record_join_key is not None:
+                self._join_key_of[key] = record_join_key
+                notification_key = self._oldest(self._waiting, record_join_key)
+                if notification_key is None:
+                    self._not_notified.setdefault(record_join_key, {})[key] = None
+                else:
+                    self.joined += 1
+                    record = record.merge(self._remove(notification_key))
+        self._settle(key, record)
+
+    def _join(self, notification) -> None:
+        notification_join_key = notification.join_key()
+        key = self._oldest(self._not_notified, notification_join_key)
+        if key is None:
+            key = next(self._waiting_keys)
+            self._join_key_of[key] = notification_join_key
+            self._waiting.setdefault(notification_join_key, {})[key] = None
+            self._settle(key, notification)
+            return
+        self.joined += 1
+        self._settle(key, self.records[key].merge(notification))
+
+    def _oldest(self, waiting: dict, waiting_join_key) -> int:
+        # takes the oldest key waiting under the join key, None when there is none
+        keys = waiting.get(waiting_join_key)
+        if not keys:
+            return None
+        if len(keys) > 1:
+            self.ambiguous_joins += 1
+        key = next(iter(keys))
+        del keys[key]
+        if not keys:
+            del waiting[waiting_join_key]
+        return key
+
+    def _settle(self, key: int, record) -> None:
+        if self.is_complete(record):
+            self._remove(key)
+            self.completed += 1
+            self.on_complete(record)
+        else:
+            self.records[key] = record
+            self.wheel.schedule(key)
+
+    def _remove(self, key: int):
+        self.wheel.cancel(key)
+        record_join_key = self._join_key_of.pop(key, None)
+        for waiting in (self._not_notified, self._waiting):
+            keys = waiting.get(record_join_key)
+            if keys is not None and key in keys:
+                del keys[key]
+                if not keys:
+                    del waiting[record_join_key]
+        return self.records.pop(key, None)
+
+    def expire(self) -> int:
+        expired_keys = self.wheel.advance()
+        for key in expired_keys:
+            record = self._remove(key)
+            if record is not None:
+                self.expired += 1
+                self.on_expire(record)
+        return len(expired_keys)
+
+    def drain(self) -> list:
+        # removes and returns all the records that are neither completed nor expired yet
+        records = list(self.records.values())
+        for key in list(self.records):
+            self._remove(key)
+        return records
+
+    def __str__(self) -> str:
+        return (f'CorrelationStore(completed={self.completed}, expired={self.expired}, pending={len(self.records)}, '
+            f'joined={self.joined}, ambiguous joins={self.ambiguous_joins})')
+
+    def __contains__(self, key: int) -> bool:
+        return key in self.records
+
+    def __getitem__(self, key: int):
+        return self.records[key]
+
+    def __len__(self) -> int:
+        return len(self.records)
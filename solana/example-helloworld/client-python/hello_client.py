@@ -4,8 +4,9 @@ import asyncio
 import base64
 import json
 import datetime
-from typing import Final
-import aiohttp
+import time
+from binascii import a2b_base64
+from typing import AsyncIterator, Final, NamedTuple
 import sys
 
 from numpy import record
@@ -15,16 +16,38 @@ import os
 from argparse import ArgumentParser, Namespace
 from os import environ
 from solana.rpc.async_api import AsyncClient
-from solana.rpc.types import TxOpts
+from solana.rpc.types import TxOpts, DataSliceOpts
 from solana.rpc.commitment import Commitment, Processed, Finalized, Confirmed
 from solana.keypair import Keypair
 from solana.publickey import PublicKey
 from solana.transaction import Transaction, TransactionInstruction, AccountMeta
 from solana.system_program import create_account_with_seed, transfer, CreateAccountWithSeedParams, TransferParams
 from solana.blockhash import Blockhash
-from datetime import datetime, timedelta, date
-
-DERIVED_ADDRESS_SEED = 'HELLOWORLD'
+from rpc_session import RpcSession
+from transactions import (
+    get_data_account_seed, get_data_account_pubkey, get_counter_txn, get_delete_data_account_txn, get_txn_nonce_key
+)
+from confirmation_tracker import ConfirmationTracker, ConfirmationResult
+from blockhash_cache import RecentBlockhashCache, is_blockhash_not_found
+from rebroadcaster import Rebroadcaster
+from presigner import PresignedTxn, PresignedTxnPipeline, get_presign_executor, presign_counter_txn
+from ws_subscriptions import SubscriptionManager, Subscription, to_wall_time
+from stage_timeline import StageTimelineTracker, StageTimeline
+from correlation import CorrelationStore, next_send_id
+from processing_data import TransactionProcessingData, DEFAULT_PROVIDER, delta_time
+from results_sink import SqliteResultsSink
+from capture import CaptureWriter
+from slot_clock import SlotClock
+from load_driver import LoadCoordinator, PipeResultsSink, worker_share
+from race import ProviderRace, parse_providers
+from session_context import SessionContext, BootstrapCache
+from shards import ShardSelector, SHARD_STRATEGIES, SHARD_ROUND_ROBIN
+from metrics import (
+    METRICS, MetricsServer, STAGE_RPC_ACCEPT, STAGE_CONFIRMED, STAGE_WS_NOTIFICATION, STAGE_BLOCK_TIME,
+    STAGE_ONCHAIN_CLIENT_SKEW, STAGE_SIGNATURE_NOTIFICATION, STAGE_SLOT_LANDED, STAGE_SLOT_WS_NOTIFICATION
+)
+from solana.rpc.core import RPCException
+from datetime import datetime, date
 
 def get_args() -> Namespace:
     parser= ArgumentParser(description="Solana contract testing program")
@@ -70,8 +93,277 @@ def get_args() -> Namespace:
         help="Sleep time between counter update processing in seconds.",
         default=10
     )
+    parser.add_argument(
+        "-l",
+        "--load",
+        action="store_true",
+        help="Load generator mode, counter transactions are sent paced by --tps while up to --concurrency of them wait for confirmation.",
+        default=False
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        help="Load mode: maximum number of in-flight (sent but not yet confirmed) counter transactions.",
+        default=10
+    )
+    parser.add_argument(
+        "--tps",
+        type=float,
+        help="Load mode: target number of counter transactions sent per second.",
+        default=5.0
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        help="Load mode: for how many seconds the transactions are sent (default 60 when --txn-count is not defined).",
+        default=None
+    )
+    parser.add_argument(
+        "--txn-count",
+        type=int,
+        help="Load mode: number of counter transactions to be sent.",
+        default=None
+    )
+    parser.add_argument(
+        "--presign",
+        action="store_true",
+        help="Load mode: counter transactions are built, signed and serialized ahead of time off the event loop.",
+        default=False
+    )
+    parser.add_argument(
+        "--presign-workers",
+        type=int,
+        help="Load mode: number of pool workers presigning the counter transactions.",
+        default=2
+    )
+    parser.add_argument(
+        "--presign-processes",
+        action="store_true",
+        help="Load mode: presigning workers are processes instead of threads.",
+        default=False
+    )
+    parser.add_argument(
+        "--presign-queue",
+        type=int,
+        help="Load mode: maximum number of presigned transactions waiting to be sent.",
+        default=64
+    )
+    parser.add_argument(
+        "--provider",
+        type=str,
+        action="append",
+        help="Race mode: named RPC/WS endpoints in format <name>=<rpc url>[,<ws url>], can be repeated. "
+            "Every counter transaction is signed once and sent to all the providers concurrently (implies --load).",
+        default=[]
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        help="Number of counter data accounts the counter transactions are spread over, created by the bootstrap.",
+        default=1
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Load mode: number of processes sending the load, each with its own event loop, its share of --tps, "
+            "--concurrency and --txn-count and its own data account shards. The results are merged by the main process.",
+        default=1
+    )
+    parser.add_argument(
+        "--shard-strategy",
+        type=str,
+        choices=SHARD_STRATEGIES,
+        help="How the data account shard of a counter transaction is picked.",
+        default=SHARD_ROUND_ROBIN
+    )
+    parser.add_argument(
+        "--ws-subscribe",
+        action="store_true",
+        help="Listen to the data account changes over the websocket and report latencies next to the counter work.",
+        default=False
+    )
+    parser.add_argument(
+        "--ws-sockets",
+        type=int,
+        help="Number of websockets the subscriptions are multiplexed over.",
+        default=1
+    )
+    parser.add_argument(
+        "--ws-queue-size",
+        type=int,
+        help="Maximum number of notifications queued per subscription, the oldest ones are dropped for a slow consumer.",
+        default=1000
+    )
+    parser.add_argument(
+        "--confirm-timeout",
+        type=float,
+        help="How many seconds to wait for a counter transaction to be confirmed.",
+        default=30.0
+    )
+    parser.add_argument(
+        "--confirm-min-interval",
+        type=float,
+        help="Minimal interval in seconds between two signature status polls of the confirmation tracker.",
+        default=0.2
+    )
+    parser.add_argument(
+        "--confirm-max-interval",
+        type=float,
+        help="Maximal interval in seconds between two signature status polls of the confirmation tracker.",
+        default=2.0
+    )
+    parser.add_argument(
+        "--slot-clock",
+        action="store_true",
+        help="Slots are listened to (slotSubscribe, getSlot polls as a fallback) and the send and the slots "
+            "the transactions landed and were notified in are converted to slot deltas and sub-second latencies.",
+        default=False
+    )
+    parser.add_argument(
+        "--slot-clock-size",
+        type=int,
+        help="Number of the latest slots the slot clock keeps the arrival time of.",
+        default=4096
+    )
+    parser.add_argument(
+        "--slot-clock-poll-interval",
+        type=float,
+        help="Seconds without a slot notification after which the slot clock polls the slot.",
+        default=1.0
+    )
+    parser.add_argument(
+        "--rebroadcast-interval",
+        type=float,
+        help="Seconds between the sends of an unconfirmed counter transaction, the transactions are sent "
+            "with skipped preflight and signed again with a new blockhash when it expires. 0 disables the rebroadcast.",
+        default=0
+    )
+    parser.add_argument(
+        "--rebroadcast-max-resigns",
+        type=int,
+        help="Maximal number of times a rebroadcast transaction is signed again with a new blockhash.",
+        default=3
+    )
+    parser.add_argument(
+        "--rebroadcast-timeout",
+        type=float,
+        help="Seconds a rebroadcast transaction is sent and tracked for before it is given up.",
+        default=90.0
+    )
+    parser.add_argument(
+        "--stage-timeout",
+        type=float,
+        help="For how long (in seconds) the processed/confirmed/finalized stages of a transaction are tracked, "
+            "disabled by default (0), e.g., 60 to enable it.",
+        default=0
+    )
+    parser.add_argument(
+        "--blockhash-refresh-interval",
+        type=float,
+        help="How often (in seconds) the cached recent blockhash used for transactions is refreshed.",
+        default=2.0
+    )
+    parser.add_argument(
+        "--bootstrap-cache",
+        type=str,
+        help="Path to a file caching the rent exemption fee and the known existing program and data account "
+            "between runs, empty string to always ask the cluster.",
+        default=".hello_client_cache.json"
+    )
+    parser.add_argument(
+        "--db",
+        type=str,
+        help="Path to SQLite database where the transaction processing data is saved, empty string to not save them.",
+        default="results.db"
+    )
+    parser.add_argument(
+        "--capture",
+        type=str,
+        help="Path to a file all RPC and websocket traffic is captured to (for capture_analyzer.py and capture_replay.py), "
+            "a load worker process appends its index to the path.",
+        default=None
+    )
+    parser.add_argument(
+        "--db-batch-size",
+        type=int,
+        help="Number of records written to the database in one transaction.",
+        default=500
+    )
+    parser.add_argument(
+        "--db-flush-interval-ms",
+        type=int,
+        help="Maximum time in milliseconds records wait to be written to the database.",
+        default=500
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="Port of the local HTTP endpoint serving latency metrics in Prometheus text format at /metrics, "
+            "disabled by default (0), e.g., 9464 to enable it.",
+        default=0
+    )
+    parser.add_argument(
+        "--metrics-summary-interval",
+        type=float,
+        help="How often (in seconds) the p50/p90/p99/max latency summary is printed, 0 to print it only at the end.",
+        default=10.0
+    )
+    parser.add_argument(
+        "--rpc-max-connections",
+        type=int,
+        help="Maximum number of connections in the RPC session pool (per endpoint).",
+        default=10
+    )
+    parser.add_argument(
+        "--rpc-max-keepalive",
+        type=int,
+        help="Maximum number of idle keep-alive connections held in the RPC session pool (per endpoint).",
+        default=10
+    )
+    parser.add_argument(
+        "--rpc-endpoint-limit",
+        type=str,
+        action="append",
+        help="Connection limit for a particular endpoint in format <url>=<max connections>, can be repeated.",
+        default=[]
+    )
+    parser.add_argument(
+        "--rpc-timeout",
+        type=float,
+        help="RPC request timeout in seconds.",
+        default=10.0
+    )
+    parser.add_argument(
+        "--rpc-connect-timeout",
+        type=float,
+        help="RPC connection establishment timeout in seconds.",
+        default=5.0
+    )
+    parser.add_argument(
+        "--rpc-batch-size",
+        type=int,
+        help="Maximum number of read calls sent in one JSON-RPC batch request, 0 to send every call on its own. "
+            "An endpoint refusing batches gets every call on its own after the first refused batch.",
+        default=20
+    )
+    parser.add_argument(
+        "--rpc-batch-delay-ms",
+        type=float,
+        help="For how long (in milliseconds) read calls are collected before the JSON-RPC batch is sent.",
+        default=1.0
+    )
     return parser.parse_args()
 
+def parse_endpoint_limits(endpoint_limits: list) -> dict:
+    limits = {}
+    for endpoint_limit in endpoint_limits:
+        endpoint, _, limit = endpoint_limit.rpartition('=')
+        if not endpoint or not limit.isdigit():
+            raise ValueError(f'Expected endpoint limit in format <url>=<max connections> but got {endpoint_limit}')
+        limits[endpoint] = int(limit)
+    return limits
+
+# hand built request, it can be sent with BatchRpcTransport.request to share a batch with the client reads
 def get_json_http_account_info(account_address: str, commitment: str = str(Processed)) -> dict:
   return {
     "jsonrpc": "2.0",
@@ -102,6 +394,7 @@ class ProgramAccount:
         if result['value']['executable']:
             raise ValueError(f'Expected the account is an data account but it is executable, {json_data}')
         self.id: int = json_data['id'] if 'id' in json_data else json_data['subscription']
+        self.pubkey: str = None
         self.latest_slot: int = result['context']['slot']
         # print(f"we have some base64 data here: {result['value']['data'][0]}")
         self.data: bytes = base64.b64decode(result['value']['data'][0])  # expected to be base64
@@ -111,77 +404,40 @@ class ProgramAccount:
 class CounterAccount(ProgramAccount):
     def __init__(self, json_data: dict) -> None:
         super().__init__(json_data)
-        if len(self.data) != layout.COUNTER_ACCOUNT.sizeof():
+        if len(self.data) != layout.COUNTER_ACCOUNT_SIZE:
             raise Exception('Cannot process data from program as it is not compatible with counter account')
-        counter_layout = layout.COUNTER_ACCOUNT.parse(self.data)
-        self.counter = counter_layout.counter
-        self.timestamp = counter_layout.timestamp
-        self.client_timestamp = counter_layout.client_timestamp
-
-
-class TransactionProcessingData:
-    def __init__(self, client_time, provider,
-            started_at = None,
-            finished_at = None,
-            txn_id = None,
-            ws_time = None,
-            txnblock_time = None,
-            blockchain_time = None,
-            blockchain_counter = None):
-        self.processing_data_updated: date = datetime.utcnow()
-        # identity definition
-        self.client_time: date = client_time
-        self.provider: str = provider
-        # transfer data
-        self.started_at: date = started_at
-        self.finished_at: date = finished_at
-        self.txn_id: str = txn_id
-        self.blockchain_time = blockchain_time
-        self.blockchain_counter = blockchain_counter
-        self.ws_time = ws_time
-        self.txnblock_time = txnblock_time
-
-    # Identity of the processing data that is used as key in shared dictionary
-    # that's used to gather all data about transaction all around the different asyncio tasks
-    # and it's used for purpose to know if we do merge two same data records.
-    #
-    # The client_time is time which is saved at blockchain where the precision is limited to 64bits
-    # and we do store only seconds - while python works with milliseconds.
-    # The client_time has to be cut to seconds for purpose of the identity resolution.
-    def id(self) -> str:
-        return str(int(self.client_time.timestamp())) + self.provider
-
-    def merge(self, new_data: TransactionProcessingData) -> TransactionProcessingData:
-        if new_data != self:
-            print(f'Cannot merge {new_data} with {self} as they are not identical to provider and client_time')
-        self.processing_data_updated = datetime.utcnow()
-        if new_data.started_at:
-            self.started_at = new_data.started_at
-        if new_data.finished_at:
-            self.finished_at = new_data.finished_at
-        if new_data.txn_id:
-            self.txn_id = new_data.txn_id
-        if new_data.blockchain_time:
-            self.blockchain_time = new_data.blockchain_time
-        if new_data.blockchain_counter:
-            self.blockchain_counter = new_data.blockchain_counter
-        if new_data.ws_time:
-            self.ws_time = new_data.ws_time
-        if new_data.txnblock_time:
-            self.txnblock_time = new_data.txnblock_time
-        return self
-
-    # we define the equality based on the client_time which serves as a client_id
-    # plus provider which is different to different subscriptions
-    def __eq__(self, other: TransactionProcessingData):
-        return self.id() == other.id()
-
-    def __str__ (self):
-        return (f'TransactionProcessingData(processing_data_update={self.processing_data_updated},'
-            f' client_time={self.client_time}, provider={self.provider}, '
-            f'started_at={self.started_at}, finished_at={self.finished_at}, txn_id={self.txn_id}, '
-            f'blockchain_time={self.blockchain_time}, blockchain_counter={self.blockchain_counter}'
-        )
+        counter_data = layout.decode_counter_account(self.data)
+        self.counter: int = counter_data.counter
+        # unix timestamps, converted to datetime on access
+        self.raw_timestamp: int = counter_data.timestamp
+        self.raw_client_timestamp: int = counter_data.client_timestamp
+
+    @property
+    def timestamp(self) -> date:
+        return datetime.fromtimestamp(self.raw_timestamp)
+
+    @property
+    def client_timestamp(self) -> date:
+        return datetime.fromtimestamp(self.raw_client_timestamp)
+
+
+class CounterNotification(NamedTuple):
+    # counter account notification of the low overhead websocket path, received_at is the time.monotonic()
+    received_at: float
+    slot: int
+    counter: int
+    timestamp: int
+    client_timestamp: int
+
+
+def decode_counter_notification(received_at: float, params: dict) -> CounterNotification:
+    # only the slot and the data are read, the data is unpacked right from the base64 decoded bytes,
+    # no CounterAccount, no timestamp conversions, the consumer converts what it needs
+    result = params['result']
+    data = a2b_base64(result['value']['data'][0])
+    if len(data) != layout.COUNTER_ACCOUNT_SIZE:
+        raise ValueError(f'Expected {layout.COUNTER_ACCOUNT_SIZE} bytes of counter account data but got {len(data)}')
+    return CounterNotification(received_at, result['context']['slot'], *layout.COUNTER_ACCOUNT_FORMAT.unpack(data))
 
 
 def load_file(filename: str) -> bytes:
@@ -199,194 +455,471 @@ def account_exists(json_account_info:dict) -> bool:
         json_account_info['result']['value'] is not None
     )
 
-def get_data_account_pubkey(public_key: PublicKey, program_key: PublicKey) -> PublicKey:
-    # getting data pubkey
-    return PublicKey.create_with_seed(
-        from_public_key=public_key,
-        seed = DERIVED_ADDRESS_SEED,
-        program_id=program_key
-    )
-
-def get_counter_txn(
-    public_key: PublicKey,
-    program_key: PublicKey,
-    program_data_key: PublicKey,
-    client_time: date = datetime.utcnow(),
-    recent_blockhash:Blockhash = None
-) -> Transaction:
-    counter_instruction = TransactionInstruction(
-        keys=[
-            AccountMeta(pubkey=program_data_key, is_signer=False, is_writable=True),
-            AccountMeta(pubkey=program_key, is_signer=True, is_writable=False)
-        ],
-        program_id=program_key,
-        data=layout.COUNTER_INSTRUCTION.build({"client_timestamp": client_time})
-    )
-    return Transaction(
-        recent_blockhash=recent_blockhash,
-        nonce_info=None,
-        fee_payer=public_key,
-    ).add(counter_instruction)
-
-def get_delete_data_account_txn(public_key: PublicKey, program_key: PublicKey, recent_blockhash:Blockhash = None) -> Transaction:
-    program_data_key = get_data_account_pubkey(public_key, program_key)
-    delete_account_instruction = TransactionInstruction(
-        keys=[
-            AccountMeta(pubkey=program_data_key, is_signer=False, is_writable=True),
-            AccountMeta(pubkey=program_key, is_signer=True, is_writable=False),
-            AccountMeta(pubkey=public_key, is_signer=True, is_writable=True),
-        ],
-        program_id=program_key,
-        data=layout.DELETE_ACCOUNT_INSTRUCTION.build({})
-    )
-    return Transaction(
-        recent_blockhash=recent_blockhash,
-        nonce_info=None,
-        fee_payer=public_key,
-    ).add(delete_account_instruction)
+def observe_confirmation(provider: str, commitment: Commitment, start_at: date, finished_at: date, block_time: date,
+        shard: int = None):
+    # datetime.max stands for not confirmed in time, such a transaction has no latency to record
+    if finished_at and finished_at != datetime.max:
+        METRICS.observe(STAGE_CONFIRMED, provider, commitment, delta_time(start_at, finished_at), shard)
+    if block_time and block_time != datetime.max:
+        METRICS.observe(STAGE_BLOCK_TIME, provider, commitment, delta_time(start_at, block_time))
+
+class TokenBucket:
+    # Pacer for sending transactions. The bucket is refilled with 'rate' tokens per second
+    # up to 'capacity', every send takes one token. Bursts are bounded by the capacity
+    # while the long-run average stays at the rate.
+    def __init__(self, rate: float, capacity: float = 1) -> None:
+        if rate <= 0:
+            raise ValueError(f'Token bucket rate has to be a positive number but it is {rate}')
+        self.rate: float = rate
+        self.capacity: float = max(capacity, 1)
+        self.tokens: float = self.capacity
+        self.updated_at: float = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
 
-def delta_time(time_start_at: datetime, time_finished_at = None) -> float:
-    if not time_finished_at:
-        time_finished_at = datetime.utcnow()
-    # print(f'DEBUG: {type(time_start_at)}:{time_start_at}, {type(time_finished_at)}:{time_finished_at}')
-    time_delta: timedelta = time_finished_at - time_start_at
-    # print(f'DEBUG:::: start: {time_start_at}, finished: {time_finished_at}, {time_delta}, s: {time_delta.seconds}, ms: {time_delta.microseconds}, ms->s: {time_delta.microseconds / 1000000}, s + ms: {time_delta.seconds + (time_delta.microseconds / 1000000)}')
-    return time_delta.seconds + (time_delta.microseconds / 1000000)
+    async def acquire(self) -> None:
+        self._refill()
+        while self.tokens < 1:
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+            self._refill()
+        self.tokens -= 1
 
 async def get_rent_exemption_fee(client: AsyncClient) -> int:
     rent_exemption_fee_json = await client.get_minimum_balance_for_rent_exemption(layout.COUNTER_ACCOUNT.sizeof())
     return rent_exemption_fee_json['result']
 
-async def prepare(rpc_url: str, keypair:Keypair, program_keypair:Keypair) -> CounterAccount:
-    async with AsyncClient(rpc_url) as client:
-        account_info_json = await client.get_account_info(pubkey=program_keypair.public_key)
-        if not account_info_json or not account_info_json['result'] or not account_info_json['result']['value'] or not account_info_json['result']['value']['executable']:
-            raise ValueError(f'Expected the account {program_keypair.public_key} is an executable program but it is not, {account_info_json}')
-
-        recent_blockhash_json = await client.get_recent_blockhash()
-        recent_blockhash = Blockhash(recent_blockhash_json['result']['value']['blockhash'])
-        lamport_per_signature:int = recent_blockhash_json['result']['value']['feeCalculator']['lamportsPerSignature']
-        
-        balance_json = await client.get_balance(pubkey=keypair.public_key)
-        balance:int = balance_json['result']['value']
-
-        # account balance is under rent for data account and price for sending a transaction
-        rent_exemption_fee = await get_rent_exemption_fee(client)
-        if balance < rent_exemption_fee + lamport_per_signature:
-            requested_lamports:int = rent_exemption_fee+lamport_per_signature
-            response = await client.request_airdrop(pubkey=keypair.public_key, lamports=requested_lamports)
-            print(f'Requested to get airdrop for {requested_lamports}, result: {response}')
-
-        program_data_address = get_data_account_pubkey(keypair.public_key, program_keypair.public_key)
-        data_account_json = await client.get_account_info(pubkey=program_data_address, commitment=Finalized)
-        # print(f"Data account with seed json: {data_account_json}")
-        if not account_exists(data_account_json):
-            print(f'Account {program_data_address} DOES NOT exists, creating a new one ({data_account_json})')
-            create_account_instruction = create_account_with_seed(CreateAccountWithSeedParams(
-                from_pubkey=keypair.public_key,
-                base_pubkey=keypair.public_key,
-                new_account_pubkey=program_data_address,
-                # seed={"length": len(DERIVED_ADDRESS_SEED), "chars": DERIVED_ADDRESS_SEED},
-                seed=DERIVED_ADDRESS_SEED,
-                lamports=rent_exemption_fee,
-                space=layout.COUNTER_ACCOUNT.sizeof(),
-                program_id=program_keypair.public_key
-            ))
-            data_account_creation_txn = Transaction(
-                recent_blockhash=recent_blockhash,
-                nonce_info=None,
-                fee_payer=keypair.public_key,
-            ).add(create_account_instruction)
-            # data_account_creation_txn.sign(keypair)
-            # await client.simulate_transaction(data_account_creation_txn)
-            response = await client.send_transaction(
-                data_account_creation_txn, keypair
-            )
-            print(f'Create Data account with seed txn response: {response}')
-            while not account_exists(data_account_json):
-                data_account_json = await client.get_account_info(pubkey=program_data_address, commitment=Finalized)
+async def create_data_account(
+    client: AsyncClient,
+    keypair: Keypair,
+    program_keypair: Keypair,
+    shard: int,
+    rent_exemption_fee: int,
+    recent_blockhash: Blockhash
+) -> dict:
+    create_account_instruction = create_account_with_seed(CreateAccountWithSeedParams(
+        from_pubkey=keypair.public_key,
+        base_pubkey=keypair.public_key,
+        new_account_pubkey=get_data_account_pubkey(keypair.public_key, program_keypair.public_key, shard),
+        # seed={"length": len(DERIVED_ADDRESS_SEED), "chars": DERIVED_ADDRESS_SEED},
+        seed=get_data_account_seed(shard),
+        lamports=rent_exemption_fee,
+        space=layout.COUNTER_ACCOUNT.sizeof(),
+        program_id=program_keypair.public_key
+    ))
+    data_account_creation_txn = Transaction(
+        recent_blockhash=recent_blockhash,
+        nonce_info=None,
+        fee_payer=keypair.public_key,
+    ).add(create_account_instruction)
+    # data_account_creation_txn.sign(keypair)
+    # await client.simulate_transaction(data_account_creation_txn)
+    return await client.send_transaction(
+        data_account_creation_txn, keypair, recent_blockhash=recent_blockhash
+    )
+
+async def verify_cached_bootstrap(client: AsyncClient, context: SessionContext) -> tuple[bool, int]:
+    # the program, the payer and the data accounts in one getMultipleAccounts, no account data is returned
+    program_id = str(context.program_keypair.public_key)
+    response = await client.get_multiple_accounts(
+        [context.program_keypair.public_key, context.keypair.public_key, *context.shard_pubkeys],
+        commitment=Finalized,
+        data_slice=DataSliceOpts(offset=0, length=0)
+    )
+    if 'result' not in response:
+        print(f'ERROR: cannot verify the bootstrap cache: {response}')
+        return False, None
+    program, payer, *data_accounts = response['result']['value']
+    verified = (
+        program is not None and program['executable'] and
+        all(data_account is not None and data_account['owner'] == program_id for data_account in data_accounts)
+    )
+    return verified, payer['lamports'] if payer is not None else 0
+
+async def top_up_balance(client: AsyncClient, keypair: Keypair, balance: int, required_lamports: int) -> None:
+    if balance < required_lamports:
+        response = await client.request_airdrop(pubkey=keypair.public_key, lamports=required_lamports)
+        print(f'Requested to get airdrop for {required_lamports}, result: {response}')
+
+async def prepare(
+    client: AsyncClient,
+    context: SessionContext,
+    blockhash_cache: RecentBlockhashCache,
+    endpoint: str
+) -> CounterAccount:
+    keypair: Keypair = context.keypair
+    program_keypair: Keypair = context.program_keypair
+    shard_pubkeys: list = context.shard_pubkeys
+    cache: BootstrapCache = context.cache
+    program_known = cache.account_exists(endpoint, program_keypair.public_key)
+    data_accounts_known = all(cache.account_exists(endpoint, pubkey) for pubkey in shard_pubkeys)
+    rent_exemption_fee = cache.rent_exemption_fee(endpoint, layout.COUNTER_ACCOUNT_SIZE)
+    if program_known and data_accounts_known and rent_exemption_fee is not None:
+        # the cluster may have been reset since, one request with no account data tells
+        verified, balance = await verify_cached_bootstrap(client, context)
+        if verified:
+            context.program_executable = True
+            print(f'Bootstrap of {endpoint} from cache {cache.path}: program {program_keypair.public_key} is executable, '
+                f'data accounts {", ".join(map(str, shard_pubkeys))} exist, rent exemption: {rent_exemption_fee}')
+            await top_up_balance(client, keypair, balance, rent_exemption_fee + blockhash_cache.current().lamports_per_signature)
+            return None
+        print(f'Bootstrap cache {cache.path} does not match the accounts at {endpoint}, it is dropped for the endpoint')
+        cache.forget(endpoint)
+        program_known, rent_exemption_fee = False, None
+
+    # the queries do not depend on each other, they are sent in one wave, the cached ones are skipped
+    async def cached(value):
+        return value
+    account_info_json, balance_json, rent_exemption_fee, *data_account_jsons = await asyncio.gather(
+        cached({'result': {'value': {'executable': True}}}) if program_known else client.get_account_info(pubkey=program_keypair.public_key),
+        client.get_balance(pubkey=keypair.public_key),
+        cached(rent_exemption_fee) if rent_exemption_fee is not None else get_rent_exemption_fee(client),
+        *[client.get_account_info(pubkey=pubkey, commitment=Finalized) for pubkey in shard_pubkeys]
+    )
+    if not account_info_json or not account_info_json['result'] or not account_info_json['result']['value'] or not account_info_json['result']['value']['executable']:
+        raise ValueError(f'Expected the account {program_keypair.public_key} is an executable program but it is not, {account_info_json}')
+    context.program_executable = True
+    cache.set_account_exists(endpoint, program_keypair.public_key)
+    cache.set_rent_exemption_fee(endpoint, layout.COUNTER_ACCOUNT_SIZE, rent_exemption_fee)
+
+    cached_blockhash = blockhash_cache.current()
+    recent_blockhash = cached_blockhash.blockhash
+    lamport_per_signature:int = cached_blockhash.lamports_per_signature
+    balance:int = balance_json['result']['value']
+
+    # print(f"Data account with seed json: {data_account_json}")
+    missing_shards = [shard for shard, data_account_json in enumerate(data_account_jsons) if not account_exists(data_account_json)]
+    # account balance is under rent for data accounts and price for sending the transactions
+    await top_up_balance(client, keypair, balance, (rent_exemption_fee + lamport_per_signature) * max(len(missing_shards), 1))
+    if missing_shards:
+        for shard in missing_shards:
+            print(f'Account {shard_pubkeys[shard]} DOES NOT exists, creating a new one ({data_account_jsons[shard]})')
+        # the shards are created concurrently, each by its own transaction
+        responses = await asyncio.gather(*[
+            create_data_account(client, keypair, program_keypair, context.shard_ids[shard], rent_exemption_fee, recent_blockhash)
+            for shard in missing_shards
+        ])
+        print(f'Create Data account with seed txn response: {responses}')
+        # finalization takes tens of slots, the accounts are asked for with a backoff
+        delay = 0.2
+        while missing_shards:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 2.0)
+            responses = await asyncio.gather(*[
+                client.get_account_info(pubkey=shard_pubkeys[shard], commitment=Finalized) for shard in missing_shards
+            ])
+            for shard, data_account_json in zip(missing_shards, responses):
+                data_account_jsons[shard] = data_account_json
+            missing_shards = [shard for shard in missing_shards if not account_exists(data_account_jsons[shard])]
+    for pubkey in shard_pubkeys:
+        cache.set_account_exists(endpoint, pubkey)
+    cache.save()
 
     print(f'account [{program_keypair.public_key}]: {account_info_json}')
     print(f'blockhash: {recent_blockhash}, lamport per sig: {lamport_per_signature}, rent exemption: {rent_exemption_fee}')
     print(f'balance [{keypair.public_key}]: {balance_json}')
-    print(f'data account with seed [{program_data_address}]: {data_account_json}')
-    counter_account = CounterAccount(data_account_json)
-    print(f'COUNTER PREPARE {counter_account.counter}/{counter_account.timestamp}')
-    return counter_account
+    for pubkey, data_account_json in zip(shard_pubkeys, data_account_jsons):
+        print(f'data account with seed [{pubkey}]: {data_account_json}')
+    counter_accounts = [CounterAccount(data_account_json) for data_account_json in data_account_jsons]
+    for shard, counter_account in enumerate(counter_accounts):
+        context.shard_counters.update(shard, counter_account.counter, counter_account.latest_slot)
+    if len(counter_accounts) > 1:
+        print(f'COUNTER PREPARE {context.shard_counters}')
+    else:
+        print(f'COUNTER PREPARE {counter_accounts[0].counter}/{counter_accounts[0].timestamp}')
+    return counter_accounts[0]
 
-async def print_data_account(client: AsyncClient, program_data_pubkey: PublicKey, commitment_level: Commitment):
-        data_account_json = await client.get_account_info(pubkey=program_data_pubkey, commitment=commitment_level)
-        counter_account = CounterAccount(data_account_json)
+async def print_data_account(client: AsyncClient, context: SessionContext, commitment_level: Commitment):
+    # all the shards are read at once, the reads share one JSON-RPC batch
+    data_account_jsons = await asyncio.gather(*[
+        client.get_account_info(pubkey=pubkey, commitment=commitment_level) for pubkey in context.shard_pubkeys
+    ])
+    counter_accounts = [CounterAccount(data_account_json) for data_account_json in data_account_jsons]
+    for shard, counter_account in enumerate(counter_accounts):
+        context.shard_counters.update(shard, counter_account.counter, counter_account.latest_slot)
+    if len(counter_accounts) > 1:
+        print(f'Counter data content: {context.shard_counters}, ' + ', '.join(
+            f'shard {shard}: {counter_account.timestamp}/{counter_account.client_timestamp}'
+            for shard, counter_account in enumerate(counter_accounts)
+        ))
+    else:
+        counter_account = counter_accounts[0]
         print(f'Counter data content: {counter_account.counter}/{counter_account.timestamp}/{counter_account.client_timestamp}')
 
-async def increase_counter_and_wait(
-    rpc_url: str,
+async def send_counter_txn(
+    client: AsyncClient,
     keypair:Keypair,
     program_keypair:Keypair,
-    commitment_level: Commitment = Confirmed
-) -> TransactionProcessingData:
-    async with AsyncClient(endpoint = rpc_url, commitment=Confirmed) as client:
-        provider: str = "onering"
-        start_at: date = datetime.utcnow()
-        program_data_pubkey = get_data_account_pubkey(keypair.public_key, program_keypair.public_key)
+    program_data_pubkey: PublicKey,
+    client_time: date,
+    blockhash_cache: RecentBlockhashCache,
+    nonce_key: PublicKey = None
+) -> str:
+    txn = get_counter_txn(
+        public_key = keypair.public_key,
+        program_key = program_keypair.public_key,
+        program_data_key=program_data_pubkey,
+        client_time = client_time,
+        recent_blockhash = await blockhash_cache.get_or_refresh(),
+        nonce_key = nonce_key
+    )
+    tx_opts = None
+    # tx_opts = TxOpts(skip_preflight=True, skip_confirmation=False)
+    try:
+        response = await client.send_transaction(
+            txn, keypair, program_keypair, opts=tx_opts, recent_blockhash=txn.recent_blockhash
+        )
+    except RPCException as e:
+        if not is_blockhash_not_found(e):
+            raise
+        print(f'Blockhash {txn.recent_blockhash} was not found by the cluster, resending with a new one')
+        blockhash_cache.invalidate(txn.recent_blockhash)
+        response = await client.send_transaction(
+            txn, keypair, program_keypair, opts=tx_opts, recent_blockhash=(await blockhash_cache.refresh()).blockhash
+        )
+    # print(f'Counter txn response on send: {response}')  # TODO: delete me
+    if 'result' not in response:
+        print(f'ERROR: cannot get information about sent transaction: {response}')
+        return None
+    return response['result']
+
+async def send_presigned_counter_txn(
+    client: AsyncClient,
+    presigned: PresignedTxn,
+    blockhash_cache: RecentBlockhashCache,
+    presigned_pipeline: PresignedTxnPipeline
+) -> str:
+    try:
+        response = await client.send_raw_transaction(presigned.wire)
+    except RPCException as e:
+        if not is_blockhash_not_found(e):
+            raise
+        print(f'Blockhash {presigned.recent_blockhash} of presigned transaction {presigned.txn_id} was not found by the cluster')
+        presigned_pipeline.refuse_blockhash(presigned.recent_blockhash)
+        blockhash_cache.invalidate(presigned.recent_blockhash)
+        return None
+    if 'result' not in response:
+        print(f'ERROR: cannot get information about sent transaction: {response}')
+        return None
+    return response['result']
+
+async def broadcast_counter_txn(
+    rebroadcaster: Rebroadcaster,
+    keypair:Keypair,
+    program_keypair:Keypair,
+    program_data_pubkey: PublicKey,
+    client_time: date,
+    nonce_key: PublicKey = None
+) -> str:
+    # the rebroadcaster signs the transaction again when its blockhash expires
+    def sign(recent_blockhash: Blockhash) -> Transaction:
         txn = get_counter_txn(
             public_key = keypair.public_key,
             program_key = program_keypair.public_key,
             program_data_key=program_data_pubkey,
-            client_time = start_at
+            client_time = client_time,
+            recent_blockhash = recent_blockhash,
+            nonce_key = nonce_key
         )
-        await print_data_account(client, program_data_pubkey, commitment_level)
-
-        tx_opts = None
-        # tx_opts = TxOpts(skip_preflight=True, skip_confirmation=False)
-        response = await client.send_transaction(txn, keypair, program_keypair, opts=tx_opts)
-        # print(f'Counter txn response on send: {response}')  # TODO: delete me
-        if 'result' not in response:
-            print(f'ERROR: cannot get information about sent transaction: {response}')
-            return None
-        txn_id = response['result']
-        number_of_attempts = 1
-        commitment_level = Confirmed
-        while True:
-            response_txn = await client.get_transaction(txn_id, commitment=commitment_level)
-            if 'result' in response_txn and response_txn['result']:
-                # print(f"DEBUG: {response_txn['result']}")  # TODO: delete me
-                finished_at = datetime.utcnow()
-                block_time = datetime.fromtimestamp(response_txn['result']['blockTime'])
-                break  # the transaction was found
-            if delta_time(start_at) > 30:  # TODO: parametrize me
-                print(f'Waiting for 30 (startime={start_at}, now={datetime.utcnow()}, delta={delta_time(start_at)}) seconds to get information about txn response["result"] to be written, BUT not yet!')
-                finished_at= datetime.max  # TODO: consider handling timeout more clever
-                block_time = datetime.max
-                break
-            number_of_attempts += 1
-        if finished_at != datetime.max:
-            print(
-                f'Transaction {response["result"]} takes {delta_time(start_at, finished_at)} seconds to be written to blockchain, '
-                f'in committment level {commitment_level} while taking {number_of_attempts} number of attempts'
-            )
+        txn.sign(keypair, program_keypair)
+        return txn
+    broadcast = await rebroadcaster.send(sign)
+    return broadcast.txn_id
+
+async def wait_for_counter_txn(
+    tracker: ConfirmationTracker,
+    txn_id: str,
+    start_at: date
+) -> tuple[date, date, int, int, str]:
+    # the tracker is the Rebroadcaster when the transactions are rebroadcast, the sends are counted then
+    # and the signature the result is of may be a replacement of 'txn_id' signed with a newer blockhash
+    confirmation: ConfirmationResult = await tracker.track(txn_id)
+    sends = confirmation.sends if isinstance(tracker, Rebroadcaster) else None
+    if confirmation.is_failed():
+        # landed but the program failed, no success and no latency to record
+        print(f'ERROR: transaction {confirmation.txn_id} landed in slot {confirmation.slot} but failed: {confirmation.err}')
+        return datetime.max, datetime.max, sends, confirmation.slot, confirmation.txn_id
+    if not confirmation.is_confirmed():
+        print(f'Waiting for {tracker.timeout} (startime={start_at}, now={datetime.utcnow()}, delta={delta_time(start_at)}) seconds to get information about txn {txn_id} to be written, BUT not yet!')
+        return datetime.max, datetime.max, sends, None, confirmation.txn_id  # TODO: consider handling timeout more clever
+    print(
+        f'Transaction {confirmation.txn_id} takes {delta_time(start_at, confirmation.confirmed_at)} seconds to be written to blockchain, '
+        f'in committment level {confirmation.confirmation_status} while taking {confirmation.polls} number of attempts'
+        + (f' and {sends} sends' if sends is not None else '')
+    )
+    block_time = confirmation.block_time if confirmation.block_time else datetime.max
+    return confirmation.confirmed_at, block_time, sends, confirmation.slot, confirmation.txn_id
 
-        await print_data_account(client, program_data_pubkey, commitment_level)
+async def increase_counter_and_wait(
+    client: AsyncClient,
+    tracker: ConfirmationTracker,
+    blockhash_cache: RecentBlockhashCache,
+    context: SessionContext,
+    commitment_level: Commitment = Confirmed,
+    stage_tracker: StageTimelineTracker = None,
+    shared_processing_data: CorrelationStore = None,
+    rebroadcaster: Rebroadcaster = None
+) -> TransactionProcessingData:
+    provider: str = DEFAULT_PROVIDER
+    send_id: int = next_send_id()
+    start_at: date = datetime.utcnow()
+    keypair, program_keypair, shard_selector = context.keypair, context.program_keypair, context.shard_selector
+    shard = shard_selector.select()
+    program_data_pubkey = shard_selector.pubkey(shard)
+    await print_data_account(client, context, commitment_level)
+
+    if rebroadcaster:
+        txn_id = await broadcast_counter_txn(rebroadcaster, keypair, program_keypair, program_data_pubkey, start_at)
+        tracker = rebroadcaster
+    else:
+        txn_id = await send_counter_txn(client, keypair, program_keypair, program_data_pubkey, start_at, blockhash_cache)
+    if not txn_id:
+        return None
+    # in flight until confirmed, released also when the waiting fails
+    shard_selector.acquire(shard)
+    try:
+        METRICS.observe(STAGE_RPC_ACCEPT, provider, client.commitment, delta_time(start_at))
+        if stage_tracker:
+            track_stages(stage_tracker, shared_processing_data, send_id, txn_id, start_at, start_at, provider)
+        finished_at, block_time, send_attempts, landed_slot, txn_id = await wait_for_counter_txn(tracker, txn_id, start_at)
+    finally:
+        shard_selector.release(shard)
+    observe_confirmation(provider, tracker.commitment, start_at, finished_at, block_time, shard_selector.label(shard))
 
-        return TransactionProcessingData(
-            client_time=start_at,  # we use the client time as pard of the data.id()
+    await print_data_account(client, context, commitment_level)
+
+    return TransactionProcessingData(
+        client_time=start_at,  # the client time joins the websocket notification
+        provider=provider,
+        send_id=send_id,
+        txn_id=txn_id,
+        started_at=start_at,
+        finished_at=finished_at,
+        txnblock_time=block_time,
+        stages_pending=True if stage_tracker else None,
+        shard=shard_selector.label(shard),
+        send_attempts=send_attempts,
+        landed_slot=landed_slot
+    )
+
+def track_stages(
+    stage_tracker: StageTimelineTracker,
+    shared_processing_data: CorrelationStore,
+    send_id: int,
+    txn_id: str,
+    client_time: date,
+    start_at: date,
+    provider: str = DEFAULT_PROVIDER
+) -> None:
+    # the stages are reported to the store when the transaction is finalized, the caller does not wait for it
+    def report(task: asyncio.Task) -> None:
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            print(f'ERROR: cannot track commitment stages of {txn_id}: {task.exception()}')
+            timeline = StageTimeline(txn_id)
+        else:
+            timeline = task.result()
+        # the stages of a transaction failed on-chain are recorded but they are no latency of a success
+        if timeline.err is None:
+            for commitment, arrived_at in timeline.arrived_at.items():
+                METRICS.observe(STAGE_SIGNATURE_NOTIFICATION, provider, commitment, delta_time(start_at, arrived_at))
+        update_in_shared_dict(shared_processing_data, TransactionProcessingData(
+            client_time=client_time,
             provider=provider,
-            txn_id=txn_id,
-            started_at=start_at,
-            finished_at=finished_at,
-            txnblock_time=block_time
-        )
+            send_id=send_id,
+            txn_id=timeline.landed_txn_id,
+            processed_at=timeline.arrived_at.get(str(Processed)),
+            processed_slot=timeline.slots.get(str(Processed)),
+            confirmed_at=timeline.arrived_at.get(str(Confirmed)),
+            confirmed_slot=timeline.slots.get(str(Confirmed)),
+            finalized_at=timeline.arrived_at.get(str(Finalized)),
+            finalized_slot=timeline.slots.get(str(Finalized)),
+            stages_pending=False
+        ))
+    stage_tracker.track(txn_id).add_done_callback(report)
 
-async def get_all_program_accounts(rpc_url: str, program_keypair:Keypair) -> None:
-    async with AsyncClient(endpoint = rpc_url, commitment=Confirmed) as client:
-        program_accounts = await client.get_program_accounts(program_keypair.public_key)
-        program_accounts_info = []
-        if 'result' in program_accounts:
-            for program_account in program_accounts['result']:
-                program_account_pubkey = program_account['pubkey']
-                program_account_info = await client.get_account_info(pubkey=program_account_pubkey)
-                program_accounts_info.append(program_account_info)
-        print(f'Program accounts:\n{program_accounts}\nInfos: {program_accounts_info}')
+# getMultipleAccounts accepts up to 100 accounts in one call
+MAX_ACCOUNTS_PER_REQUEST = 100
+
+def counter_account_from_value(account_value: dict, slot: int = None, pubkey: str = None) -> CounterAccount:
+    counter_account = CounterAccount({'id': None, 'result': {'context': {'slot': slot}, 'value': account_value}})
+    counter_account.pubkey = pubkey
+    return counter_account
+
+async def iter_program_counter_accounts(
+    client: AsyncClient,
+    program_pubkey: PublicKey,
+    refresh: bool = False,
+    filter_size: bool = True,
+    slice_data: bool = False,
+    chunk_size: int = MAX_ACCOUNTS_PER_REQUEST,
+    concurrency: int = 4,
+    commitment: Commitment = Confirmed
+) -> AsyncIterator[CounterAccount]:
+    # Snapshot of all counter accounts owned by the program, streamed as decoded CounterAccount objects.
+    # The data returned by getProgramAccounts is used as is, with 'refresh' the accounts are fetched again
+    # with chunked getMultipleAccounts calls, at most 'concurrency' of them at the same time.
+    program_accounts = await client.get_program_accounts(
+        program_pubkey,
+        commitment=commitment,
+        encoding='base64',
+        data_slice=DataSliceOpts(offset=0, length=layout.COUNTER_ACCOUNT_SIZE) if slice_data else None,
+        data_size=layout.COUNTER_ACCOUNT_SIZE if filter_size else None
+    )
+    if 'result' not in program_accounts:
+        print(f'ERROR: cannot get program accounts of {program_pubkey}: {program_accounts}')
+        return
+    if not refresh:
+        for program_account in program_accounts['result']:
+            try:
+                yield counter_account_from_value(program_account['account'], pubkey=program_account['pubkey'])
+            except Exception as e:
+                print(f'Program account {program_account["pubkey"]} is not a counter account: {e}')
+        return
+
+    pubkeys = [program_account['pubkey'] for program_account in program_accounts['result']]
+    chunk_size = min(chunk_size, MAX_ACCOUNTS_PER_REQUEST)
+    fetch_permits = asyncio.Semaphore(concurrency)
+
+    async def fetch_chunk(chunk: list) -> tuple[list, dict]:
+        async with fetch_permits:
+            return chunk, await client.get_multiple_accounts(
+                chunk,
+                commitment=commitment,
+                encoding='base64',
+                data_slice=DataSliceOpts(offset=0, length=layout.COUNTER_ACCOUNT_SIZE) if slice_data else None
+            )
+
+    fetches = [asyncio.create_task(fetch_chunk(pubkeys[i:i + chunk_size])) for i in range(0, len(pubkeys), chunk_size)]
+    try:
+        for fetch in asyncio.as_completed(fetches):
+            chunk, response = await fetch
+            if 'result' not in response:
+                print(f'ERROR: cannot get multiple accounts {chunk}: {response}')
+                continue
+            slot = response['result']['context']['slot']
+            for pubkey, account_value in zip(chunk, response['result']['value']):
+                if account_value is None:  # the account was closed in between
+                    continue
+                try:
+                    yield counter_account_from_value(account_value, slot=slot, pubkey=pubkey)
+                except Exception as e:
+                    print(f'Program account {pubkey} is not a counter account: {e}')
+    finally:
+        # the consumer may stop iterating early
+        for fetch in fetches:
+            fetch.cancel()
+
+async def get_all_program_accounts(client: AsyncClient, program_keypair:Keypair, refresh: bool = False) -> None:
+    number_of_accounts = 0
+    async for counter_account in iter_program_counter_accounts(client, program_keypair.public_key, refresh=refresh):
+        number_of_accounts += 1
+        print(f'Program account [{counter_account.pubkey}]: {counter_account.counter}/'
+            f'{counter_account.timestamp}/{counter_account.client_timestamp}, slot: {counter_account.latest_slot}')
+    print(f'Program {program_keypair.public_key} owns {number_of_accounts} counter accounts')
 
 
 # removing the account means to take off out all the Solana balance, the account will be purged by validator
@@ -400,125 +933,701 @@ async def get_all_program_accounts(rpc_url: str, program_keypair:Keypair) -> Non
 # Transfering from program to a wallet can be done only in smart contract, the data program is owned by program and not by system 11111111111111 program
 # thus the solana_system::transfer cannot work. We need own smart contract that works with values.
 # !!!!! 1THIS DOES NOT WORK !!!!!!
-async def delete_program_data_account_1(rpc_url: str, keypair:Keypair, program_keypair:Keypair) -> None:
-    async with AsyncClient(endpoint = rpc_url, commitment=Confirmed) as client:
-        program_data_address = get_data_account_pubkey(keypair.public_key, program_keypair.public_key)
-        program_data_info = await client.get_account_info(pubkey=program_data_address)
-        print(f'Transfering from: {program_data_address}, to: {keypair.public_key}; owner of data: {program_data_info["result"]["value"]["owner"]}')
-        print(f'Signing with: {keypair.public_key} + {program_keypair.public_key}')
-        transfer_instruction = transfer(TransferParams(
-            from_pubkey = program_data_address,
-            to_pubkey = keypair.public_key,
-            lamports=1
-        ))
-        transfer_txn = Transaction(
-            fee_payer=keypair.public_key
-        ).add(transfer_instruction)
-        response = await client.send_transaction(transfer_txn, keypair, program_keypair)
-        print(f'>>delete_wrong> {response}')
-
-
-async def delete_program_data_account_2(rpc_url: str, keypair:Keypair, program_keypair:Keypair) -> None:
-    async with AsyncClient(endpoint = rpc_url, commitment=Confirmed) as client:
-        program_data_address = get_data_account_pubkey(keypair.public_key, program_keypair.public_key)
-        print(f'Data account with seed pubkey: {program_data_address}')
-        delete_data_account_txn = get_delete_data_account_txn(keypair.public_key, program_keypair.public_key)
-        response = await client.send_transaction(delete_data_account_txn, keypair, program_keypair)
-        print(f'>>delete_program> {response}')
-
-def solana_account_ws_subscription(address: str, commitment: str = str(Processed)) -> dict:
-    subscription_id: int = datetime.now().timestamp()
-    return {
-        "jsonrpc": "2.0",
-        "id": str(subscription_id),
-        "method": "accountSubscribe",
-        "params": [str(address), {"encoding": "base64", "commitment": str(commitment)}],
-    }
-
-async def work_with_ws(args: Namespace, shared_processing_data: dict):
-    keypair:Keypair = Keypair.from_secret_key(load_file(args.keypair))
-    program_keypair:Keypair = Keypair.from_secret_key(load_file(args.program_keypair))
-    provider: str = "onering"
-
-    async with aiohttp.ClientSession().ws_connect(args.ws) as ws:
-        program_data_address = get_data_account_pubkey(keypair.public_key, program_keypair.public_key)
-        await ws.send_json(
-            solana_account_ws_subscription(program_data_address)
-        )
-        response = await ws.receive(timeout=30)
-        print(f'ws subscription: {response}')
-        async for msg in ws:
-            data = msg.json()
-            # print(f"---->  {data['params']}")
-            counter_account = CounterAccount(data['params'])
-            # print(f'>>counter_account> {type(counter_account.client_timestamp)}:{counter_account.client_timestamp},' f'{type(counter_account.timestamp)}:{counter_account.timestamp}')
-            txn_data = TransactionProcessingData(
-                client_time=counter_account.client_timestamp,
-                provider=provider,
-                blockchain_time=counter_account.timestamp,
-                blockchain_counter=counter_account.counter,
-                ws_time = datetime.utcnow()
+async def delete_program_data_account_1(client: AsyncClient, keypair:Keypair, program_keypair:Keypair) -> None:
+    program_data_address = get_data_account_pubkey(keypair.public_key, program_keypair.public_key)
+    program_data_info = await client.get_account_info(pubkey=program_data_address)
+    print(f'Transfering from: {program_data_address}, to: {keypair.public_key}; owner of data: {program_data_info["result"]["value"]["owner"]}')
+    print(f'Signing with: {keypair.public_key} + {program_keypair.public_key}')
+    transfer_instruction = transfer(TransferParams(
+        from_pubkey = program_data_address,
+        to_pubkey = keypair.public_key,
+        lamports=1
+    ))
+    transfer_txn = Transaction(
+        fee_payer=keypair.public_key
+    ).add(transfer_instruction)
+    response = await client.send_transaction(transfer_txn, keypair, program_keypair)
+    print(f'>>delete_wrong> {response}')
+
+
+async def delete_program_data_account_2(
+    client: AsyncClient,
+    keypair:Keypair,
+    program_keypair:Keypair,
+    blockhash_cache: RecentBlockhashCache
+) -> None:
+    program_data_address = get_data_account_pubkey(keypair.public_key, program_keypair.public_key)
+    print(f'Data account with seed pubkey: {program_data_address}')
+    delete_data_account_txn = get_delete_data_account_txn(
+        keypair.public_key, program_keypair.public_key, await blockhash_cache.get_or_refresh()
+    )
+    response = await client.send_transaction(
+        delete_data_account_txn, keypair, program_keypair, recent_blockhash=delete_data_account_txn.recent_blockhash
+    )
+    print(f'>>delete_program> {response}')
+
+async def work_with_ws(
+    args: Namespace,
+    context: SessionContext,
+    shared_processing_data: CorrelationStore,
+    provider: str = DEFAULT_PROVIDER,
+    ws_url: str = None,
+    race: ProviderRace = None
+):
+    async def consume(shard: int, subscription: Subscription):
+        label = context.shard_selector.label(shard)
+        # notifications come decoded by the socket reader, in batches of all received since the last wake up
+        async for notifications in subscription:
+            for received_at, slot, counter, timestamp, client_timestamp in notifications:
+                context.shard_counters.update(shard, counter, slot)
+                METRICS.observe(STAGE_ONCHAIN_CLIENT_SKEW, provider, Processed, timestamp - client_timestamp)
+                if race:
+                    race.ws_notified(client_timestamp, provider)
+                txn_data = TransactionProcessingData(
+                    client_time=datetime.fromtimestamp(client_timestamp),
+                    provider=provider,
+                    blockchain_time=datetime.fromtimestamp(timestamp),
+                    blockchain_counter=counter,
+                    ws_time = to_wall_time(received_at),
+                    shard=label,
+                    ws_slot=slot
+                )
+                update_in_shared_dict(shared_processing_data, txn_data)
+
+    async with SubscriptionManager(
+        ws_url if ws_url else args.ws, sockets=args.ws_sockets, queue_size=args.ws_queue_size, capture=context.capture
+    ) as manager:
+        # every shard has its own subscription, spread over the sockets
+        subscriptions = [
+            await manager.account_subscribe(pubkey, decoder=decode_counter_notification) for pubkey in context.shard_pubkeys
+        ]
+        await asyncio.gather(*[consume(shard, subscription) for shard, subscription in enumerate(subscriptions)])
+
+def update_in_shared_dict(shared_processing_data: CorrelationStore, record: TransactionProcessingData):
+    shared_processing_data.update(record)
+
+
+def get_session_context(args: Namespace, worker: int = 0, workers: int = 1, capture: CaptureWriter = None,
+        slot_clock: SlotClock = None) -> SessionContext:
+    shard_ids = None
+    if workers > 1:
+        # the workers do not share a shard when there are enough of them, the counter writes do not collide
+        shards = max(args.shards, 1)
+        shard_ids = [shard for shard in range(shards) if shard % workers == worker] or [worker % shards]
+    return SessionContext(
+        Keypair.from_secret_key(load_file(args.keypair)),
+        Keypair.from_secret_key(load_file(args.program_keypair)),
+        BootstrapCache(args.bootstrap_cache),
+        shards=args.shards,
+        shard_strategy=args.shard_strategy,
+        shard_ids=shard_ids,
+        capture=capture,
+        slot_clock=slot_clock
+    )
+
+def get_slot_clock(args: Namespace, session: RpcSession, capture: CaptureWriter = None) -> SlotClock:
+    if not args.slot_clock:
+        return None
+    return SlotClock(
+        session.client(args.url, Processed),
+        args.ws,
+        capacity=args.slot_clock_size,
+        poll_interval=args.slot_clock_poll_interval,
+        capture=capture
+    )
+
+def get_capture(args: Namespace) -> CaptureWriter:
+    return CaptureWriter(args.capture) if args.capture else None
+
+def get_rpc_session(args: Namespace, capture: CaptureWriter = None) -> RpcSession:
+    return RpcSession(
+        max_connections=args.rpc_max_connections,
+        max_keepalive_connections=args.rpc_max_keepalive,
+        timeout=args.rpc_timeout,
+        connect_timeout=args.rpc_connect_timeout,
+        endpoint_limits=parse_endpoint_limits(args.rpc_endpoint_limit),
+        batch_size=args.rpc_batch_size,
+        batch_delay=args.rpc_batch_delay_ms / 1000,
+        capture=capture
+    )
+
+def get_blockhash_cache(args: Namespace, session: RpcSession) -> RecentBlockhashCache:
+    return RecentBlockhashCache(session.client(args.url, Finalized), refresh_interval=args.blockhash_refresh_interval)
+
+def get_provider_race(args: Namespace, session: RpcSession) -> ProviderRace:
+    providers = parse_providers(args.provider)
+    clients = {provider.name: session.client(provider.url, Confirmed) for provider in providers}
+    return ProviderRace(clients, {name: get_confirmation_tracker(args, client) for name, client in clients.items()})
+
+def get_confirmation_tracker(args: Namespace, client: AsyncClient) -> ConfirmationTracker:
+    return ConfirmationTracker(
+        client,
+        commitment=Confirmed,
+        timeout=args.confirm_timeout,
+        min_interval=args.confirm_min_interval,
+        max_interval=args.confirm_max_interval
+    )
+
+def get_rebroadcaster(
+    args: Namespace,
+    client: AsyncClient,
+    tracker: ConfirmationTracker,
+    blockhash_cache: RecentBlockhashCache,
+    stage_tracker: StageTimelineTracker = None
+) -> Rebroadcaster:
+    if not args.rebroadcast_interval:
+        return None
+    return Rebroadcaster(
+        client,
+        tracker,
+        blockhash_cache,
+        interval=args.rebroadcast_interval,
+        max_resigns=args.rebroadcast_max_resigns,
+        timeout=args.rebroadcast_timeout,
+        # the stages of a transaction signed again are of its new signature too
+        on_resign=stage_tracker.add_signature if stage_tracker else None
+    )
+
+def get_stage_tracker(args: Namespace, client: AsyncClient, capture: CaptureWriter = None) -> StageTimelineTracker:
+    if not args.stage_timeout:
+        return None
+    return StageTimelineTracker(client, args.ws, sockets=args.ws_sockets, timeout=args.stage_timeout, capture=capture)
+
+async def work_with_counter(
+    args: Namespace,
+    context: SessionContext,
+    shared_processing_data: CorrelationStore,
+    session: RpcSession
+):
+    keypair:Keypair = context.keypair
+    program_keypair:Keypair = context.program_keypair
+    print('-' * 120)
+    print(f'User pubkey: "{keypair.public_key}, program key: {program_keypair.public_key}')
+    print('-' * 120 + '\n\n')
+
+    blockhash_cache = get_blockhash_cache(args, session)
+    await blockhash_cache.start()
+    if args.create_data_account:
+        await prepare(session.client(args.url, Finalized), context, blockhash_cache, args.url)
+    client = session.client(args.url, Confirmed)
+    stage_tracker = get_stage_tracker(args, client, context.capture)
+    if stage_tracker:
+        await stage_tracker.start()
+    async with get_confirmation_tracker(args, client) as tracker:
+        rebroadcaster = get_rebroadcaster(args, client, tracker, blockhash_cache, stage_tracker)
+        for i in range(1,20):
+            print(f'\nLOOP {i}')
+            txn_data = await increase_counter_and_wait(
+                client, tracker, blockhash_cache, context,
+                stage_tracker=stage_tracker, shared_processing_data=shared_processing_data, rebroadcaster=rebroadcaster
             )
             update_in_shared_dict(shared_processing_data, txn_data)
+            await asyncio.sleep(args.sleep_time)
+        if rebroadcaster:
+            await rebroadcaster.close()
+            print(f'Rebroadcast: {rebroadcaster.stats}')
+    if stage_tracker:
+        print(f'Waiting for {stage_tracker.pending()} transactions to be finalized')
+        await stage_tracker.close()
+    # await get_all_program_accounts(client, program_keypair)
+    # await delete_program_data_account_2(client, keypair, program_keypair, blockhash_cache)
+    await blockhash_cache.close()
 
-def update_in_shared_dict(shared_processing_data: dict, record: TransactionProcessingData):
-    if record.id() in shared_processing_data:
-        saved_record: TransactionProcessingData = shared_processing_data[record.id()]
-        saved_record.merge(record)
-        shared_processing_data[record.id()] = saved_record
+async def send_raced_counter_txn(
+    race: ProviderRace,
+    keypair:Keypair,
+    program_keypair:Keypair,
+    shard_selector: ShardSelector,
+    blockhash_cache: RecentBlockhashCache,
+    presigned_pipeline: PresignedTxnPipeline
+) -> tuple[str, date, date, dict, int]:
+    # the transaction is signed once, all the providers get the same wire bytes
+    if presigned_pipeline:
+        presigned = await presigned_pipeline.get()
+        wire, txn_id, client_time, recent_blockhash, shard = (
+            presigned.wire, presigned.txn_id, presigned.client_time, presigned.recent_blockhash, presigned.shard
+        )
     else:
-        shared_processing_data[record.id()] = record
+        client_time: date = datetime.utcnow()
+        recent_blockhash = await blockhash_cache.get_or_refresh()
+        shard = shard_selector.select()
+        wire, txn_id = presign_counter_txn(
+            bytes(keypair.secret_key), bytes(program_keypair.secret_key), str(shard_selector.pubkey(shard)),
+            client_time, str(recent_blockhash)
+        )
+    start_at: date = datetime.utcnow()
+    attempts = await race.broadcast(wire)
+    for attempt in attempts.values():
+        if attempt.accepted_at:
+            METRICS.observe(STAGE_RPC_ACCEPT, attempt.provider, Confirmed, delta_time(start_at, attempt.accepted_at))
+    if not any(attempt.accepted_at for attempt in attempts.values()):
+        errors = [attempt.error for attempt in attempts.values()]
+        if all(is_blockhash_not_found(error) for error in errors):
+            print(f'Blockhash {recent_blockhash} of raced transaction {txn_id} was not found by any provider')
+            if presigned_pipeline:
+                presigned_pipeline.refuse_blockhash(recent_blockhash)
+            blockhash_cache.invalidate(recent_blockhash)
+        else:
+            print(f'ERROR: no provider accepted transaction {txn_id}: {[str(error) for error in errors]}')
+        return None, client_time, start_at, attempts, shard
+    return txn_id, client_time, start_at, attempts, shard
+
+async def send_counter_txn_to_queue(
+    client: AsyncClient,
+    keypair:Keypair,
+    program_keypair:Keypair,
+    shard_selector: ShardSelector,
+    blockhash_cache: RecentBlockhashCache,
+    presigned_pipeline: PresignedTxnPipeline,
+    sent_queue: asyncio.Queue,
+    in_flight: asyncio.Semaphore,
+    load_stats: dict,
+    race: ProviderRace = None,
+    rebroadcaster: Rebroadcaster = None
+):
+    attempts = None
+    send_id = next_send_id()
+    try:
+        if race:
+            txn_id, client_time, start_at, attempts, shard = await send_raced_counter_txn(
+                race, keypair, program_keypair, shard_selector, blockhash_cache, presigned_pipeline
+            )
+        elif presigned_pipeline:
+            presigned = await presigned_pipeline.get()
+            client_time: date = presigned.client_time
+            start_at: date = datetime.utcnow()
+            shard = presigned.shard
+            txn_id = await send_presigned_counter_txn(client, presigned, blockhash_cache, presigned_pipeline)
+        else:
+            start_at: date = datetime.utcnow()
+            client_time: date = start_at
+            shard = shard_selector.select()
+            if rebroadcaster:
+                txn_id = await broadcast_counter_txn(
+                    rebroadcaster, keypair, program_keypair, shard_selector.pubkey(shard), start_at,
+                    nonce_key=get_txn_nonce_key()
+                )
+            else:
+                txn_id = await send_counter_txn(
+                    client, keypair, program_keypair, shard_selector.pubkey(shard), start_at, blockhash_cache,
+                    nonce_key=get_txn_nonce_key()
+                )
+    except Exception as e:
+        print(f'ERROR: cannot send counter transaction: {e}')
+        txn_id = None
+    if not txn_id:
+        load_stats['failed'] += 1
+        in_flight.release()
+        return
+    load_stats['sent'] += 1
+    # in flight until confirmed, the confirmation releases it
+    shard_selector.acquire(shard)
+    if not race:
+        METRICS.observe(STAGE_RPC_ACCEPT, DEFAULT_PROVIDER, client.commitment, delta_time(start_at))
+    await sent_queue.put((send_id, txn_id, client_time, start_at, attempts, shard))
 
+async def confirm_raced_counter_txn(
+    race: ProviderRace,
+    send_id: int,
+    txn_id: str,
+    client_time: date,
+    start_at: date,
+    attempts: dict,
+    shared_processing_data: CorrelationStore,
+    shard: int = None
+) -> bool:
+    await race.confirm(txn_id, attempts)
+    for attempt in attempts.values():
+        confirmation = attempt.confirmation
+        finished_at = attempt.confirmed_at() or datetime.max
+        block_time = confirmation.block_time if confirmation.block_time and confirmation.is_confirmed() else datetime.max
+        observe_confirmation(attempt.provider, Confirmed, start_at, finished_at, block_time, shard)
+        update_in_shared_dict(shared_processing_data, TransactionProcessingData(
+            client_time=client_time,
+            provider=attempt.provider,
+            send_id=send_id,
+            txn_id=txn_id,
+            started_at=start_at,
+            finished_at=finished_at,
+            txnblock_time=block_time,
+            shard=shard,
+            landed_slot=confirmation.slot
+        ))
+    return any(attempt.confirmed_at() for attempt in attempts.values())
 
-async def work_with_counter(args: Namespace, shared_processing_data: dict):
-    # keypair_file = Path(args.keypair)
-    keypair:Keypair = Keypair.from_secret_key(load_file(args.keypair))
-    # program_keypair_file = Path(args.program_keypair)
-    program_keypair:Keypair = Keypair.from_secret_key(load_file(args.program_keypair))
+async def confirm_counter_txn(
+    tracker: ConfirmationTracker,
+    send_id: int,
+    txn_id: str,
+    client_time: date,
+    start_at: date,
+    in_flight: asyncio.Semaphore,
+    load_stats: dict,
+    shared_processing_data: CorrelationStore,
+    race: ProviderRace = None,
+    attempts: dict = None,
+    stage_tracker: StageTimelineTracker = None,
+    shard: int = None
+):
+    if race:
+        try:
+            confirmed = await confirm_raced_counter_txn(
+                race, send_id, txn_id, client_time, start_at, attempts, shared_processing_data, shard
+            )
+        except Exception as e:
+            print(f'ERROR: cannot confirm raced counter transaction {txn_id}: {e}')
+            confirmed = False
+        finally:
+            in_flight.release()
+        load_stats['confirmed' if confirmed else 'timeouted'] += 1
+        return
+    if stage_tracker:
+        track_stages(stage_tracker, shared_processing_data, send_id, txn_id, client_time, start_at)
+    try:
+        finished_at, block_time, send_attempts, landed_slot, txn_id = await wait_for_counter_txn(tracker, txn_id, start_at)
+    except Exception as e:
+        print(f'ERROR: cannot confirm counter transaction {txn_id}: {e}')
+        finished_at, block_time, send_attempts, landed_slot = datetime.max, datetime.max, None, None
+    finally:
+        in_flight.release()
+    # a transaction failed on-chain has its slot but no confirmation time
+    load_stats[
+        'confirmed' if finished_at != datetime.max else 'landed with error' if landed_slot is not None else 'timeouted'
+    ] += 1
+    observe_confirmation(DEFAULT_PROVIDER, tracker.commitment, start_at, finished_at, block_time, shard)
+    update_in_shared_dict(shared_processing_data, TransactionProcessingData(
+        client_time=client_time,
+        provider=DEFAULT_PROVIDER,
+        send_id=send_id,
+        txn_id=txn_id,
+        started_at=start_at,
+        finished_at=finished_at,
+        txnblock_time=block_time,
+        stages_pending=True if stage_tracker else None,
+        shard=shard,
+        send_attempts=send_attempts,
+        landed_slot=landed_slot
+    ))
+
+async def confirm_counter_txns(
+    tracker: ConfirmationTracker,
+    sent_queue: asyncio.Queue,
+    in_flight: asyncio.Semaphore,
+    load_stats: dict,
+    shared_processing_data: CorrelationStore,
+    race: ProviderRace = None,
+    stage_tracker: StageTimelineTracker = None,
+    shard_selector: ShardSelector = None
+):
+    confirmations = set()
+    while True:
+        sent = await sent_queue.get()
+        if sent is None:  # sender finished
+            break
+        send_id, txn_id, client_time, start_at, attempts, shard = sent
+        confirmation = asyncio.create_task(confirm_counter_txn(
+            tracker, send_id, txn_id, client_time, start_at, in_flight, load_stats, shared_processing_data, race, attempts,
+            stage_tracker, shard_selector.label(shard) if shard_selector else None
+        ))
+        confirmations.add(confirmation)
+        confirmation.add_done_callback(confirmations.discard)
+        if shard_selector:
+            confirmation.add_done_callback(lambda _, shard=shard: shard_selector.release(shard))
+    if confirmations:
+        await asyncio.gather(*confirmations)
+
+async def work_with_counter_load(
+    args: Namespace,
+    context: SessionContext,
+    shared_processing_data: CorrelationStore,
+    session: RpcSession,
+    race: ProviderRace = None
+):
+    keypair:Keypair = context.keypair
+    program_keypair:Keypair = context.program_keypair
+    duration = args.duration if args.duration or args.txn_count else 60
     print('-' * 120)
     print(f'User pubkey: "{keypair.public_key}, program key: {program_keypair.public_key}')
+    print(f'Load: tps={args.tps}, concurrency={args.concurrency}, duration={duration}, txn count={args.txn_count}')
+    if len(context.shard_pubkeys) > 1:
+        print(f'Data account shards: {len(context.shard_pubkeys)}, strategy {context.shard_selector.strategy}')
+    if race:
+        print(f'Racing providers: {", ".join(race.clients)}')
     print('-' * 120 + '\n\n')
 
+    blockhash_cache = get_blockhash_cache(args, session)
+    await blockhash_cache.start()
     if args.create_data_account:
-        await prepare(args.url, keypair, program_keypair)
-    for i in range(1,20):
-        print(f'\nLOOP {i}')
-        txn_data = await increase_counter_and_wait(args.url, keypair, program_keypair)
-        update_in_shared_dict(shared_processing_data, txn_data)
-        await asyncio.sleep(args.sleep_time)
-    # await get_all_program_accounts(args.url, program_keypair)
-    # await delete_program_data_account_2(args.url, keypair, program_keypair)
-
-async def update_db(args: Namespace, shared_processing_data: dict):
-    while True:
-        # print(f'update_db data loop: {shared_processing_data}')
-        record: TransactionProcessingData
-        shallow_data_copy = shared_processing_data.copy()
-        for id, record in shallow_data_copy.items():
-            if record.started_at and record.blockchain_counter:
-                print(f'Transaction "{record.txn_id}":\n got to blockchain after {delta_time(record.started_at, record.blockchain_time)},\n'
-                    f'txn was processed by validators after {delta_time(record.started_at, record.finished_at)},\n'
-                    f'received by WS after {delta_time(record.started_at, record.ws_time)},\n'
-                    f'blocktime after {delta_time(record.started_at, record.blockchain_time)}'
-                )
-                shared_processing_data.pop(id)
-            if delta_time(record.processing_data_updated) > 60:
-                print(f'ERROR: removing record {record} from the list as timeouted after 60 second')
-                shared_processing_data.pop(id)
-        await asyncio.sleep(10)
+        await prepare(session.client(args.url, Finalized), context, blockhash_cache, args.url)
+    client = session.client(args.url, Confirmed)
+    presigned_pipeline = None
+    if args.presign:
+        presigned_pipeline = PresignedTxnPipeline(
+            keypair, program_keypair, context.shard_selector, blockhash_cache,
+            executor=get_presign_executor(args.presign_workers, args.presign_processes),
+            workers=args.presign_workers,
+            queue_size=args.presign_queue
+        )
+        await presigned_pipeline.start()
+
+    pacer = TokenBucket(args.tps)
+    in_flight = asyncio.Semaphore(args.concurrency)
+    sent_queue: asyncio.Queue = asyncio.Queue()
+    load_stats = {'sent': 0, 'failed': 0, 'confirmed': 0, 'landed with error': 0, 'timeouted': 0}
+    tracker = get_confirmation_tracker(args, client)
+    # the stages are tracked for the single provider only, the race compares the providers on its own
+    stage_tracker = get_stage_tracker(args, client, context.capture) if not race else None
+    if stage_tracker:
+        await stage_tracker.start()
+    # the race and the presigned transactions are sent as they are, the plain sends only are rebroadcast
+    rebroadcaster = get_rebroadcaster(
+        args, client, tracker, blockhash_cache, stage_tracker
+    ) if not race and not presigned_pipeline else None
+    confirmer = asyncio.create_task(
+        confirm_counter_txns(
+            rebroadcaster or tracker, sent_queue, in_flight, load_stats, shared_processing_data, race, stage_tracker, context.shard_selector
+        )
+    )
+    sends = set()
+    started_at = time.monotonic()
+    number_of_sends = 0
+    while ((args.txn_count is None or number_of_sends < args.txn_count)
+            and (duration is None or time.monotonic() - started_at < duration)):
+        # a free slot in the window first, the token then, a send never takes a token it cannot use
+        await in_flight.acquire()
+        await pacer.acquire()
+        send = asyncio.create_task(send_counter_txn_to_queue(
+            client, keypair, program_keypair, context.shard_selector, blockhash_cache, presigned_pipeline,
+            sent_queue, in_flight, load_stats, race, rebroadcaster
+        ))
+        sends.add(send)
+        send.add_done_callback(sends.discard)
+        number_of_sends += 1
+    sending_time = time.monotonic() - started_at
+    if sends:
+        await asyncio.gather(*sends)
+    await sent_queue.put(None)
+    await confirmer
+    if rebroadcaster:
+        await rebroadcaster.close()
+        print(f'Rebroadcast: {rebroadcaster.stats}')
+    await tracker.close()
+    if stage_tracker:
+        print(f'Waiting for {stage_tracker.pending()} transactions to be finalized')
+        await stage_tracker.close()
+    if race:
+        await race.close()
+    if presigned_pipeline:
+        await presigned_pipeline.close()
+        print(f'Presigned transactions dropped as too old or with a refused blockhash: {presigned_pipeline.dropped}')
+    await blockhash_cache.close()
+    print(f'Load finished: {load_stats} in {sending_time:.2f} seconds of sending, '
+        f'achieved {load_stats["sent"] / sending_time if sending_time else 0:.2f} TPS')
+    return load_stats, sending_time
 
+def observe_slot_latencies(record: TransactionProcessingData, slot_clock: SlotClock = None) -> str:
+    # the send and the slots converted by the slot clock, latencies of a sub-second precision
+    # the blockTime and the on-chain timestamps (seconds) cannot give
+    if not slot_clock or not record.started_at:
+        return ''
+    record.sent_slot = slot_clock.slot_of(record.started_at)
+    if record.sent_slot is None:
+        return ''  # no slot seen yet
+    report = ''
+    # a transaction failed on-chain has the slot it landed in but no latency to record
+    if record.landed_slot is not None and record.finished_at != datetime.max:
+        latency = slot_clock.latency(record.started_at, record.landed_slot)
+        METRICS.observe(STAGE_SLOT_LANDED, record.provider, Confirmed, latency, record.shard)
+        report += f',\nlanded {record.landed_slot - record.sent_slot:.2f} slots ({latency * 1000:.1f}ms) after the send'
+    if record.ws_slot is not None:
+        latency = slot_clock.latency(record.started_at, record.ws_slot)
+        METRICS.observe(STAGE_SLOT_WS_NOTIFICATION, record.provider, Processed, latency, record.shard)
+        report += f',\nnotified for slot {record.ws_slot - record.sent_slot:.2f} slots ({latency * 1000:.1f}ms) after the send'
+    return report
 
+def report_completed_record(record: TransactionProcessingData, sink: SqliteResultsSink = None,
+        slot_clock: SlotClock = None):
+    slot_report = observe_slot_latencies(record, slot_clock)
+    print(f'Transaction "{record.txn_id}":\n got to blockchain after {delta_time(record.started_at, record.blockchain_time)},\n'
+        f'txn was processed by validators after {delta_time(record.started_at, record.finished_at)},\n'
+        f'received by WS after {delta_time(record.started_at, record.ws_time)},\n'
+        f'blocktime after {delta_time(record.started_at, record.blockchain_time)}{slot_report}'
+    )
+    if record.ws_time:
+        METRICS.observe(STAGE_WS_NOTIFICATION, record.provider, Processed, delta_time(record.started_at, record.ws_time),
+            record.shard)
+    if sink:
+        sink.put(record, 'completed')
+
+def report_expired_record(record: TransactionProcessingData, sink: SqliteResultsSink = None,
+        slot_clock: SlotClock = None):
+    observe_slot_latencies(record, slot_clock)
+    print(f'ERROR: removing record {record} from the list as timeouted after 60 second')
+    if sink:
+        sink.put(record, 'expired')
+
+def get_correlation_store(sink: SqliteResultsSink = None, slot_clock: SlotClock = None) -> CorrelationStore:
+    return CorrelationStore(
+        is_complete=TransactionProcessingData.is_complete,
+        on_complete=lambda record: report_completed_record(record, sink, slot_clock),
+        on_expire=lambda record: report_expired_record(record, sink, slot_clock),
+        timeout=60
+    )
+
+async def update_db(args: Namespace, shared_processing_data: CorrelationStore, sink: SqliteResultsSink = None):
+    # completed records are reported by the store on their last update, here only the timeouts are driven
+    try:
+        if sink:
+            await sink.start()
+        while True:
+            shared_processing_data.expire()
+            await asyncio.sleep(shared_processing_data.wheel.tick)
+    finally:
+        if sink:
+            # records without data from all sides are persisted too when the work is done
+            for record in shared_processing_data.drain():
+                sink.put(record, 'incomplete')
+            await sink.close()
+        if shared_processing_data.ambiguous_joins:
+            print(f'WARNING: {shared_processing_data.ambiguous_joins} websocket notifications were joined to one or more '
+                'sends of the same second (the on-chain client timestamp has seconds precision), in the send order')
+        print(f'Correlation: {shared_processing_data}')
+
+
+
+def start_client_tasks(
+    args: Namespace,
+    context: SessionContext,
+    shared_processing_data: CorrelationStore,
+    session: RpcSession,
+    race: ProviderRace = None,
+    sink: SqliteResultsSink = None
+) -> list:
+    loop = asyncio.get_event_loop()
+    tasks = []
+    if args.load or race:
+        tasks += [loop.create_task(work_with_counter_load(args, context, shared_processing_data, session, race))]
+    else:
+        tasks += [loop.create_task(work_with_counter(args, context, shared_processing_data, session))]
+    background_tasks = [loop.create_task(update_db(args, shared_processing_data, sink))]
+    if args.ws_subscribe and race:
+        background_tasks += [
+            loop.create_task(work_with_ws(args, context, shared_processing_data, provider.name, provider.ws, race))
+            for provider in parse_providers(args.provider) if provider.ws
+        ]
+    elif args.ws_subscribe:
+        background_tasks += [loop.create_task(work_with_ws(args, context, shared_processing_data))]
+    # websocket listener and db updates run until the counter work is done
+    tasks[0].add_done_callback(lambda _: [task.cancel() for task in background_tasks])
+    return tasks + background_tasks
+
+def get_worker_args(args: Namespace, worker: int, workers: int) -> Namespace:
+    worker_args = Namespace(**vars(args))
+    worker_args.tps = worker_share(args.tps, worker, workers)
+    worker_args.concurrency = max(worker_share(args.concurrency, worker, workers), 1)
+    if args.txn_count is not None:
+        worker_args.txn_count = worker_share(args.txn_count, worker, workers)
+    # the main process bootstraps the accounts, serves the metrics and prints the merged summary
+    worker_args.create_data_account = False
+    worker_args.metrics_port = 0
+    worker_args.metrics_summary_interval = 0
+    if args.capture:
+        worker_args.capture = f'{args.capture}.{worker}'
+    return worker_args
+
+def run_load_worker(args: Namespace, worker: int, workers: int, conn):
+    # entry point of a load worker process started by the LoadCoordinator
+    args = get_worker_args(args, worker, workers)
+    sink = PipeResultsSink(conn, batch_size=args.db_batch_size, flush_interval=args.db_flush_interval_ms / 1000)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    capture = get_capture(args)
+    session = get_rpc_session(args, capture)
+    race = get_provider_race(args, session) if args.provider else None
+    context = get_session_context(args, worker, workers, capture, get_slot_clock(args, session, capture))
+    shared_processing_data = get_correlation_store(sink, context.slot_clock)
+    try:
+        if context.slot_clock:
+            loop.run_until_complete(context.slot_clock.start())
+        results = loop.run_until_complete(asyncio.gather(
+            *start_client_tasks(args, context, shared_processing_data, session, race, sink), return_exceptions=True
+        ))
+        if isinstance(results[0], BaseException):
+            print(f'ERROR: load worker {worker} failed: {results[0]!r}')
+        else:
+            load_stats, sending_time = results[0]
+            sink.done({
+                'load_stats': load_stats,
+                'sending_time': sending_time,
+                'histograms': METRICS.histograms,
+                'wins': race.wins if race else None
+            })
+    finally:
+        if context.slot_clock:
+            loop.run_until_complete(context.slot_clock.close())
+        loop.run_until_complete(session.close())
+        loop.close()
+        if capture:
+            capture.close()
+        conn.close()
+
+def main_load_workers(args: Namespace):
+    sink = SqliteResultsSink(
+        args.db, batch_size=args.db_batch_size, flush_interval=args.db_flush_interval_ms / 1000
+    ) if args.db else None
+    loop = asyncio.get_event_loop()
+    capture = get_capture(args)
+    session = get_rpc_session(args, capture)
+    metrics_server = MetricsServer(METRICS, port=args.metrics_port, summary_interval=args.metrics_summary_interval)
+    context = get_session_context(args, capture=capture)
+    coordinator = LoadCoordinator(run_load_worker, args, args.workers, sink, METRICS)
+    print(f'Load is sent by {args.workers} worker processes over {len(context.shard_pubkeys)} data account shards')
+    try:
+        loop.run_until_complete(metrics_server.start())
+        if sink:
+            loop.run_until_complete(sink.start())
+        if args.create_data_account:
+            # bootstrapped once here, the workers start with the accounts in place
+            blockhash_cache = get_blockhash_cache(args, session)
+            loop.run_until_complete(blockhash_cache.start())
+            loop.run_until_complete(prepare(session.client(args.url, Finalized), context, blockhash_cache, args.url))
+            loop.run_until_complete(blockhash_cache.close())
+        loop.run_until_complete(coordinator.run())
+        coordinator.print_report()
+        loop.run_until_complete(print_data_account(session.client(args.url, Confirmed), context, Confirmed))
+    finally:
+        if sink:
+            loop.run_until_complete(sink.close())
+        session.print_stats()
+        loop.run_until_complete(metrics_server.close())
+        loop.run_until_complete(session.close())
+        loop.close()
+        if capture:
+            capture.close()
 
 def main():
     args = get_args()
+    if args.workers > 1 and (args.load or args.provider):
+        main_load_workers(args)
+        return
 
-    shared_processing_data: dict = {}  # key(provider+client_id) -> TransactionProcessingData
+    sink = SqliteResultsSink(
+        args.db, batch_size=args.db_batch_size, flush_interval=args.db_flush_interval_ms / 1000
+    ) if args.db else None
     loop = asyncio.get_event_loop()
+    capture = get_capture(args)
+    session = get_rpc_session(args, capture)
 
-    tasks = []
-    tasks += [loop.create_task(work_with_counter(args, shared_processing_data))]
-    # tasks += [loop.create_task(work_with_ws(args, shared_processing_data))]
-    # tasks += [loop.create_task(update_db(args, shared_processing_data))]
+    metrics_server = MetricsServer(METRICS, port=args.metrics_port, summary_interval=args.metrics_summary_interval)
+    loop.run_until_complete(metrics_server.start())
+
+    race = get_provider_race(args, session) if args.provider else None
+    context = get_session_context(args, capture=capture, slot_clock=get_slot_clock(args, session, capture))
+    if context.slot_clock:
+        loop.run_until_complete(context.slot_clock.start())
+    shared_processing_data = get_correlation_store(sink, context.slot_clock)  # key(provider+client_id) -> TransactionProcessingData
+
+    tasks = start_client_tasks(args, context, shared_processing_data, session, race, sink)
 
     try:
         futures = asyncio.gather(*tasks, return_exceptions=True)
@@ -529,7 +1638,18 @@ def main():
         futures.exception()
         raise
     finally:
+        session.print_stats()
+        if race:
+            race.print_wins()
+        if len(context.shard_pubkeys) > 1:
+            print(f'Counter shards: {context.shard_counters}, {context.shard_selector}')
+        if context.slot_clock:
+            loop.run_until_complete(context.slot_clock.close())
+        loop.run_until_complete(metrics_server.close())
+        loop.run_until_complete(session.close())
         loop.close()
+        if capture:
+            capture.close()
 
 if __name__ == "__main__":
     main()
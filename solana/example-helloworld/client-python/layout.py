@@ -1,6 +1,8 @@
 import construct
 import typing
 import datetime
+import struct
+import numpy
 from decimal import Decimal
 
 class U32Adapter(construct.Adapter):  # u32 is unsigned 32 bit integer
@@ -38,4 +40,63 @@ COUNTER_INSTRUCTION = construct.Struct(
 
 DELETE_ACCOUNT_INSTRUCTION = construct.Struct(
     "instruction_type" / construct.Const(2, construct.BytesInteger(1, signed = False, swapped=True)),
-)
\ No newline at end of file
+)
+
+# Fast codec for the fixed-size layouts above.
+#
+# All fields are little endian integers at fixed offsets, precompiled struct formats
+# decode/encode them in one call without the construct parsing machinery and without
+# the per-field Decimal/datetime adapters. Timestamps are kept as ints (unix seconds)
+# and converted to datetime only when asked.
+COUNTER_ACCOUNT_FORMAT = struct.Struct('<Iqq')  # counter u32, timestamp i64, client_timestamp i64
+COUNTER_ACCOUNT_SIZE = COUNTER_ACCOUNT_FORMAT.size
+COUNTER_INSTRUCTION_FORMAT = struct.Struct('<Bq')  # instruction type u8, client_timestamp i64
+DELETE_ACCOUNT_INSTRUCTION_BYTES = bytes([2])
+
+COUNTER_ACCOUNT_DTYPE = numpy.dtype([
+    ('counter', '<u4'),
+    ('timestamp', '<i8'),
+    ('client_timestamp', '<i8'),
+])  # packed, i.e., the itemsize is the same as COUNTER_ACCOUNT_SIZE
+
+
+class CounterAccountData(typing.NamedTuple):
+    counter: int
+    timestamp: int
+    client_timestamp: int
+
+    def timestamp_datetime(self) -> datetime.datetime:
+        return datetime.datetime.fromtimestamp(self.timestamp)
+
+    def client_timestamp_datetime(self) -> datetime.datetime:
+        return datetime.datetime.fromtimestamp(self.client_timestamp)
+
+
+def decode_counter_account(data: bytes, offset: int = 0) -> CounterAccountData:
+    if len(data) - offset < COUNTER_ACCOUNT_SIZE:
+        raise ValueError(f'Expected at least {COUNTER_ACCOUNT_SIZE} bytes of counter account data but got {len(data) - offset}')
+    return CounterAccountData._make(COUNTER_ACCOUNT_FORMAT.unpack_from(data, offset))
+
+
+def encode_counter_account(counter: int, timestamp: int, client_timestamp: int) -> bytes:
+    return COUNTER_ACCOUNT_FORMAT.pack(counter, timestamp, client_timestamp)
+
+
+def encode_counter_instruction(client_time: typing.Union[datetime.datetime, int]) -> bytes:
+    client_timestamp = client_time if isinstance(client_time, int) else int(client_time.timestamp())
+    return COUNTER_INSTRUCTION_FORMAT.pack(1, client_timestamp)
+
+
+def decode_counter_accounts(buffers: typing.Iterable[bytes]) -> numpy.ndarray:
+    # Bulk decoding of many raw counter account buffers into a structured array
+    # with fields counter (u32), timestamp (i64) and client_timestamp (i64).
+    buffers = buffers if isinstance(buffers, (list, tuple)) else list(buffers)
+    for index, buffer in enumerate(buffers):
+        if len(buffer) != COUNTER_ACCOUNT_SIZE:
+            raise ValueError(f'Expected {COUNTER_ACCOUNT_SIZE} bytes of counter account data at index {index} but got {len(buffer)}')
+    return numpy.frombuffer(b''.join(buffers), dtype=COUNTER_ACCOUNT_DTYPE)
+
+
+def to_datetimes(timestamps: numpy.ndarray) -> typing.List[datetime.datetime]:
+    # e.g., to_datetimes(accounts['client_timestamp']), same local time conversion as TimestampAdapter
+    return [datetime.datetime.fromtimestamp(timestamp) for timestamp in timestamps.tolist()]
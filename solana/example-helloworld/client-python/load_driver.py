@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import time
+
+from argparse import Namespace
+from multiprocessing.connection import Connection
+from typing import Callable
+
+from metrics import MetricsRegistry
+from results_sink import SqliteResultsSink, to_row
+
+# messages a load worker sends to the coordinator over its pipe
+MESSAGE_RECORDS = 'records'  # list of result rows
+MESSAGE_DONE = 'done'  # summary dict, the last message of the worker
+
+
+def worker_share(total: float, worker: int, workers: int) -> float:
+    # even split of an integer total, the first workers take the remainder
+    if isinstance(total, int):
+        return total // workers + (1 if worker < total % workers else 0)
+    return total / workers
+
+
+class PipeResultsSink:
+    # Results sink of a load worker process, the drop-in of the SqliteResultsSink.
+    #
+    # Records are converted right away to compact rows of the results database (status, floats, ints
+    # and strings only, cheap to pickle) and sent to the coordinator in batches of 'batch_size' rows
+    # or every 'flush_interval' seconds. The coordinator writes them to its own sink.
+    def __init__(self, conn: Connection, batch_size: int = 500, flush_interval: float = 0.5) -> None:
+        self.conn: Connection = conn
+        self.batch_size: int = batch_size
+        self.flush_interval: float = flush_interval
+        self.written: int = 0
+        self._rows: list = []
+        self._task: asyncio.Task = None
+
+    async def start(self) -> PipeResultsSink:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def put(self, record, status: str = 'completed') -> None:
+        self._rows.append(to_row(status, record))
+        if len(self._rows) >= self.batch_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._rows:
+            self.conn.send((MESSAGE_RECORDS, self._rows))
+            self.written += len(self._rows)
+            self._rows = []
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self._flush()
+
+    def done(self, summary: dict) -> None:
+        self._flush()
+        self.conn.send((MESSAGE_DONE, summary))
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._flush()
+
+
+class LoadCoordinator:
+    # Runs the counter load in 'workers' processes to use more CPU cores than the single event loop.
+    #
+    # Every worker gets its index and runs 'target(args, worker, workers, conn)' in a new (spawned)
+    # process with its own event loop, it takes its share of the load and sends the result rows
+    # and at the end its summary (load stats, latency histograms, race wins) over the pipe.
+    # The coordinator writes the rows to its sink and merges the summaries into one report.
+    def __init__(
+        self,
+        target: Callable,
+        args: Namespace,
+        workers: int,
+        sink: SqliteResultsSink = None,
+        registry: MetricsRegistry = None
+    ) -> None:
+        self.target: Callable = target
+        self.args: Namespace = args
+        self.workers: int = workers
+        self.sink: SqliteResultsSink = sink
+        self.registry: MetricsRegistry = registry
+        self.records: int = 0
+        self.load_stats: dict = {}
+        self.sending_time: float = 0.0
+        self.wins: dict = {}
+        self.failed_workers: list = []
+
+    async def run(self) -> LoadCoordinator:
+        context = multiprocessing.get_context('spawn')
+        loop = asyncio.get_running_loop()
+        processes, readers = [], []
+        for worker in range(self.workers):
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(
+                target=self.target, args=(self.args, worker, self.workers, sender), name=f'load-worker-{worker}'
+            )
+            process.start()
+            sender.close()  # the worker holds its end, EOF is seen when the worker is gone
+            processes.append(process)
+            readers.append(loop.create_task(self._read(worker, receiver)))
+        started_at = time.monotonic()
+        await asyncio.gather(*readers)
+        for process in processes:
+            await loop.run_in_executor(None, process.join)
+        print(f'Load workers finished in {time.monotonic() - started_at:.2f} seconds, {self.records} records received')
+        return self
+
+    async def _read(self, worker: int, receiver: Connection) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    message, payload = await loop.run_in_executor(None, receiver.recv)
+                except EOFError:
+                    print(f'ERROR: load worker {worker} exited without a summary')
+                    self.failed_workers.append(worker)
+                    return
+                if message == MESSAGE_RECORDS:
+                    self.records += len(payload)
+                    if self.sink:
+                        for row in payload:
+                            self.sink.put_row(row)
+                elif message == MESSAGE_DONE:
+                    self._merge(payload)
+                    return
+        finally:
+            receiver.close()
+
+    def _merge(self, summary: dict) -> None:
+        for name, value in summary.get('load_stats', {}).items():
+            self.load_stats[name] = self.load_stats.get(name, 0) + value
+        # the workers send at the same time, the load took as long as the slowest one
+        self.sending_time = max(self.sending_time, summary.get('sending_time', 0.0))
+        for stage, wins in (summary.get('wins') or {}).items():
+            for name, count in wins.items():
+                self.wins.setdefault(stage, {}).setdefault(name, 0)
+                self.wins[stage][name] += count
+        if self.registry is not None:
+            self.registry.merge(summary.get('histograms', {}))
+
+    def print_report(self) -> None:
+        print(f'Load finished: {self.load_stats} in {self.sending_time:.2f} seconds of sending by {self.workers} workers, '
+            f'achieved {self.load_stats.get("sent", 0) / self.sending_time if self.sending_time else 0:.2f} TPS')
+        for stage, wins in self.wins.items():
+            total = sum(wins.values())
+            print(f'First to {stage}: ' + ', '.join(
+                f'{name} {count} ({count / total * 100 if total else 0:.1f}%)' for name, count in wins.items()
+            ))
+        if self.failed_workers:
+            print(f'ERROR: load workers {self.failed_workers} failed, their results are missing')
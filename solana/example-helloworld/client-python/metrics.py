@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+import asyncio
+import math
+
+from aiohttp import web
+
+# processing stages of a counter transaction, the latency is measured from the send
+STAGE_RPC_ACCEPT = 'rpc_accept'  # send -> RPC node returned the signature
+STAGE_CONFIRMED = 'confirmed'  # send -> signature status reached the commitment
+STAGE_WS_NOTIFICATION = 'ws_notification'  # send -> account change notified over the websocket
+STAGE_BLOCK_TIME = 'block_time'  # send -> blockTime of the slot the transaction landed in
+STAGE_ONCHAIN_CLIENT_SKEW = 'onchain_client_skew'  # on-chain timestamp - client_timestamp of the counter account
+STAGE_SIGNATURE_NOTIFICATION = 'signature_notification'  # send -> signature notified at the commitment level
+STAGE_SLOT_LANDED = 'slot_landed'  # send -> local arrival of the slot the transaction landed in, by the slot clock
+STAGE_SLOT_WS_NOTIFICATION = 'slot_ws_notification'  # send -> local arrival of the slot of the account notification
+STAGES = (STAGE_RPC_ACCEPT, STAGE_CONFIRMED, STAGE_WS_NOTIFICATION, STAGE_BLOCK_TIME, STAGE_ONCHAIN_CLIENT_SKEW,
+    STAGE_SIGNATURE_NOTIFICATION, STAGE_SLOT_LANDED, STAGE_SLOT_WS_NOTIFICATION)
+
+SUMMARY_QUANTILES = (0.5, 0.9, 0.99)
+
+
+class LogHistogram:
+    # Streaming histogram with logarithmic buckets (HDR style) of a fixed memory.
+    #
+    # The bucket boundaries grow by 'precision' (a relative error), a value v falls to the bucket
+    # floor(log(v / lowest) / log(1 + precision)). Values under 'lowest' (zero and negative ones
+    # included) count to the first bucket, values over 'highest' to the last one. Min, max, sum and
+    # count are exact, quantiles are the bucket upper bounds, within 'precision' of the real value,
+    # the first bucket reports the minimum.
+    def __init__(self, lowest: float = 0.0001, highest: float = 3600.0, precision: float = 0.01) -> None:
+        self.lowest: float = lowest
+        self.highest: float = highest
+        self._log_base: float = math.log1p(precision)
+        self.counts: list = [0] * (self._index(highest) + 1)
+        self.count: int = 0
+        self.sum: float = 0.0
+        self.min: float = math.inf
+        self.max: float = -math.inf
+
+    def _index(self, value: float) -> int:
+        if value <= self.lowest:
+            return 0
+        return int(math.log(value / self.lowest) / self._log_base) + 1
+
+    def _upper_bound(self, index: int) -> float:
+        return self.lowest * math.exp(index * self._log_base)
+
+    def record(self, value: float) -> None:
+        self.counts[min(self._index(value), len(self.counts) - 1)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return math.nan
+        rank = max(math.ceil(q * self.count), 1)
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                if index == 0:
+                    return min(self.min, self.lowest)  # zero and negative values are not bucketed further
+                return min(max(self._upper_bound(index), self.min), self.max)
+        return self.max
+
+    def merge(self, other: LogHistogram) -> LogHistogram:
+        if len(other.counts) != len(self.counts):
+            raise ValueError('Cannot merge histograms of different bucket layouts')
+        for index, bucket_count in enumerate(other.counts):
+            self.counts[index] += bucket_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+
+class MetricsRegistry:
+    # Latency histograms of the transaction processing stages labelled by provider and commitment.
+    # Seconds are recorded, the registry is rendered in the Prometheus text format (as summaries)
+    # or as a console summary of p50/p90/p99/max.
+    def __init__(self, name: str = 'counter_txn_latency_seconds') -> None:
+        self.name: str = name
+        self.histograms: dict = {}  # (stage, provider, commitment, shard) -> LogHistogram
+
+    def observe(self, stage: str, provider: str, commitment, seconds: float, shard: int = None) -> None:
+        # shard of the counter data account, only when the counter is sharded
+        key = (stage, provider, str(commitment), '' if shard is None else str(shard))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = LogHistogram()
+        histogram.record(seconds)
+
+    def merge(self, histograms: dict) -> None:
+        # histograms of another registry, e.g., of a load worker process
+        for key, histogram in histograms.items():
+            if key in self.histograms:
+                self.histograms[key].merge(histogram)
+            else:
+                self.histograms[key] = histogram
+
+    def render_prometheus(self) -> str:
+        lines = [
+            f'# HELP {self.name} Latency of the counter transaction processing stages.',
+            f'# TYPE {self.name} summary'
+        ]
+        for (stage, provider, commitment, shard), histogram in sorted(self.histograms.items()):
+            labels = f'stage="{stage}",provider="{provider}",commitment="{commitment}"'
+            if shard:
+                labels += f',shard="{shard}"'
+            for q in SUMMARY_QUANTILES + (1.0,):
+                lines.append(f'{self.name}{{{labels},quantile="{q}"}} {histogram.quantile(q)}')
+            lines.append(f'{self.name}_sum{{{labels}}} {histogram.sum}')
+            lines.append(f'{self.name}_count{{{labels}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def summary_lines(self) -> list:
+        return [
+            f'{stage:>20} [{provider}/{commitment}{f"/shard {shard}" if shard else ""}] count={histogram.count} '
+            + ' '.join(f'p{int(q * 100)}={histogram.quantile(q) * 1000:.1f}ms' for q in SUMMARY_QUANTILES)
+            + f' max={histogram.max * 1000:.1f}ms'
+            for (stage, provider, commitment, shard), histogram in sorted(self.histograms.items())
+        ]
+
+    def print_summary(self) -> None:
+        lines = self.summary_lines()
+        if lines:
+            print('Latency summary:\n' + '\n'.join(lines))
+
+
+METRICS = MetricsRegistry()
+
+
+class MetricsServer:
+    # Local HTTP endpoint serving the registry at /metrics in the Prometheus text format,
+    # with an optional periodic console summary. No port is opened unless one is given.
+    def __init__(self, registry: MetricsRegistry, host: str = '127.0.0.1', port: int = 0,
+            summary_interval: float = 10.0) -> None:
+        self.registry: MetricsRegistry = registry
+        self.host: str = host
+        self.port: int = port
+        self.summary_interval: float = summary_interval
+        self._runner: web.AppRunner = None
+        self._task: asyncio.Task = None
+
+    async def _metrics(self, _request: web.Request) -> web.Response:
+        return web.Response(text=self.registry.render_prometheus(), content_type='text/plain', charset='utf-8')
+
+    async def start(self) -> MetricsServer:
+        if self._runner is None and self.port:
+            app = web.Application()
+            app.router.add_get('/metrics', self._metrics)
+            self._runner = web.AppRunner(app, access_log=None)
+            await self._runner.setup()
+            await web.TCPSite(self._runner, self.host, self.port).start()
+            print(f'Metrics are served at http://{self.host}:{self.port}/metrics')
+        if self._task is None and self.summary_interval:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.summary_interval)
+            self.registry.print_summary()
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        self.registry.print_summary()
+
+    async def __aenter__(self) -> MetricsServer:
+        return await self.start()
+
+    async def __aexit__(self, _exc_type, _exc, _tb) -> None:
+        await self.close()
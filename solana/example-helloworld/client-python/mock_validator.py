@@ -0,0 +1,872 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import random
+import struct
+import time
+
+from argparse import ArgumentParser, Namespace
+from aiohttp import web, WSMsgType
+from solana.keypair import Keypair
+from solana.publickey import PublicKey
+from solana.system_program import SYS_PROGRAM_ID, decode_create_account_with_seed, decode_create_account, decode_transfer
+from solana.transaction import Transaction, TransactionInstruction
+from solders.hash import Hash
+from solders.signature import Signature
+
+import layout
+from confirmation_tracker import COMMITMENT_RANKS
+
+# Local stand-in of solana-test-validator for deterministic load tests of the client.
+#
+# It serves the JSON-RPC methods and websocket subscriptions the client uses with an in-memory
+# state of accounts. Transactions are executed the way the test counter program (processor.rs)
+# and the system program do it: the data account has to be owned by the program and the program
+# has to sign, the counter instruction increments the counter and saves the slot time and the
+# client timestamp, the delete instruction moves the lamports out and purges the account.
+#
+# Slots are produced every 'slot_time' seconds, a 'skip_rate' fraction of the slots is skipped by
+# its leader, it has no block, so the block height falls behind the slot. A sent transaction lands
+# (is processed) after 'latency' +- 'jitter' seconds in the next block, it's confirmed 'confirm_slots'
+# and finalized 'finalize_slots' slots later. A 'drop_rate' fraction of the accepted transactions
+# never lands and requests over the 'rate_limit' per second are refused with HTTP 429. Airdrops are
+# credited immediately. Only the latest (processed) state is kept, reads at any commitment see it.
+#
+# Unless 'skipPreflight' is set the sent transaction is simulated first, like the RPC node does,
+# a failing one is refused with the preflight failure error. With 'skipPreflight' it's accepted and
+# lands with the error, or is dropped by the leader when its blockhash is unknown.
+
+SYSTEM_PROGRAM_ID = str(SYS_PROGRAM_ID)
+BPF_LOADER_ID = 'BPFLoaderUpgradeab1e11111111111111111111111'
+LAMPORTS_PER_SIGNATURE = 5000
+DEFAULT_FUND_LAMPORTS = 1000 * 10**9
+# rent exemption is two years of rent of 3480 lamports per byte-year, with 128 bytes of account overhead
+RENT_EXEMPTION_LAMPORTS_PER_BYTE = 3480 * 2
+ACCOUNT_STORAGE_OVERHEAD = 128
+# a blockhash can be used for 150 blocks
+MAX_PROCESSING_AGE = 150
+# JSON-RPC error codes of the Solana RPC server
+RPC_SEND_TRANSACTION_PREFLIGHT_FAILURE = -32002
+RPC_SLOT_SKIPPED = -32007
+# system program instruction indexes
+SYSTEM_CREATE_ACCOUNT = 0
+SYSTEM_TRANSFER = 2
+SYSTEM_CREATE_ACCOUNT_WITH_SEED = 3
+# custom errors of the test counter program (errors.rs)
+INVALID_INSTRUCTION = 0
+WRONG_COUNTER_CLIENT_TIMESTAMP = 1
+AMOUNT_OVERFLOW = 2
+# counter program instruction types (instructions.rs)
+COUNTER_INSTRUCTION = 1
+DELETE_ACCOUNT_INSTRUCTION = 2
+
+
+def get_args() -> Namespace:
+    parser = ArgumentParser(description="Mock Solana validator serving the counter program for local load tests")
+    parser.add_argument(
+        "--host",
+        type=str,
+        help="Address the JSON-RPC and websocket servers listen at.",
+        default="127.0.0.1"
+    )
+    parser.add_argument(
+        "--rpc-port",
+        type=int,
+        help="Port of the JSON-RPC server.",
+        default=8899
+    )
+    parser.add_argument(
+        "--ws-port",
+        type=int,
+        help="Port of the websocket server.",
+        default=8900
+    )
+    parser.add_argument(
+        "-p",
+        "--program",
+        type=str,
+        action="append",
+        help="Program deployed at the validator, path to the program keypair file or the program pubkey, can be repeated.",
+        default=[]
+    )
+    parser.add_argument(
+        "-f",
+        "--fund",
+        type=str,
+        action="append",
+        help="Account funded at the start, <keypair file or pubkey>[=<lamports>] (default 1000 SOL), can be repeated.",
+        default=[]
+    )
+    parser.add_argument(
+        "--slot-time",
+        type=float,
+        help="Duration of a slot in seconds.",
+        default=0.4
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        help="Seconds from receiving a transaction to processing it.",
+        default=0.4
+    )
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        help="Maximal random deviation in seconds added to or subtracted from the latency.",
+        default=0.1
+    )
+    parser.add_argument(
+        "--confirm-slots",
+        type=int,
+        help="Number of slots from processing a transaction to its confirmation.",
+        default=1
+    )
+    parser.add_argument(
+        "--finalize-slots",
+        type=int,
+        help="Number of slots from processing a transaction to its finalization.",
+        default=32
+    )
+    parser.add_argument(
+        "--drop-rate",
+        type=float,
+        help="Fraction (0-1) of accepted transactions which silently never land.",
+        default=0.0
+    )
+    parser.add_argument(
+        "--skip-rate",
+        type=float,
+        help="Fraction (0-1) of slots skipped by the leader without a block, the block height falls behind the slot.",
+        default=0.05
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        help="Maximum number of JSON-RPC requests per second, over the limit HTTP 429 is returned, 0 for no limit.",
+        default=0
+    )
+    parser.add_argument(
+        "--no-verify-signatures",
+        action="store_true",
+        help="Do not verify signatures of the sent transactions, saves CPU at thousands of TPS.",
+        default=False
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        help="Seed of the random generator of the jitter and the drops, for reproducible runs.",
+        default=None
+    )
+    return parser.parse_args()
+
+
+class RpcError(Exception):
+    def __init__(self, code: int, message: str, data: dict = None) -> None:
+        super().__init__(message)
+        self.code: int = code
+        self.message: str = message
+        self.data: dict = data
+
+    def to_json(self) -> dict:
+        error = {"code": self.code, "message": self.message}
+        if self.data is not None:
+            error["data"] = self.data
+        return error
+
+
+class InstructionError(Exception):
+    def __init__(self, index: int, error) -> None:
+        super().__init__(f'instruction {index} failed: {error}')
+        self.index: int = index
+        self.error = error
+
+    def to_json(self) -> dict:
+        return {"InstructionError": [self.index, self.error]}
+
+
+class MockAccount:
+    __slots__ = ('lamports', 'data', 'owner', 'executable')
+
+    def __init__(self, lamports: int = 0, data: bytes = b'', owner: str = SYSTEM_PROGRAM_ID, executable: bool = False):
+        self.lamports: int = lamports
+        self.data: bytes = data
+        self.owner: str = owner
+        self.executable: bool = executable
+
+    def copy(self) -> MockAccount:
+        return MockAccount(self.lamports, self.data, self.owner, self.executable)
+
+    def to_json(self, data_slice: dict = None) -> dict:
+        data = self.data
+        if data_slice:
+            data = data[data_slice['offset']:data_slice['offset'] + data_slice['length']]
+        return {
+            "data": [base64.b64encode(data).decode(), "base64"],
+            "executable": self.executable,
+            "lamports": self.lamports,
+            "owner": self.owner,
+            "rentEpoch": 0
+        }
+
+
+class LandedTxn:
+    __slots__ = ('signature', 'slot', 'err', 'wire', 'fee', 'logs')
+
+    def __init__(self, signature: str, slot: int, err: dict = None, wire: bytes = None, fee: int = 0, logs: list = None):
+        self.signature: str = signature
+        self.slot: int = slot
+        self.err: dict = err
+        self.wire: bytes = wire
+        self.fee: int = fee
+        self.logs: list = logs if logs else []
+
+
+class RateLimiter:
+    # non-blocking token bucket, a request over the limit is refused instead of waiting
+    def __init__(self, rate: float) -> None:
+        self.rate: float = rate
+        self.tokens: float = max(rate, 1)
+        self.updated_at: float = time.monotonic()
+
+    def allow(self) -> bool:
+        if not self.rate:
+            return True
+        now = time.monotonic()
+        self.tokens = min(max(self.rate, 1), self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class _WsClient:
+    # outgoing messages of one websocket are written by a single task from a queue
+    def __init__(self, ws: web.WebSocketResponse) -> None:
+        self.ws: web.WebSocketResponse = ws
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.subscriptions: set = set()
+        self.task: asyncio.Task = asyncio.get_running_loop().create_task(self._write())
+
+    def send(self, message: dict) -> None:
+        self.queue.put_nowait(json.dumps(message))
+
+    async def _write(self) -> None:
+        while True:
+            message = await self.queue.get()
+            if self.ws.closed:
+                return
+            await self.ws.send_str(message)
+
+
+class MockValidator:
+    def __init__(
+        self,
+        slot_time: float = 0.4,
+        latency: float = 0.4,
+        jitter: float = 0.1,
+        confirm_slots: int = 1,
+        finalize_slots: int = 32,
+        drop_rate: float = 0.0,
+        skip_rate: float = 0.0,
+        rate_limit: float = 0,
+        verify_signatures: bool = True,
+        seed: int = None
+    ) -> None:
+        self.slot_time: float = slot_time
+        self.latency: float = latency
+        self.jitter: float = jitter
+        self.confirm_slots: int = confirm_slots
+        self.finalize_slots: int = max(finalize_slots, confirm_slots)
+        self.drop_rate: float = drop_rate
+        self.skip_rate: float = skip_rate
+        self.rate_limiter: RateLimiter = RateLimiter(rate_limit)
+        self.verify_signatures: bool = verify_signatures
+        self.random: random.Random = random.Random(seed)
+        self.accounts: dict = {}  # pubkey -> MockAccount
+        self.landed: dict = {}  # signature -> LandedTxn
+        self.pending: set = set()  # signatures accepted but not yet landed
+        self.slot: int = 0
+        self.block_height: int = 0
+        self.skipped_slots: set = set()  # slots without a block
+        self.genesis_time: float = time.time()
+        self.blockhashes: dict = {}  # blockhash -> slot, insertion ordered
+        self.blockhash: str = None
+        self.subscriptions: dict = {}  # subscription id -> (_WsClient, method, params)
+        self.account_subscriptions: dict = {}  # pubkey -> set of subscription ids
+        self.signature_subscriptions: dict = {}  # signature -> set of subscription ids
+        self.slot_subscriptions: set = set()
+        self.stats: dict = {'requests': 0, 'rate_limited': 0, 'sent': 0, 'dropped': 0, 'landed': 0, 'failed': 0}
+        self._next_subscription_id: int = 0
+        self._task: asyncio.Task = None
+        self._new_blockhash()
+        self.methods: dict = {
+            'getAccountInfo': self.get_account_info,
+            'getMultipleAccounts': self.get_multiple_accounts,
+            'getProgramAccounts': self.get_program_accounts,
+            'getBalance': self.get_balance,
+            'getMinimumBalanceForRentExemption': self.get_minimum_balance_for_rent_exemption,
+            'requestAirdrop': self.request_airdrop,
+            'getRecentBlockhash': self.get_recent_blockhash,
+            'getLatestBlockhash': self.get_latest_blockhash,
+            'getFees': self.get_fees,
+            'sendTransaction': self.send_transaction,
+            'getTransaction': self.get_transaction,
+            'getSignatureStatuses': self.get_signature_statuses,
+            'getBlockTime': self.get_block_time,
+            'getSlot': lambda params: self.slot,
+            'getBlockHeight': lambda params: self.block_height,
+            'getHealth': lambda params: 'ok',
+            'getVersion': lambda params: {'solana-core': 'mock', 'feature-set': 0},
+        }
+        self.ws_methods: dict = {
+            'accountSubscribe': self.account_subscribe,
+            'signatureSubscribe': self.signature_subscribe,
+            'slotSubscribe': self.slot_subscribe,
+        }
+
+    def add_program(self, program_id: str) -> None:
+        self.accounts[program_id] = MockAccount(1141440, bytes(36), BPF_LOADER_ID, executable=True)
+
+    async def start(self) -> MockValidator:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    # --- slots ---
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.slot_time)
+            self.slot += 1
+            if self.random.random() < self.skip_rate:
+                self.skipped_slots.add(self.slot)
+                continue
+            self.block_height += 1
+            self._new_blockhash()
+            for subscription_id in list(self.slot_subscriptions):
+                self._notify(subscription_id, {"parent": self.slot - 1, "root": max(self.slot - self.finalize_slots, 0), "slot": self.slot})
+
+    def _new_blockhash(self) -> None:
+        self.blockhash = str(Hash(hashlib.sha256(f'mock-validator-slot-{self.slot}'.encode()).digest()))
+        self.blockhashes[self.blockhash] = self.slot
+        while len(self.blockhashes) > MAX_PROCESSING_AGE + 1:
+            del self.blockhashes[next(iter(self.blockhashes))]
+
+    def block_time(self, slot: int) -> int:
+        return int(self.genesis_time + slot * self.slot_time)
+
+    def _slots_to(self, commitment: str) -> int:
+        rank = COMMITMENT_RANKS.get(commitment, COMMITMENT_RANKS['finalized'])
+        if rank >= COMMITMENT_RANKS['finalized']:
+            return self.finalize_slots
+        if rank >= COMMITMENT_RANKS['confirmed']:
+            return self.confirm_slots
+        return 0
+
+    def _confirmation_status(self, landed_slot: int) -> str:
+        age = self.slot - landed_slot
+        if age >= self.finalize_slots:
+            return 'finalized'
+        if age >= self.confirm_slots:
+            return 'confirmed'
+        return 'processed'
+
+    def _context(self) -> dict:
+        return {"slot": self.slot}
+
+    # --- JSON-RPC ---
+
+    def handle_request(self, request: dict) -> dict:
+        request_id = request.get('id') if isinstance(request, dict) else None
+        try:
+            if not isinstance(request, dict) or 'method' not in request:
+                raise RpcError(-32600, 'Invalid request')
+            method = self.methods.get(request['method'])
+            if method is None:
+                raise RpcError(-32601, 'Method not found')
+            return {"jsonrpc": "2.0", "result": method(request.get('params', [])), "id": request_id}
+        except RpcError as e:
+            return {"jsonrpc": "2.0", "error": e.to_json(), "id": request_id}
+        except (IndexError, KeyError, TypeError, ValueError) as e:
+            return {"jsonrpc": "2.0", "error": RpcError(-32602, f'Invalid params: {e}').to_json(), "id": request_id}
+
+    def _config(self, params: list, index: int) -> dict:
+        config = params[index] if len(params) > index and params[index] else {}
+        encoding = config.get('encoding', 'base64')
+        if encoding != 'base64':
+            raise RpcError(-32602, f'Encoding {encoding} is not supported by the mock validator, use base64')
+        return config
+
+    def get_account_info(self, params: list) -> dict:
+        config = self._config(params, 1)
+        account = self.accounts.get(params[0])
+        return {"context": self._context(), "value": account.to_json(config.get('dataSlice')) if account else None}
+
+    def get_multiple_accounts(self, params: list) -> dict:
+        config = self._config(params, 1)
+        return {"context": self._context(), "value": [
+            self.accounts[pubkey].to_json(config.get('dataSlice')) if pubkey in self.accounts else None
+            for pubkey in params[0]
+        ]}
+
+    def get_program_accounts(self, params: list):
+        config = self._config(params, 1)
+        filters = config.get('filters') or []
+        accounts = []
+        for pubkey, account in self.accounts.items():
+            if account.owner != params[0] or not all(self._matches(account, f) for f in filters):
+                continue
+            accounts.append({"pubkey": pubkey, "account": account.to_json(config.get('dataSlice'))})
+        return {"context": self._context(), "value": accounts} if config.get('withContext') else accounts
+
+    @staticmethod
+    def _matches(account: MockAccount, account_filter: dict) -> bool:
+        if 'dataSize' in account_filter:
+            return len(account.data) == account_filter['dataSize']
+        if 'memcmp' in account_filter:
+            memcmp = account_filter['memcmp']
+            expected = bytes(PublicKey(memcmp['bytes'])) if len(memcmp['bytes']) >= 32 else memcmp['bytes'].encode()
+            return account.data[memcmp['offset']:memcmp['offset'] + len(expected)] == expected
+        raise RpcError(-32602, f'Unsupported filter {account_filter}')
+
+    def get_balance(self, params: list) -> dict:
+        account = self.accounts.get(params[0])
+        return {"context": self._context(), "value": account.lamports if account else 0}
+
+    def get_minimum_balance_for_rent_exemption(self, params: list) -> int:
+        return (ACCOUNT_STORAGE_OVERHEAD + int(params[0])) * RENT_EXEMPTION_LAMPORTS_PER_BYTE
+
+    def request_airdrop(self, params: list) -> str:
+        pubkey, lamports = params[0], int(params[1])
+        # the airdrop is credited right away, the client does not wait for it before spending the lamports
+        signature = str(Signature(os.urandom(64)))
+        account = self.accounts.setdefault(pubkey, MockAccount())
+        account.lamports += lamports
+        self._landed(LandedTxn(signature, self.slot), {pubkey})
+        return signature
+
+    def get_recent_blockhash(self, params: list) -> dict:
+        return {"context": self._context(), "value": {
+            "blockhash": self.blockhash, "feeCalculator": {"lamportsPerSignature": LAMPORTS_PER_SIGNATURE}
+        }}
+
+    def get_latest_blockhash(self, params: list) -> dict:
+        return {"context": self._context(), "value": {
+            "blockhash": self.blockhash, "lastValidBlockHeight": self.block_height + MAX_PROCESSING_AGE
+        }}
+
+    def get_fees(self, params: list) -> dict:
+        return {"context": self._context(), "value": {
+            "blockhash": self.blockhash,
+            "feeCalculator": {"lamportsPerSignature": LAMPORTS_PER_SIGNATURE},
+            "lastValidSlot": self.slot + MAX_PROCESSING_AGE,
+            "lastValidBlockHeight": self.block_height + MAX_PROCESSING_AGE
+        }}
+
+    def get_block_time(self, params: list) -> int:
+        if int(params[0]) > self.slot:
+            raise RpcError(-32004, f'Block not available for slot {params[0]}')
+        if int(params[0]) in self.skipped_slots:
+            raise RpcError(RPC_SLOT_SKIPPED, f'Slot {params[0]} was skipped, or missing due to ledger jump to recent snapshot')
+        return self.block_time(int(params[0]))
+
+    def get_signature_statuses(self, params: list) -> dict:
+        statuses = []
+        for signature in params[0]:
+            landed = self.landed.get(signature)
+            if landed is None:
+                statuses.append(None)
+                continue
+            confirmation_status = self._confirmation_status(landed.slot)
+            statuses.append({
+                "slot": landed.slot,
+                "confirmations": None if confirmation_status == 'finalized' else self.slot - landed.slot,
+                "err": landed.err,
+                "status": {"Err": landed.err} if landed.err else {"Ok": None},
+                "confirmationStatus": confirmation_status
+            })
+        return {"context": self._context(), "value": statuses}
+
+    def get_transaction(self, params: list) -> dict:
+        landed = self.landed.get(params[0])
+        if landed is None or landed.wire is None:
+            return None
+        return {
+            "slot": landed.slot,
+            "blockTime": self.block_time(landed.slot),
+            "meta": {
+                "err": landed.err,
+                "fee": landed.fee,
+                "status": {"Err": landed.err} if landed.err else {"Ok": None},
+                "logMessages": landed.logs
+            },
+            "transaction": [base64.b64encode(landed.wire).decode(), "base64"]
+        }
+
+    def send_transaction(self, params: list) -> str:
+        config = params[1] if len(params) > 1 and params[1] else {}
+        if config.get('encoding', 'base58') != 'base64':
+            raise RpcError(-32602, 'Only base64 encoded transactions are supported by the mock validator')
+        wire = base64.b64decode(params[0])
+        try:
+            txn = Transaction.deserialize(wire)
+        except Exception as e:
+            raise RpcError(-32602, f'invalid transaction: {e}')
+        signature = str(txn.signature())
+        if self.verify_signatures and not txn.verify_signatures():
+            raise RpcError(-32003, 'Transaction signature verification failure')
+        fee = LAMPORTS_PER_SIGNATURE * len(txn.signatures)
+        if not config.get('skipPreflight', False):
+            self._preflight(txn, fee)
+        if signature in self.pending or signature in self.landed:
+            return signature  # the same transaction is processed only once
+        self.stats['sent'] += 1
+        if self.random.random() < self.drop_rate:
+            self.stats['dropped'] += 1
+            return signature
+        self.pending.add(signature)
+        asyncio.get_running_loop().call_later(self._delay(), self._land_transaction, signature, txn, wire, fee)
+        return signature
+
+    def _delay(self) -> float:
+        return max(self.latency + self.random.uniform(-self.jitter, self.jitter), 0)
+
+    def _preflight(self, txn: Transaction, fee: int) -> None:
+        # the checks and the simulation of the RPC node before the transaction is forwarded to the leader
+        if str(txn.recent_blockhash) not in self.blockhashes:
+            raise RpcError(RPC_SEND_TRANSACTION_PREFLIGHT_FAILURE, 'Transaction simulation failed: Blockhash not found',
+                {"err": "BlockhashNotFound", "logs": [], "accounts": None})
+        payer = self.accounts.get(str(txn.fee_payer))
+        if payer is None or payer.lamports < fee:
+            raise RpcError(RPC_SEND_TRANSACTION_PREFLIGHT_FAILURE,
+                'Transaction simulation failed: Attempt to debit an account but found no record of a prior credit.',
+                {"err": "AccountNotFound", "logs": [], "accounts": None})
+        touched, backup = self._backup(txn)
+        logs = []
+        try:
+            for index, instruction in enumerate(txn.instructions):
+                self._execute(index, instruction, logs)
+        except InstructionError as e:
+            raise RpcError(RPC_SEND_TRANSACTION_PREFLIGHT_FAILURE,
+                f'Transaction simulation failed: Error processing Instruction {e.index}: {e.error}',
+                {"err": e.to_json(), "logs": logs, "accounts": None})
+        finally:
+            self._restore(touched, backup)
+
+    # --- execution ---
+
+    def _backup(self, txn: Transaction) -> tuple:
+        touched = {str(meta.pubkey) for instruction in txn.instructions for meta in instruction.keys}
+        return touched, {pubkey: self.accounts[pubkey].copy() for pubkey in touched if pubkey in self.accounts}
+
+    def _restore(self, touched: set, backup: dict) -> None:
+        for pubkey in touched:
+            if pubkey in backup:
+                self.accounts[pubkey] = backup[pubkey]
+            else:
+                self.accounts.pop(pubkey, None)
+
+    def _land_transaction(self, signature: str, txn: Transaction, wire: bytes, fee: int) -> None:
+        if self.slot in self.skipped_slots:
+            # no block in the slot, the transaction waits for the next leader
+            asyncio.get_running_loop().call_later(self.slot_time, self._land_transaction, signature, txn, wire, fee)
+            return
+        self.pending.discard(signature)
+        if str(txn.recent_blockhash) not in self.blockhashes:
+            return  # the blockhash is unknown or expired, the leader drops the transaction
+        payer = self.accounts.get(str(txn.fee_payer))
+        if payer is None or payer.lamports < fee:
+            return  # the fee cannot be paid anymore, the transaction is dropped
+        touched, backup = self._backup(txn)
+        logs = []
+        err = None
+        try:
+            for index, instruction in enumerate(txn.instructions):
+                self._execute(index, instruction, logs)
+        except InstructionError as e:
+            err = e.to_json()
+            # the transaction is atomic, only the fee is charged on failure
+            self._restore(touched, backup)
+            touched = set()
+            # the rollback put the backup copy of the payer in place, the fee goes to that one
+            payer = self.accounts[str(txn.fee_payer)]
+        payer.lamports -= fee
+        self.stats['failed' if err else 'landed'] += 1
+        self._landed(LandedTxn(signature, self.slot, err, wire, fee, logs), touched | {str(txn.fee_payer)})
+
+    def _landed(self, landed: LandedTxn, changed_pubkeys: set) -> None:
+        self.landed[landed.signature] = landed
+        for subscription_id in list(self.signature_subscriptions.get(landed.signature, ())):
+            self._notify_at_commitment(subscription_id, {"context": {"slot": landed.slot}, "value": {"err": landed.err}})
+        for pubkey in changed_pubkeys:
+            subscription_ids = self.account_subscriptions.get(pubkey)
+            if not subscription_ids:
+                continue
+            # the account state of the slot is sent even when the notification waits for the commitment
+            account = self.accounts.get(pubkey)
+            result = {"context": {"slot": landed.slot}, "value": (account if account else MockAccount()).to_json()}
+            for subscription_id in list(subscription_ids):
+                self._notify_at_commitment(subscription_id, result)
+
+    def _execute(self, index: int, instruction: TransactionInstruction, logs: list) -> None:
+        program_id = str(instruction.program_id)
+        logs.append(f'Program {program_id} invoke [1]')
+        if program_id == SYSTEM_PROGRAM_ID:
+            self._execute_system(index, instruction)
+        else:
+            program = self.accounts.get(program_id)
+            if program is None or not program.executable:
+                raise InstructionError(index, 'InvalidProgramForExecution')
+            self._execute_counter_program(index, program_id, instruction, logs)
+        logs.append(f'Program {program_id} success')
+
+    def _debit(self, index: int, pubkey: str, lamports: int) -> None:
+        account = self.accounts.get(pubkey)
+        if account is None or account.lamports < lamports:
+            raise InstructionError(index, {"Custom": 1})  # SystemError::ResultWithNegativeLamports
+        account.lamports -= lamports
+
+    def _execute_system(self, index: int, instruction: TransactionInstruction) -> None:
+        instruction_type = struct.unpack_from('<I', instruction.data)[0]
+        if instruction_type in (SYSTEM_CREATE_ACCOUNT, SYSTEM_CREATE_ACCOUNT_WITH_SEED):
+            if instruction_type == SYSTEM_CREATE_ACCOUNT:
+                params = decode_create_account(instruction)
+            else:
+                params = decode_create_account_with_seed(instruction)
+            new_pubkey = str(params.new_account_pubkey)
+            if new_pubkey in self.accounts and (self.accounts[new_pubkey].data or self.accounts[new_pubkey].owner != SYSTEM_PROGRAM_ID):
+                raise InstructionError(index, {"Custom": 0})  # SystemError::AccountAlreadyInUse
+            self._debit(index, str(params.from_pubkey), params.lamports)
+            account = self.accounts.setdefault(new_pubkey, MockAccount())
+            account.lamports += params.lamports
+            account.data = bytes(params.space)
+            account.owner = str(params.program_id)
+        elif instruction_type == SYSTEM_TRANSFER:
+            params = decode_transfer(instruction)
+            source = self.accounts.get(str(params.from_pubkey))
+            if source is not None and source.owner != SYSTEM_PROGRAM_ID:
+                # the system program can transfer only from accounts it owns
+                raise InstructionError(index, 'ExternalAccountLamportSpend')
+            self._debit(index, str(params.from_pubkey), params.lamports)
+            self.accounts.setdefault(str(params.to_pubkey), MockAccount()).lamports += params.lamports
+        else:
+            raise InstructionError(index, 'InvalidInstructionData')
+
+    def _execute_counter_program(self, index: int, program_id: str, instruction: TransactionInstruction, logs: list) -> None:
+        # Processor::process of processor.rs
+        keys = instruction.keys
+        if len(keys) < 2:
+            raise InstructionError(index, 'NotEnoughAccountKeys')
+        data_pubkey = str(keys[0].pubkey)
+        data_account = self.accounts.get(data_pubkey)
+        logs.append(f'Program log: Program id: {program_id}, data account: {data_pubkey}')
+        if data_account is None or data_account.owner != program_id:
+            raise InstructionError(index, 'IncorrectProgramId')
+        if data_account.owner != str(keys[1].pubkey) or not keys[1].is_signer:
+            raise InstructionError(index, 'IllegalOwner')
+        instruction_type, rest = (instruction.data[0], instruction.data[1:]) if instruction.data else (0, b'')
+        if instruction_type == COUNTER_INSTRUCTION:
+            if len(rest) != 8:
+                raise InstructionError(index, {"Custom": WRONG_COUNTER_CLIENT_TIMESTAMP})
+            if len(data_account.data) < layout.COUNTER_ACCOUNT_SIZE:
+                raise InstructionError(index, 'InvalidAccountData')
+            counter_account = layout.decode_counter_account(data_account.data)
+            counter = (counter_account.counter + 1) & 0xFFFFFFFF
+            timestamp = self.block_time(self.slot)
+            client_timestamp = struct.unpack('<q', rest)[0]
+            data_account.data = (layout.encode_counter_account(counter, timestamp, client_timestamp)
+                + data_account.data[layout.COUNTER_ACCOUNT_SIZE:])
+            logs.append(f'Program log: Counter increased {counter} time(s), date: {timestamp}, client date: {client_timestamp}')
+        elif instruction_type == DELETE_ACCOUNT_INSTRUCTION:
+            if len(keys) < 3:
+                raise InstructionError(index, 'NotEnoughAccountKeys')
+            self.accounts.setdefault(str(keys[2].pubkey), MockAccount()).lamports += data_account.lamports
+            # no lamports and no data, the account is purged
+            del self.accounts[data_pubkey]
+            logs.append('Program log: Closing data account')
+        else:
+            raise InstructionError(index, {"Custom": INVALID_INSTRUCTION})
+
+    # --- websocket ---
+
+    def _notify(self, subscription_id: int, result: dict) -> None:
+        subscription = self.subscriptions.get(subscription_id)
+        if subscription is None:
+            return
+        client, method, _ = subscription
+        client.send({
+            "jsonrpc": "2.0",
+            "method": method.replace('Subscribe', 'Notification'),
+            "params": {"result": result, "subscription": subscription_id}
+        })
+        if method == 'signatureSubscribe':
+            self._unsubscribe(subscription_id)
+
+    def _notify_at_commitment(self, subscription_id: int, result: dict) -> None:
+        _, _, params = self.subscriptions[subscription_id]
+        config = params[1] if len(params) > 1 and params[1] else {}
+        slots = self._slots_to(config.get('commitment', 'finalized'))
+        if slots:
+            asyncio.get_running_loop().call_later(slots * self.slot_time, self._notify, subscription_id, result)
+        else:
+            self._notify(subscription_id, result)
+
+    def _subscribe(self, client: _WsClient, method: str, params: list) -> int:
+        self._next_subscription_id += 1
+        subscription_id = self._next_subscription_id
+        self.subscriptions[subscription_id] = (client, method, params)
+        client.subscriptions.add(subscription_id)
+        return subscription_id
+
+    def account_subscribe(self, client: _WsClient, params: list) -> int:
+        subscription_id = self._subscribe(client, 'accountSubscribe', params)
+        self.account_subscriptions.setdefault(params[0], set()).add(subscription_id)
+        return subscription_id
+
+    def signature_subscribe(self, client: _WsClient, params: list) -> int:
+        subscription_id = self._subscribe(client, 'signatureSubscribe', params)
+        self.signature_subscriptions.setdefault(params[0], set()).add(subscription_id)
+        landed = self.landed.get(params[0])
+        if landed is not None:
+            # already landed, notified when (or right away if) it reaches the commitment
+            config = params[1] if len(params) > 1 and params[1] else {}
+            slots_left = self._slots_to(config.get('commitment', 'finalized')) - (self.slot - landed.slot)
+            result = {"context": {"slot": landed.slot}, "value": {"err": landed.err}}
+            asyncio.get_running_loop().call_later(max(slots_left, 0) * self.slot_time, self._notify, subscription_id, result)
+        return subscription_id
+
+    def slot_subscribe(self, client: _WsClient, params: list) -> int:
+        subscription_id = self._subscribe(client, 'slotSubscribe', params)
+        self.slot_subscriptions.add(subscription_id)
+        return subscription_id
+
+    def _unsubscribe(self, subscription_id: int) -> bool:
+        subscription = self.subscriptions.pop(subscription_id, None)
+        if subscription is None:
+            return False
+        client, method, params = subscription
+        client.subscriptions.discard(subscription_id)
+        if method == 'accountSubscribe':
+            self.account_subscriptions.get(params[0], set()).discard(subscription_id)
+        elif method == 'signatureSubscribe':
+            self.signature_subscriptions.get(params[0], set()).discard(subscription_id)
+        else:
+            self.slot_subscriptions.discard(subscription_id)
+        return True
+
+    def handle_ws_request(self, client: _WsClient, request: dict) -> dict:
+        request_id = request.get('id')
+        method = request.get('method', '')
+        params = request.get('params', [])
+        if method in self.ws_methods:
+            return {"jsonrpc": "2.0", "result": self.ws_methods[method](client, params), "id": request_id}
+        if method.endswith('Unsubscribe'):
+            if not self._unsubscribe(params[0]):
+                return {"jsonrpc": "2.0", "error": RpcError(-32602, 'Invalid subscription id.').to_json(), "id": request_id}
+            return {"jsonrpc": "2.0", "result": True, "id": request_id}
+        return {"jsonrpc": "2.0", "error": RpcError(-32601, 'Method not found').to_json(), "id": request_id}
+
+    # --- HTTP ---
+
+    async def rpc_handler(self, request: web.Request) -> web.StreamResponse:
+        if request.headers.get('Upgrade', '').lower() == 'websocket':
+            return await self.ws_handler(request)
+        self.stats['requests'] += 1
+        if not self.rate_limiter.allow():
+            self.stats['rate_limited'] += 1
+            return web.json_response({"jsonrpc": "2.0", "error": {"code": 429, "message": "Too many requests"}, "id": None}, status=429)
+        try:
+            body = json.loads(await request.read())
+        except ValueError:
+            return web.json_response({"jsonrpc": "2.0", "error": RpcError(-32700, 'Parse error').to_json(), "id": None})
+        if isinstance(body, list):  # batch request
+            return web.json_response([self.handle_request(item) for item in body])
+        return web.json_response(self.handle_request(body))
+
+    async def ws_handler(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        client = _WsClient(ws)
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                try:
+                    client.send(self.handle_ws_request(client, json.loads(msg.data)))
+                except (ValueError, IndexError, TypeError) as e:
+                    client.send({"jsonrpc": "2.0", "error": RpcError(-32600, f'Invalid request: {e}').to_json(), "id": None})
+        finally:
+            for subscription_id in list(client.subscriptions):
+                self._unsubscribe(subscription_id)
+            client.task.cancel()
+        return ws
+
+    def print_stats(self) -> None:
+        print(f'Mock validator slot {self.slot}: {self.stats}, {len(self.subscriptions)} subscriptions')
+
+
+def load_pubkey(keypair_file_or_pubkey: str) -> str:
+    if os.path.isfile(keypair_file_or_pubkey):
+        with open(keypair_file_or_pubkey) as key_file:
+            return str(Keypair.from_secret_key(bytes(bytearray(json.load(key_file)))).public_key)
+    return str(PublicKey(keypair_file_or_pubkey))
+
+
+async def serve(args: Namespace) -> None:
+    validator = MockValidator(
+        slot_time=args.slot_time,
+        latency=args.latency,
+        jitter=args.jitter,
+        confirm_slots=args.confirm_slots,
+        finalize_slots=args.finalize_slots,
+        drop_rate=args.drop_rate,
+        skip_rate=args.skip_rate,
+        rate_limit=args.rate_limit,
+        verify_signatures=not args.no_verify_signatures,
+        seed=args.seed
+    )
+    for program in args.program:
+        validator.add_program(load_pubkey(program))
+    for fund in args.fund:
+        account, _, lamports = fund.partition('=')
+        validator.accounts[load_pubkey(account)] = MockAccount(int(lamports) if lamports else DEFAULT_FUND_LAMPORTS)
+    app = web.Application(client_max_size=10 * 1024 * 1024)
+    app.router.add_post('/', validator.rpc_handler)
+    app.router.add_get('/', validator.ws_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, args.host, args.rpc_port).start()
+    await web.TCPSite(runner, args.host, args.ws_port).start()
+    await validator.start()
+    print(f'Mock validator listening at http://{args.host}:{args.rpc_port} and ws://{args.host}:{args.ws_port}, '
+        f'programs: {list(args.program)}')
+    try:
+        while True:
+            await asyncio.sleep(10)
+            validator.print_stats()
+    finally:
+        await validator.close()
+        await runner.cleanup()
+
+
+def main():
+    args = get_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
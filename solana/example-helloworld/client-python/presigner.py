@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, date
+from solana.blockhash import Blockhash
+from solana.keypair import Keypair
+from solana.publickey import PublicKey
+
+from blockhash_cache import RecentBlockhashCache
+from shards import ShardSelector
+from transactions import get_counter_txn, get_txn_nonce_key
+
+# keypairs restored from the secret keys, cached per worker (thread or process)
+_keypairs: dict = {}
+
+
+def _get_keypair(secret_key: bytes) -> Keypair:
+    if secret_key not in _keypairs:
+        _keypairs[secret_key] = Keypair.from_secret_key(secret_key)
+    return _keypairs[secret_key]
+
+
+def presign_counter_txn(
+    payer_secret_key: bytes,
+    program_secret_key: bytes,
+    program_data_key: str,
+    client_time: date,
+    recent_blockhash: str
+) -> tuple[bytes, str]:
+    # Executed in the pool, the arguments are plain values to be picklable for a process pool.
+    payer = _get_keypair(payer_secret_key)
+    program = _get_keypair(program_secret_key)
+    txn = get_counter_txn(
+        public_key=payer.public_key,
+        program_key=program.public_key,
+        program_data_key=PublicKey(program_data_key),
+        client_time=client_time,
+        recent_blockhash=Blockhash(recent_blockhash),
+        nonce_key=get_txn_nonce_key()
+    )
+    txn.sign(payer, program)
+    return txn.serialize(), str(txn.signature())
+
+
+class PresignedTxn:
+    __slots__ = ('wire', 'txn_id', 'client_time', 'recent_blockhash', 'shard', 'signed_at')
+
+    def __init__(self, wire: bytes, txn_id: str, client_time: date, recent_blockhash: Blockhash, shard: int = 0):
+        self.wire: bytes = wire
+        self.txn_id: str = txn_id
+        self.client_time: date = client_time
+        self.recent_blockhash: Blockhash = recent_blockhash
+        self.shard: int = shard  # index of the data account the transaction writes to
+        self.signed_at: float = time.monotonic()
+
+    def age(self) -> float:
+        return time.monotonic() - self.signed_at
+
+
+def get_presign_executor(workers: int, processes: bool = False) -> Executor:
+    return ProcessPoolExecutor(max_workers=workers) if processes else ThreadPoolExecutor(max_workers=workers)
+
+
+class PresignedTxnPipeline:
+    # Producer stage building, signing (payer and program keypair) and serializing counter transactions
+    # ahead of time in a thread or process pool, off the event loop. Ready-to-send wire bytes wait
+    # in bounded queues, the send path takes them with 'get' and submits them with send_raw_transaction.
+    #
+    # A presigned transaction carries the client time (the on-chain client_timestamp) of the moment it
+    # was signed. Transactions older than 'max_age' or signed with a blockhash the cluster refused
+    # are dropped instead of being sent.
+    #
+    # With more data account shards every shard has its own queue, the workers sign for the shard
+    # with the fewest transactions queued. The shard is picked by the ShardSelector at 'get', i.e.,
+    # at the send time, so its strategy (e.g., least-in-flight) sees the transactions in flight.
+    def __init__(
+        self,
+        keypair: Keypair,
+        program_keypair: Keypair,
+        shard_selector: ShardSelector,
+        blockhash_cache: RecentBlockhashCache,
+        executor: Executor,
+        workers: int = 2,
+        queue_size: int = 64,
+        max_age: float = 20.0
+    ) -> None:
+        self.payer_secret_key: bytes = bytes(keypair.secret_key)
+        self.program_secret_key: bytes = bytes(program_keypair.secret_key)
+        self.shard_selector: ShardSelector = shard_selector
+        self.program_data_keys: list = [str(pubkey) for pubkey in shard_selector.pubkeys]
+        self.blockhash_cache: RecentBlockhashCache = blockhash_cache
+        self.executor: Executor = executor
+        self.workers: int = workers
+        self.max_age: float = max_age
+        shards = len(self.program_data_keys)
+        self.queues: list = [asyncio.Queue(maxsize=max(queue_size // shards, 1)) for _ in range(shards)]
+        self._signing: list = [0] * shards  # transactions being signed for the shard, not queued yet
+        self.dropped: int = 0
+        self._refused_blockhashes: set = set()
+        self._tasks: list = []
+
+    async def start(self) -> PresignedTxnPipeline:
+        if not self._tasks:
+            loop = asyncio.get_running_loop()
+            self._tasks = [loop.create_task(self._produce()) for _ in range(self.workers)]
+        return self
+
+    async def _produce(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                recent_blockhash = await self.blockhash_cache.get_or_refresh()
+                client_time = datetime.utcnow()
+                shard = min(range(len(self.queues)), key=lambda s: self.queues[s].qsize() + self._signing[s])
+                self._signing[shard] += 1
+                try:
+                    wire, txn_id = await loop.run_in_executor(
+                        self.executor, presign_counter_txn,
+                        self.payer_secret_key, self.program_secret_key, self.program_data_keys[shard], client_time,
+                        str(recent_blockhash)
+                    )
+                finally:
+                    self._signing[shard] -= 1
+            except Exception as e:
+                print(f'ERROR: cannot presign counter transaction: {e}')
+                await asyncio.sleep(1)
+                continue
+            await self.queues[shard].put(PresignedTxn(wire, txn_id, client_time, recent_blockhash, shard))
+
+    def refuse_blockhash(self, blockhash: Blockhash) -> None:
+        # transactions signed with the blockhash are not going to be accepted, they are dropped on 'get'
+        self._refused_blockhashes.add(str(blockhash))
+
+    async def get(self) -> PresignedTxn:
+        shard = self.shard_selector.select()
+        while True:
+            presigned: PresignedTxn = await self.queues[shard].get()
+            if presigned.age() <= self.max_age and str(presigned.recent_blockhash) not in self._refused_blockhashes:
+                return presigned
+            self.dropped += 1
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # waiting for the workers to finish is blocking, it's done off the event loop
+        await asyncio.get_running_loop().run_in_executor(
+            None, lambda: self.executor.shutdown(wait=True, cancel_futures=True)
+        )
+
+    async def __aenter__(self) -> PresignedTxnPipeline:
+        return await self.start()
+
+    async def __aexit__(self, _exc_type, _exc, _tb) -> None:
+        await self.close()
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, date
+
+from correlation import correlation_key, join_key
+
+# What the live client (hello_client.py) and the offline analysis (capture_analyzer.py) know about
+# a counter transaction, kept apart from the client so that the analysis does not import all of it.
+
+# provider of the --url/--ws endpoints, named providers are defined with --provider
+DEFAULT_PROVIDER = "onering"
+
+
+class TransactionProcessingData:
+    __slots__ = ('processing_data_updated', 'client_time', 'provider', 'started_at', 'finished_at', 'txn_id',
+        'blockchain_time', 'blockchain_counter', 'ws_time', 'txnblock_time', 'processed_at', 'processed_slot',
+        'confirmed_at', 'confirmed_slot', 'finalized_at', 'finalized_slot', 'stages_pending', 'shard', 'send_attempts', 'sent_slot', 'landed_slot',
+        'ws_slot', 'send_id', '_id')
+
+    def __init__(self, client_time, provider,
+            started_at = None,
+            finished_at = None,
+            txn_id = None,
+            ws_time = None,
+            txnblock_time = None,
+            blockchain_time = None,
+            blockchain_counter = None,
+            processed_at = None,
+            processed_slot = None,
+            confirmed_at = None,
+            confirmed_slot = None,
+            finalized_at = None,
+            finalized_slot = None,
+            stages_pending = None,
+            shard = None,
+            send_attempts = None,
+            sent_slot = None,
+            landed_slot = None,
+            ws_slot = None,
+            send_id = None):
+        self.processing_data_updated: date = datetime.utcnow()
+        # identity definition
+        self.client_time: date = client_time
+        self.provider: str = provider
+        # transfer data
+        self.started_at: date = started_at
+        self.finished_at: date = finished_at
+        self.txn_id: str = txn_id
+        self.blockchain_time = blockchain_time
+        self.blockchain_counter = blockchain_counter
+        self.ws_time = ws_time
+        self.txnblock_time = txnblock_time
+        # arrival at the commitment levels (signature notifications) and the slot of each
+        self.processed_at: date = processed_at
+        self.processed_slot: int = processed_slot
+        self.confirmed_at: date = confirmed_at
+        self.confirmed_slot: int = confirmed_slot
+        self.finalized_at: date = finalized_at
+        self.finalized_slot: int = finalized_slot
+        # True while the stages are tracked, False when done, None when the record does not know
+        self.stages_pending: bool = stages_pending
+        self.shard: int = shard  # data account shard, None when the counter is not sharded
+        self.send_attempts: int = send_attempts  # times the transaction was sent, None when not rebroadcast
+        # the slot (fractional, by the slot clock) at the send, the slot the transaction landed in
+        # and the context slot of the account notification
+        self.sent_slot: float = sent_slot
+        self.landed_slot: int = landed_slot
+        self.ws_slot: int = ws_slot
+        self.send_id: int = send_id  # id of the send, None for a record of the websocket side
+        self._id: int = correlation_key(send_id, provider) if send_id is not None else None
+
+    # Identity of the processing data that is used as key in shared dictionary
+    # that's used to gather all data about transaction all around the different asyncio tasks
+    # and it's used for purpose to know if we do merge two same data records.
+    #
+    # The sender side (send, confirmation, stages) knows the id of the send, the identity is an integer
+    # of the send id and the interned provider, computed once. A websocket notification does not know
+    # the send, its identity is None and it's joined to the send by the join_key.
+    def id(self) -> int:
+        return self._id
+
+    # The client_time is saved on-chain with seconds precision only, the notification is joined
+    # by the client_time seconds (and provider and shard) to a send record that knows the same.
+    # A record of the sender side is joinable once it knows the send, the stages alone are not.
+    def join_key(self) -> tuple:
+        if self._id is not None and not self.started_at:
+            return None
+        return join_key(self.client_time, self.provider, self.shard)
+
+    # the record has got data from both the counter (send) and the websocket side
+    # and the commitment stages, when tracked, are known
+    def is_complete(self) -> bool:
+        return bool(self.started_at and self.blockchain_counter) and not self.stages_pending
+
+    def merge(self, new_data: TransactionProcessingData) -> TransactionProcessingData:
+        if new_data.id() is not None and new_data != self:
+            print(f'Cannot merge {new_data} with {self} as they are not identical to provider and send')
+        self.processing_data_updated = datetime.utcnow()
+        if new_data.started_at:
+            self.started_at = new_data.started_at
+        if new_data.finished_at:
+            self.finished_at = new_data.finished_at
+        if new_data.txn_id:
+            self.txn_id = new_data.txn_id
+        if new_data.blockchain_time:
+            self.blockchain_time = new_data.blockchain_time
+        if new_data.blockchain_counter:
+            self.blockchain_counter = new_data.blockchain_counter
+        if new_data.ws_time:
+            self.ws_time = new_data.ws_time
+        if new_data.txnblock_time:
+            self.txnblock_time = new_data.txnblock_time
+        if new_data.shard is not None:
+            self.shard = new_data.shard
+        if new_data.send_attempts is not None:
+            self.send_attempts = new_data.send_attempts
+        for slot in ('sent_slot', 'landed_slot', 'ws_slot'):
+            if getattr(new_data, slot) is not None:
+                setattr(self, slot, getattr(new_data, slot))
+        for stage in ('processed', 'confirmed', 'finalized'):
+            if getattr(new_data, f'{stage}_at'):
+                setattr(self, f'{stage}_at', getattr(new_data, f'{stage}_at'))
+                setattr(self, f'{stage}_slot', getattr(new_data, f'{stage}_slot'))
+        # the stages may be reported before the sender record, once done they stay done
+        if new_data.stages_pending is not None and self.stages_pending is not False:
+            self.stages_pending = new_data.stages_pending
+        return self
+
+    # we define the equality based on the send id plus provider which is different to different subscriptions
+    def __eq__(self, other: TransactionProcessingData):
+        return self.id() == other.id()
+
+    # deliberately not hashable: the records of the websocket side have no id and so all are equal,
+    # the store keys the records by their correlation key instead of holding them in sets
+    __hash__ = None
+
+    def __str__ (self):
+        return (f'TransactionProcessingData(processing_data_update={self.processing_data_updated},'
+            f' client_time={self.client_time}, provider={self.provider}, '
+            f'started_at={self.started_at}, finished_at={self.finished_at}, txn_id={self.txn_id}, '
+            f'blockchain_time={self.blockchain_time}, blockchain_counter={self.blockchain_counter}, '
+            f'processed_at={self.processed_at}@{self.processed_slot}, confirmed_at={self.confirmed_at}@{self.confirmed_slot}, '
+            f'finalized_at={self.finalized_at}@{self.finalized_slot}, '
+            f'slots sent/landed/ws={self.sent_slot}/{self.landed_slot}/{self.ws_slot})'
+        )
+
+
+def delta_time(time_start_at: datetime, time_finished_at = None) -> float:
+    if not time_finished_at:
+        time_finished_at = datetime.utcnow()
+    # print(f'DEBUG: {type(time_start_at)}:{time_start_at}, {type(time_finished_at)}:{time_finished_at}')
+    time_delta: timedelta = time_finished_at - time_start_at
+    # total_seconds() counts the days too, a negative delta is -1 day + seconds in timedelta
+    return time_delta.total_seconds()
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import asyncio
+
+from datetime import datetime, date
+from solana.rpc.async_api import AsyncClient
+from solana.rpc.core import RPCException
+from solana.rpc.types import TxOpts
+
+from confirmation_tracker import ConfirmationResult
+
+# how many client timestamps of websocket notifications are remembered to find the first provider
+MAX_WS_NOTIFIED = 10000
+
+
+class Provider:
+    __slots__ = ('name', 'url', 'ws')
+
+    def __init__(self, name: str, url: str, ws: str = None):
+        self.name: str = name
+        self.url: str = url
+        self.ws: str = ws
+
+    def __str__(self):
+        return f'Provider(name={self.name}, url={self.url}, ws={self.ws})'
+
+
+def parse_providers(provider_args: list) -> list:
+    # format <name>=<rpc url>[,<ws url>]
+    providers = []
+    for provider_arg in provider_args:
+        name, _, urls = provider_arg.partition('=')
+        url, _, ws = urls.partition(',')
+        if not name or not url:
+            raise ValueError(f'Expected provider in format <name>=<rpc url>[,<ws url>] but got {provider_arg}')
+        if name in [provider.name for provider in providers]:
+            raise ValueError(f'Provider {name} is defined more than once')
+        providers.append(Provider(name, url, ws if ws else None))
+    return providers
+
+
+class ProviderAttempt:
+    # what a single provider did with the raced transaction, None for what did not happen
+    __slots__ = ('provider', 'accepted_at', 'error', 'confirmation')
+
+    def __init__(self, provider: str):
+        self.provider: str = provider
+        self.accepted_at: date = None
+        self.error: Exception = None
+        self.confirmation: ConfirmationResult = None
+
+    def confirmed_at(self) -> date:
+        if self.confirmation is None or not self.confirmation.is_confirmed():
+            return None
+        return self.confirmation.confirmed_at
+
+
+class ProviderRace:
+    # The same signed transaction broadcast to all the providers concurrently.
+    #
+    # Every provider has its own client (pooled by the RpcSession) and its own confirmation tracker
+    # polling the provider for the signature, so accepts and confirmations are measured per provider
+    # and correlated by the signature. 'wins' counts how many times the provider was the first one,
+    # websocket notifications are correlated by the counter account client timestamp.
+    def __init__(self, clients: dict, trackers: dict, opts: TxOpts = None) -> None:
+        self.clients: dict = clients  # provider name -> AsyncClient
+        self.trackers: dict = trackers  # provider name -> ConfirmationTracker
+        self.opts: TxOpts = opts
+        self.wins: dict = {stage: {name: 0 for name in clients} for stage in ('accept', 'confirm', 'ws')}
+        self._ws_notified: dict = {}  # client timestamp -> None, insertion ordered to drop the oldest
+
+    async def _send(self, name: str, client: AsyncClient, wire: bytes) -> ProviderAttempt:
+        attempt = ProviderAttempt(name)
+        try:
+            response = await client.send_raw_transaction(wire, opts=self.opts)
+            if 'result' in response:
+                attempt.accepted_at = datetime.utcnow()
+            else:
+                attempt.error = RPCException(response.get('error', response))
+        except Exception as e:
+            attempt.error = e
+        return attempt
+
+    async def broadcast(self, wire: bytes) -> dict:
+        attempts = await asyncio.gather(*[self._send(name, client, wire) for name, client in self.clients.items()])
+        attempts = {attempt.provider: attempt for attempt in attempts}
+        self._win('accept', {name: attempt.accepted_at for name, attempt in attempts.items()})
+        return attempts
+
+    async def confirm(self, txn_id: str, attempts: dict) -> dict:
+        names = list(attempts)
+        confirmations = await asyncio.gather(*[self.trackers[name].track(txn_id) for name in names])
+        for name, confirmation in zip(names, confirmations):
+            attempts[name].confirmation = confirmation
+        self._win('confirm', {name: attempt.confirmed_at() for name, attempt in attempts.items()})
+        return attempts
+
+    def ws_notified(self, client_timestamp: int, provider: str) -> None:
+        if client_timestamp in self._ws_notified:
+            return
+        self._ws_notified[client_timestamp] = None
+        self.wins['ws'][provider] = self.wins['ws'].get(provider, 0) + 1
+        if len(self._ws_notified) > MAX_WS_NOTIFIED:
+            del self._ws_notified[next(iter(self._ws_notified))]
+
+    def _win(self, stage: str, times: dict) -> None:
+        times = {name: at for name, at in times.items() if at is not None}
+        if times:
+            self.wins[stage][min(times, key=times.get)] += 1
+
+    def print_wins(self) -> None:
+        for stage, wins in self.wins.items():
+            total = sum(wins.values())
+            print(f'First to {stage}: ' + ', '.join(
+                f'{name} {count} ({count / total * 100 if total else 0:.1f}%)' for name, count in wins.items()
+            ))
+
+    async def close(self) -> None:
+        await asyncio.gather(*[tracker.close() for tracker in self.trackers.values()])
+
+    async def __aenter__(self) -> ProviderRace:
+        return self
+
+    async def __aexit__(self, _exc_type, _exc, _tb) -> None:
+        await self.close()
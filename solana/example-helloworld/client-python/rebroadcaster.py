@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+from typing import Callable
+from solana.rpc.async_api import AsyncClient
+from solana.rpc.types import TxOpts
+from solana.transaction import Transaction
+
+from blockhash_cache import CachedBlockhash, RecentBlockhashCache, is_blockhash_not_found
+from confirmation_tracker import ConfirmationTracker, ConfirmationResult
+
+# no simulation round trip on the RPC node, the signed bytes go right to the leader
+REBROADCAST_OPTS = TxOpts(skip_preflight=True, skip_confirmation=True)
+
+
+class Broadcast:
+    # One transaction being rebroadcast, the signature changes when it is signed again with a new blockhash
+    def __init__(self, txn_id: str) -> None:
+        self.txn_id: str = txn_id  # signature of the first send, the key of the broadcast
+        self.signatures: list = [txn_id]
+        self.sends: int = 0
+        self.resigns: int = 0
+        self.result: asyncio.Task = None  # -> ConfirmationResult
+
+    def __str__(self):
+        return f'Broadcast(txn_id={self.txn_id}, signatures={len(self.signatures)}, sends={self.sends}, resigns={self.resigns})'
+
+
+class Rebroadcaster:
+    # Sends signed counter transactions until they land or expire.
+    #
+    # The wire bytes are submitted with skipped preflight and sent again every 'interval' seconds
+    # until the confirmation tracker sees the signature at its commitment. When the block height
+    # passes the last valid block height of the blockhash (or the cluster does not know the blockhash)
+    # the transaction is signed again with a fresh blockhash, up to 'max_resigns' times; all its
+    # signatures are tracked, any of them may land, the others are not tracked anymore once one lands.
+    # Gives up after 'timeout' seconds.
+    # 'on_resign(txn_id, new_txn_id)' is told about every new signature, e.g., for the stage tracking.
+    # Used in place of the ConfirmationTracker: 'track' resolves with the ConfirmationResult
+    # of the landed signature and the number of sends.
+    def __init__(
+        self,
+        client: AsyncClient,
+        tracker: ConfirmationTracker,
+        blockhash_cache: RecentBlockhashCache,
+        interval: float = 2.0,
+        max_resigns: int = 3,
+        timeout: float = 90.0,
+        on_resign: Callable = None
+    ) -> None:
+        self.client: AsyncClient = client
+        self.tracker: ConfirmationTracker = tracker
+        self.blockhash_cache: RecentBlockhashCache = blockhash_cache
+        self.interval: float = interval
+        self.max_resigns: int = max_resigns
+        self.timeout: float = timeout
+        self.on_resign: Callable = on_resign
+        self.commitment = tracker.commitment
+        self.stats: dict = {'sends': 0, 'resends': 0, 'resigns': 0, 'send errors': 0, 'expired': 0}
+        self._broadcasts: dict = {}  # first signature -> Broadcast
+        self._block_height: int = None
+        self._block_height_at: float = 0.0
+        self._block_height_task: asyncio.Task = None
+
+    async def send(self, sign: Callable) -> Broadcast:
+        # 'sign(blockhash)' returns the signed Transaction, the first send has to be accepted by the node
+        blockhash = await self._fresh_blockhash()
+        txn: Transaction = sign(blockhash.blockhash)
+        wire = txn.serialize()
+        await self._send_wire(wire)
+        broadcast = Broadcast(str(txn.signature()))
+        broadcast.sends = 1
+        broadcast.result = asyncio.get_running_loop().create_task(self._rebroadcast(broadcast, sign, wire, blockhash))
+        self._broadcasts[broadcast.txn_id] = broadcast
+        broadcast.result.add_done_callback(lambda _: self._broadcasts.pop(broadcast.txn_id, None))
+        return broadcast
+
+    def track(self, txn_id: str) -> asyncio.Future:
+        broadcast = self._broadcasts.get(txn_id)
+        return broadcast.result if broadcast else self.tracker.track(txn_id)
+
+    def pending(self) -> int:
+        return len(self._broadcasts)
+
+    async def _send_wire(self, wire: bytes) -> None:
+        self.stats['sends'] += 1
+        response = await self.client.send_raw_transaction(wire, opts=REBROADCAST_OPTS)
+        if 'result' not in response:
+            raise ValueError(f'Transaction was not accepted: {response}')
+
+    async def _fresh_blockhash(self) -> CachedBlockhash:
+        try:
+            cached = self.blockhash_cache.current()
+        except ValueError:
+            return await self.blockhash_cache.refresh()
+        if cached.last_valid_block_height is not None and await self.block_height() > cached.last_valid_block_height:
+            cached = await self.blockhash_cache.refresh()
+        return cached
+
+    async def block_height(self) -> int:
+        # shared by all the broadcasts, fetched at most once per half of the interval
+        if self._block_height is None or time.monotonic() - self._block_height_at > self.interval / 2:
+            if self._block_height_task is None or self._block_height_task.done():
+                self._block_height_task = asyncio.get_running_loop().create_task(self._fetch_block_height())
+            await asyncio.shield(self._block_height_task)
+        return self._block_height
+
+    async def _fetch_block_height(self) -> None:
+        response = await self.client.get_block_height(self.commitment)
+        if 'result' not in response:
+            raise ValueError(f'Cannot get block height: {response}')
+        self._block_height = response['result']
+        self._block_height_at = time.monotonic()
+
+    async def _rebroadcast(self, broadcast: Broadcast, sign: Callable, wire: bytes, blockhash: CachedBlockhash) -> ConfirmationResult:
+        try:
+            return await self._resend_until_landed(broadcast, sign, wire, blockhash)
+        finally:
+            # the sibling signatures of the landed one (all of them when none landed) are not polled anymore
+            for txn_id in broadcast.signatures:
+                self.tracker.untrack(txn_id)
+
+    async def _resend_until_landed(self, broadcast: Broadcast, sign: Callable, wire: bytes,
+            blockhash: CachedBlockhash) -> ConfirmationResult:
+        deadline = time.monotonic() + self.timeout
+        confirmations = {self.tracker.track(broadcast.txn_id, timeout=self.timeout)}
+        while confirmations and time.monotonic() < deadline:
+            done, confirmations = await asyncio.wait(
+                confirmations, timeout=min(self.interval, deadline - time.monotonic())
+            )
+            for confirmation in done:
+                # a transaction failed on-chain landed too, sending it again does not help
+                if confirmation.result().is_landed():
+                    result = confirmation.result()
+                    result.sends = broadcast.sends
+                    return result
+            if not confirmations or time.monotonic() >= deadline:
+                break
+            try:
+                expired = blockhash.last_valid_block_height is not None \
+                    and await self.block_height() > blockhash.last_valid_block_height
+                if not expired:
+                    broadcast.sends += 1
+                    self.stats['resends'] += 1
+                    await self._send_wire(wire)
+                    continue
+            except Exception as e:
+                if not is_blockhash_not_found(e):
+                    self.stats['send errors'] += 1
+                    print(f'ERROR: cannot rebroadcast {broadcast}: {e}')
+                    continue
+                self.blockhash_cache.invalidate(blockhash.blockhash)
+            if broadcast.resigns >= self.max_resigns:
+                # the signatures sent already may still be seen landed until the tracker gives up on them
+                continue
+            # expired, signed again with a fresh blockhash, the former signatures are still tracked
+            try:
+                blockhash = await self._fresh_blockhash()
+                txn: Transaction = sign(blockhash.blockhash)
+                wire = txn.serialize()
+                broadcast.resigns += 1
+                broadcast.sends += 1
+                self.stats['resigns'] += 1
+                broadcast.signatures.append(str(txn.signature()))
+                confirmations.add(self.tracker.track(broadcast.signatures[-1], timeout=deadline - time.monotonic()))
+                if self.on_resign is not None:
+                    self.on_resign(broadcast.txn_id, broadcast.signatures[-1])
+                await self._send_wire(wire)
+            except Exception as e:
+                self.stats['send errors'] += 1
+                print(f'ERROR: cannot sign {broadcast} again with a new blockhash: {e}')
+        self.stats['expired'] += 1
+        # none landed, the record is of the signature sent last
+        result = ConfirmationResult(broadcast.signatures[-1])
+        result.sends = broadcast.sends
+        return result
+
+    async def close(self) -> None:
+        broadcasts = [broadcast.result for broadcast in self._broadcasts.values()]
+        for result in broadcasts:
+            result.cancel()
+        await asyncio.gather(*broadcasts, return_exceptions=True)
+        if self._block_height_task is not None and not self._block_height_task.done():
+            self._block_height_task.cancel()
@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import asyncio
+import sqlite3
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date
+
+# fields of TransactionProcessingData stored in the database, all the timestamps, the txn_id and the send id
+RECORD_FIELDS = ('client_time', 'provider', 'send_id', 'txn_id', 'started_at', 'finished_at', 'txnblock_time',
+    'blockchain_time', 'blockchain_counter', 'ws_time', 'processing_data_updated', 'processed_at', 'processed_slot',
+    'confirmed_at', 'confirmed_slot', 'finalized_at', 'finalized_slot', 'shard', 'send_attempts', 'sent_slot',
+    'landed_slot', 'ws_slot')
+
+TIMESTAMP_FIELDS = {'client_time', 'started_at', 'finished_at', 'txnblock_time', 'blockchain_time', 'ws_time',
+    'processing_data_updated', 'processed_at', 'confirmed_at', 'finalized_at'}
+
+CREATE_TABLE = '''
+CREATE TABLE IF NOT EXISTS transaction_processing_data (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    status TEXT NOT NULL,
+    client_time REAL,
+    provider TEXT,
+    send_id INTEGER,
+    txn_id TEXT,
+    started_at REAL,
+    finished_at REAL,
+    txnblock_time REAL,
+    blockchain_time REAL,
+    blockchain_counter INTEGER,
+    ws_time REAL,
+    processing_data_updated REAL,
+    processed_at REAL,
+    processed_slot INTEGER,
+    confirmed_at REAL,
+    confirmed_slot INTEGER,
+    finalized_at REAL,
+    finalized_slot INTEGER,
+    shard INTEGER,
+    send_attempts INTEGER,
+    sent_slot REAL,
+    landed_slot INTEGER,
+    ws_slot INTEGER
+)'''
+
+# columns added after the table was first created, a database of an older run gets them on open
+ADDED_COLUMNS = {
+    'processed_at': 'REAL',
+    'processed_slot': 'INTEGER',
+    'confirmed_at': 'REAL',
+    'confirmed_slot': 'INTEGER',
+    'finalized_at': 'REAL',
+    'finalized_slot': 'INTEGER',
+    'shard': 'INTEGER',
+    'send_attempts': 'INTEGER',
+    'sent_slot': 'REAL',
+    'landed_slot': 'INTEGER',
+    'ws_slot': 'INTEGER',
+    'send_id': 'INTEGER'
+}
+
+INSERT = (f'INSERT INTO transaction_processing_data (status, {", ".join(RECORD_FIELDS)}) '
+    f'VALUES ({", ".join("?" * (len(RECORD_FIELDS) + 1))})')
+
+
+def _timestamp(value: date) -> float:
+    # datetime.max marks a transaction not confirmed in time, it's stored as NULL
+    if value is None or value == datetime.max:
+        return None
+    return value.timestamp()
+
+
+def to_row(status: str, record) -> tuple:
+    return (status,) + tuple(
+        _timestamp(getattr(record, field)) if field in TIMESTAMP_FIELDS else getattr(record, field)
+        for field in RECORD_FIELDS
+    )
+
+
+class SqliteResultsSink:
+    # Persistent sink of finished TransactionProcessingData records.
+    #
+    # Records are put to an in-memory queue without blocking the caller, a writer task collects them
+    # and flushes them in batched transactions to a SQLite database in WAL mode, every 'batch_size'
+    # records or every 'flush_interval' seconds, whichever comes first. The row conversion and all
+    # the SQLite calls run in a dedicated single thread, off the event loop.
+    def __init__(self, path: str, batch_size: int = 500, flush_interval: float = 0.5, queue_size: int = 100000) -> None:
+        self.path: str = path
+        self.batch_size: int = batch_size
+        self.flush_interval: float = flush_interval
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.written: int = 0
+        self.dropped: int = 0
+        self._executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='results-sink')
+        self._connection: sqlite3.Connection = None
+        self._task: asyncio.Task = None
+
+    async def start(self) -> SqliteResultsSink:
+        if self._task is None:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._open)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def put(self, record, status: str = 'completed') -> None:
+        try:
+            self.queue.put_nowait((status, record))
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def put_row(self, row: tuple) -> None:
+        # a record converted by to_row already, e.g., in a load worker process
+        self.put(row, None)
+
+    def _open(self) -> None:
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(CREATE_TABLE)
+        columns = {row[1] for row in self._connection.execute('PRAGMA table_info(transaction_processing_data)')}
+        for column, column_type in ADDED_COLUMNS.items():
+            if column not in columns:
+                self._connection.execute(f'ALTER TABLE transaction_processing_data ADD COLUMN {column} {column_type}')
+        self._connection.commit()
+
+    def _write(self, batch: list) -> int:
+        with self._connection:  # one transaction per batch
+            self._connection.executemany(
+                INSERT, [record if status is None else to_row(status, record) for status, record in batch]
+            )
+        return len(batch)
+
+    async def _flush(self, batch: list) -> None:
+        try:
+            self.written += await asyncio.get_running_loop().run_in_executor(self._executor, self._write, batch)
+        except Exception as e:
+            print(f'ERROR: cannot write {len(batch)} records to {self.path}: {e}')
+
+    async def _run(self) -> None:
+        closing = False
+        while not closing:
+            item = await self.queue.get()
+            if item is None:  # closing, everything put before was written already
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    closing = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+    async def close(self) -> None:
+        if self._task is not None:
+            # the writer flushes all the queued records before it stops
+            await self.queue.put(None)
+            await self._task
+            self._task = None
+        if self._connection is not None:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._connection.close)
+            self._connection = None
+        self._executor.shutdown(wait=False)
+        print(f'Results sink {self.path}: {self.written} records written, {self.dropped} dropped')
+
+    async def __aenter__(self) -> SqliteResultsSink:
+        return await self.start()
+
+    async def __aexit__(self, _exc_type, _exc, _tb) -> None:
+        await self.close()
@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+import asyncio
+import copy
+import itertools
+import json
+
+import httpx
+
+from solana.exceptions import SolanaRpcException, handle_async_exceptions
+from solana.rpc.providers.async_http import AsyncHTTPProvider
+from solana.rpc.providers.core import _HTTPProviderCore
+from solana.rpc.types import RPCMethod, RPCResponse
+
+# methods without side effects, they are batched and concurrent identical calls share one request
+READ_METHODS = frozenset({
+    'getAccountInfo', 'getMultipleAccounts', 'getBalance', 'getMinimumBalanceForRentExemption',
+    'getSignatureStatuses', 'getTransaction', 'getBlockTime', 'getSlot', 'getBlockHeight',
+    'getLatestBlockhash', 'getRecentBlockhash', 'getFees', 'getFeeForMessage', 'getHealth', 'getVersion'
+})
+
+
+class BatchStats:
+    def __init__(self) -> None:
+        self.posts: int = 0  # HTTP requests carrying a batch
+        self.calls: int = 0  # JSON-RPC calls sent in the batches
+        self.coalesced: int = 0  # calls answered by an identical call already in flight
+        self.single_posts: int = 0  # calls posted on their own as the endpoint refused the batches
+
+    def __str__(self) -> str:
+        return (f'batches={self.posts}, batched calls={self.calls}, coalesced calls={self.coalesced}, '
+            f'calls per batch={self.calls / self.posts if self.posts else 0:.1f}, single calls={self.single_posts}')
+
+
+class BatchRpcTransport:
+    # JSON-RPC batch transport of one endpoint.
+    #
+    # Calls made within 'max_delay' seconds of each other (or until 'max_batch' calls are collected)
+    # are sent as a single HTTP POST with a JSON array body, the response array is demultiplexed
+    # by the request id back to the awaiting callers. A read issued while an identical one
+    # (same method and params, i.e., the same account at the same commitment) is in flight
+    # does not go to the wire, it waits for the response of the first one, and gets a copy of it.
+    # An endpoint answering a batch with anything else than an array (e.g., a provider not allowing
+    # batches) is not sent batches anymore, the calls of the refused batch are posted one by one.
+    def __init__(
+        self,
+        http: httpx.AsyncClient,
+        endpoint: str,
+        max_batch: int = 20,
+        max_delay: float = 0.001,
+        methods: frozenset = READ_METHODS
+    ) -> None:
+        self.http: httpx.AsyncClient = http
+        self.endpoint: str = endpoint
+        self.max_batch: int = max_batch
+        self.max_delay: float = max_delay
+        self.methods: frozenset = methods
+        self.stats: BatchStats = BatchStats()
+        self._ids = itertools.count(1)
+        self._pending: list = []  # (request, future) waiting for the batch to be sent
+        self._in_flight: dict = {}  # (method, params json) -> future
+        self._flush_handle: asyncio.Handle = None
+        self._tasks: set = set()
+        self.refused: bool = False  # the endpoint does not accept batches
+
+    def batches(self, method: str) -> bool:
+        return self.max_batch > 1 and not self.refused and method in self.methods
+
+    async def call(self, method: str, *params) -> dict:
+        key = (method, json.dumps(params, sort_keys=True))
+        future = self._in_flight.get(key)
+        coalesced = future is not None
+        if coalesced:
+            self.stats.coalesced += 1
+        else:
+            future = self._in_flight[key] = self._enqueue({'method': method, 'params': list(params)})
+            future.add_done_callback(lambda done: self._done(key, done))
+        # shielded, a cancelled caller does not cancel the call for the others waiting for it
+        result = await asyncio.shield(future)
+        # the callers may change the response they get, the one of the first caller is not shared
+        return copy.deepcopy(result) if coalesced else result
+
+    def _done(self, key: tuple, future: asyncio.Future) -> None:
+        self._in_flight.pop(key, None)
+        if not future.cancelled():
+            future.exception()  # retrieved, all its callers may be cancelled already
+
+    async def request(self, request: dict) -> dict:
+        # hand built request, e.g., by get_json_http_account_info, its id is replaced in the batch
+        return await self.call(request['method'], *request.get('params', []))
+
+    def _enqueue(self, request: dict) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(({'jsonrpc': '2.0', 'id': next(self._ids), **request}, future))
+        if self.refused:
+            self._flush()
+        elif len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_delay, self._flush) if self.max_delay \
+                else loop.call_soon(self._flush)
+        return future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._send_each(batch) if self.refused else self._send(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: list) -> None:
+        futures = {request['id']: future for request, future in batch}
+        self.stats.posts += 1
+        self.stats.calls += len(batch)
+        try:
+            response = await self.http.post(
+                self.endpoint,
+                headers={'Content-Type': 'application/json'},
+                content=json.dumps([request for request, _ in batch])
+            )
+            if response.is_server_error:
+                response.raise_for_status()
+            try:
+                results = response.json()
+            except ValueError:
+                results = None
+            if not isinstance(results, list):
+                # the node refused the batch as a whole, e.g., batches are not allowed by the provider
+                if not self.refused:
+                    self.refused = True
+                    print(f'JSON-RPC batches are refused by {self.endpoint} ({response.status_code}: {response.text[:200]}), '
+                        f'the calls are sent one by one from now on')
+                await self._send_each(batch)
+                return
+            for result in results:
+                future = futures.pop(result.get('id'), None)
+                if future is not None and not future.done():
+                    future.set_result(result)
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(ValueError(f'No response in the JSON-RPC batch from {self.endpoint}'))
+        except Exception as e:
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(e)
+
+    async def _send_each(self, batch: list) -> None:
+        await asyncio.gather(*[self._send_one(request, future) for request, future in batch])
+
+    async def _send_one(self, request: dict, future: asyncio.Future) -> None:
+        self.stats.single_posts += 1
+        try:
+            response = await self.http.post(
+                self.endpoint, headers={'Content-Type': 'application/json'}, content=json.dumps(request)
+            )
+            response.raise_for_status()
+            if not future.done():
+                future.set_result(response.json())
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+
+    async def close(self) -> None:
+        self._flush()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+class PooledHTTPProvider(AsyncHTTPProvider):
+    # Provider of the solana AsyncClient posting through a shared httpx session. It does not open
+    # a session of its own as AsyncHTTPProvider does, and closing it leaves the shared one open
+    # for the other clients, the owner of the session closes it.
+    def __init__(self, endpoint: str, session: httpx.AsyncClient) -> None:
+        # the timeouts are of the shared session
+        _HTTPProviderCore.__init__(self, endpoint)
+        self.session: httpx.AsyncClient = session
+
+    async def __aenter__(self) -> PooledHTTPProvider:
+        return self
+
+    async def close(self) -> None:
+        pass
+
+
+class BatchingHTTPProvider(PooledHTTPProvider):
+    # Provider of the solana AsyncClient routing the read methods through the batch transport,
+    # the others (sendTransaction, requestAirdrop) are posted right away as before.
+    def __init__(self, endpoint: str, transport: BatchRpcTransport) -> None:
+        super().__init__(endpoint, transport.http)
+        self.transport: BatchRpcTransport = transport
+
+    async def make_request(self, method: RPCMethod, *params) -> RPCResponse:
+        if not self.transport.batches(method):
+            return await super().make_request(method, *params)
+        return await self._make_batched_request(method, *params)
+
+    @handle_async_exceptions(SolanaRpcException, Exception)
+    async def _make_batched_request(self, method: RPCMethod, *params) -> RPCResponse:
+        return await self.transport.call(method, *params)
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import time
+
+import httpx
+
+from solana.rpc.async_api import AsyncClient
+from solana.rpc.commitment import Commitment, Confirmed
+
+from capture import CaptureWriter, KIND_HTTP_REQUEST, KIND_HTTP_RESPONSE
+from rpc_batch import BatchRpcTransport, BatchingHTTPProvider, PooledHTTPProvider
+
+
+class EndpointStats:
+    def __init__(self) -> None:
+        self.requests: int = 0
+        self.connections: int = 0  # TCP connections opened (i.e., number of handshakes)
+        self.tls_handshakes: int = 0
+
+    def reused(self) -> int:
+        # every request that did not need to open a new connection got a pooled keep-alive one
+        return max(self.requests - self.connections, 0)
+
+    def __str__(self) -> str:
+        return (f'requests={self.requests}, connections={self.connections}, '
+            f'tls handshakes={self.tls_handshakes}, reused={self.reused()}')
+
+
+class RpcSession:
+    # Long-lived RPC session shared by all asyncio tasks of the client.
+    #
+    # The solana AsyncClient creates its own httpx session and the 'async with AsyncClient(...)' usage
+    # closes it at the end of the block, i.e., every counter increment paid a new TCP (and TLS) handshake.
+    # The session keeps one bounded keep-alive httpx connection pool per endpoint and hands out
+    # AsyncClient instances bound to it. The clients are owned by the session, do not close them,
+    # close the session instead.
+    # With 'batch_size' over 1 the read methods of the clients are sent through one JSON-RPC batch
+    # transport per endpoint, reads of concurrent tasks share HTTP requests.
+    # With 'capture' every request and response body is appended to the capture.
+    def __init__(
+        self,
+        max_connections: int = 10,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 30.0,
+        timeout: float = 10.0,
+        connect_timeout: float = 5.0,
+        endpoint_limits: dict = None,  # endpoint url -> max connections for the endpoint
+        batch_size: int = 0,
+        batch_delay: float = 0.001,
+        capture: CaptureWriter = None
+    ) -> None:
+        self.max_connections: int = max_connections
+        self.max_keepalive_connections: int = max_keepalive_connections
+        self.keepalive_expiry: float = keepalive_expiry
+        self.timeout: float = timeout
+        self.connect_timeout: float = connect_timeout
+        self.endpoint_limits: dict = endpoint_limits if endpoint_limits else {}
+        self.batch_size: int = batch_size
+        self.batch_delay: float = batch_delay
+        self.capture: CaptureWriter = capture
+        self._http_sessions: dict = {}  # endpoint -> httpx.AsyncClient
+        self._transports: dict = {}  # endpoint -> BatchRpcTransport
+        self._clients: dict = {}  # (endpoint, commitment) -> AsyncClient
+        self._replaced_providers: list = []  # the providers the clients were created with, not used
+        self._stats: dict = {}  # endpoint -> EndpointStats
+
+    def _http_session(self, endpoint: str) -> httpx.AsyncClient:
+        if endpoint not in self._http_sessions:
+            max_connections = self.endpoint_limits.get(endpoint, self.max_connections)
+            stats = self._stats.setdefault(endpoint, EndpointStats())
+
+            async def trace(event_name: str, info: dict) -> None:
+                if event_name == 'connection.connect_tcp.complete':
+                    stats.connections += 1
+                elif event_name == 'connection.start_tls.complete':
+                    stats.tls_handshakes += 1
+
+            async def on_request(request: httpx.Request) -> None:
+                stats.requests += 1
+                request.extensions['trace'] = trace
+
+            async def capture_request(request: httpx.Request) -> None:
+                exchange_id = request.extensions['capture_id'] = self.capture.exchange_id()
+                self.capture.write(KIND_HTTP_REQUEST, self.capture.stream(endpoint), exchange_id, request.content)
+
+            async def capture_response(response: httpx.Response) -> None:
+                at = time.monotonic()  # the headers are in, the body read below is counted to the network
+                await response.aread()
+                self.capture.write(
+                    KIND_HTTP_RESPONSE, self.capture.stream(endpoint), response.request.extensions['capture_id'],
+                    response.content, at
+                )
+
+            self._http_sessions[endpoint] = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=min(self.max_keepalive_connections, max_connections),
+                    keepalive_expiry=self.keepalive_expiry
+                ),
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                event_hooks={'request': [on_request, capture_request], 'response': [capture_response]} if self.capture
+                    else {'request': [on_request]}
+            )
+        return self._http_sessions[endpoint]
+
+    def transport(self, endpoint: str) -> BatchRpcTransport:
+        if endpoint not in self._transports:
+            self._transports[endpoint] = BatchRpcTransport(
+                self._http_session(endpoint), endpoint, max_batch=self.batch_size, max_delay=self.batch_delay
+            )
+        return self._transports[endpoint]
+
+    def client(self, endpoint: str, commitment: Commitment = Confirmed) -> AsyncClient:
+        key = (endpoint, str(commitment))
+        if key not in self._clients:
+            client = AsyncClient(endpoint=endpoint, commitment=commitment, timeout=self.timeout)
+            # the AsyncClient always creates a provider with a session of its own, it is closed with the session
+            self._replaced_providers.append(client._provider)
+            if self.batch_size > 1:
+                client._provider = BatchingHTTPProvider(endpoint, self.transport(endpoint))
+            else:
+                client._provider = PooledHTTPProvider(endpoint, self._http_session(endpoint))
+            self._clients[key] = client
+        return self._clients[key]
+
+    def stats(self) -> dict:
+        return dict(self._stats)
+
+    def print_stats(self) -> None:
+        for endpoint, stats in self._stats.items():
+            print(f'RPC session [{endpoint}]: {stats}')
+        for endpoint, transport in self._transports.items():
+            print(f'RPC batches [{endpoint}]: {transport.stats}')
+
+    async def close(self) -> None:
+        for transport in self._transports.values():
+            await transport.close()
+        self._transports.clear()
+        for http_session in self._http_sessions.values():
+            await http_session.aclose()
+        self._http_sessions.clear()
+        for provider in self._replaced_providers:
+            await provider.close()
+        self._replaced_providers.clear()
+        self._clients.clear()
+
+    async def __aenter__(self) -> RpcSession:
+        return self
+
+    async def __aexit__(self, _exc_type, _exc, _tb) -> None:
+        await self.close()
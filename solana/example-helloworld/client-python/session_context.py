@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import json
+import os
+import time
+
+from solana.keypair import Keypair
+from solana.publickey import PublicKey
+
+from capture import CaptureWriter
+from slot_clock import SlotClock
+from transactions import get_data_account_pubkey
+from shards import ShardSelector, ShardCounters, SHARD_ROUND_ROBIN
+
+# for how long (in seconds) an account is trusted to exist without asking the cluster
+BOOTSTRAP_CACHE_TTL = 24 * 60 * 60
+
+
+class BootstrapCache:
+    # Small local JSON file remembering between runs what the bootstrap would otherwise ask the cluster for:
+    # the rent exemption fee per account size and the accounts known to exist (the executable program
+    # and the counter data account), both per RPC endpoint. Known accounts expire after 'ttl' seconds,
+    # the bootstrap verifies them with one request and forgets the endpoint when the cluster disagrees.
+    def __init__(self, path: str, ttl: float = BOOTSTRAP_CACHE_TTL) -> None:
+        self.path: str = path
+        self.ttl: float = ttl
+        self.data: dict = self._load()
+
+    def _load(self) -> dict:
+        if not self.path or not os.path.isfile(self.path):
+            return {}
+        try:
+            with open(self.path) as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError) as e:
+            print(f'Bootstrap cache {self.path} cannot be read, it is ignored: {e}')
+            return {}
+
+    def _endpoint(self, endpoint: str) -> dict:
+        return self.data.setdefault(endpoint, {'rent_exemption_fees': {}, 'accounts': {}})
+
+    def rent_exemption_fee(self, endpoint: str, size: int) -> int:
+        return self._endpoint(endpoint)['rent_exemption_fees'].get(str(size))
+
+    def set_rent_exemption_fee(self, endpoint: str, size: int, fee: int) -> None:
+        self._endpoint(endpoint)['rent_exemption_fees'][str(size)] = fee
+
+    def account_exists(self, endpoint: str, pubkey: PublicKey) -> bool:
+        known_at = self._endpoint(endpoint)['accounts'].get(str(pubkey))
+        return known_at is not None and time.time() - known_at < self.ttl
+
+    def set_account_exists(self, endpoint: str, pubkey: PublicKey, exists: bool = True) -> None:
+        accounts = self._endpoint(endpoint)['accounts']
+        if exists:
+            accounts[str(pubkey)] = time.time()
+        else:
+            accounts.pop(str(pubkey), None)
+
+    def forget(self, endpoint: str) -> None:
+        # the cluster does not know the accounts any more (reset test validator, redeployed program)
+        self.data.pop(endpoint, None)
+        self.save()
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        try:
+            # written aside and renamed, a concurrently starting client never reads a half written file
+            with open(f'{self.path}.tmp', 'w') as cache_file:
+                json.dump(self.data, cache_file, indent=2)
+            os.replace(f'{self.path}.tmp', self.path)
+        except OSError as e:
+            print(f'ERROR: cannot save bootstrap cache {self.path}: {e}')
+
+
+class SessionContext:
+    # What every task of the client needs and what does not change during the run: the keypairs,
+    # the derived data account addresses (create_with_seed is a SHA-256) and the bootstrap knowledge.
+    # With more than one shard the counter is spread over 'shards' data accounts, the shard selector
+    # and the shard counters are shared by the tasks too. A load worker process works with its
+    # 'shard_ids' only. The traffic capture and the slot clock, if any, are shared as well. Built once in main
+    # and shared by all the tasks.
+    def __init__(self, keypair: Keypair, program_keypair: Keypair, cache: BootstrapCache,
+            shards: int = 1, shard_strategy: str = SHARD_ROUND_ROBIN, shard_ids: list = None,
+            capture: CaptureWriter = None, slot_clock: SlotClock = None) -> None:
+        self.keypair: Keypair = keypair
+        self.program_keypair: Keypair = program_keypair
+        self.shard_ids: list = shard_ids if shard_ids else list(range(max(shards, 1)))
+        self.shard_pubkeys: list = [
+            get_data_account_pubkey(keypair.public_key, program_keypair.public_key, shard) for shard in self.shard_ids
+        ]
+        self.program_data_pubkey: PublicKey = self.shard_pubkeys[0]
+        self.shard_selector: ShardSelector = ShardSelector(
+            self.shard_pubkeys, shard_strategy, self.shard_ids, max(shards, 1)
+        )
+        self.shard_counters: ShardCounters = ShardCounters(self.shard_pubkeys)
+        self.program_executable: bool = None  # None until the bootstrap verifies it
+        self.cache: BootstrapCache = cache
+        self.capture: CaptureWriter = capture
+        self.slot_clock: SlotClock = slot_clock
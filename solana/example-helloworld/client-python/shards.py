@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+from solana.publickey import PublicKey
+
+SHARD_ROUND_ROBIN = 'round-robin'
+SHARD_LEAST_IN_FLIGHT = 'least-in-flight'
+SHARD_STRATEGIES = (SHARD_ROUND_ROBIN, SHARD_LEAST_IN_FLIGHT)
+
+
+class ShardSelector:
+    # Picks the counter data account (shard) the next counter transaction writes to.
+    #
+    # Writes to one account are serialized by the runtime, transactions spread over more accounts
+    # can be processed in parallel. 'round-robin' takes the shards in turns, 'least-in-flight' takes
+    # the shard with the fewest transactions sent and not confirmed yet (ties in turns).
+    # A selector may hold a part of all the shards only (a load worker process), 'shard_ids' are
+    # the numbers of its shards out of 'shards'.
+    def __init__(self, pubkeys: list, strategy: str = SHARD_ROUND_ROBIN, shard_ids: list = None,
+            shards: int = None) -> None:
+        if strategy not in SHARD_STRATEGIES:
+            raise ValueError(f'Expected shard strategy one of {SHARD_STRATEGIES} but got {strategy}')
+        self.pubkeys: list = pubkeys
+        self.strategy: str = strategy
+        self.shard_ids: list = shard_ids if shard_ids is not None else list(range(len(pubkeys)))
+        self.shards: int = shards if shards is not None else len(pubkeys)
+        self.in_flight: list = [0] * len(pubkeys)
+        self.sent: list = [0] * len(pubkeys)
+        self._next: int = 0
+
+    def __len__(self) -> int:
+        return len(self.pubkeys)
+
+    def select(self) -> int:
+        shards = len(self.pubkeys)
+        if self.strategy == SHARD_LEAST_IN_FLIGHT:
+            shard = min(((self._next + i) % shards for i in range(shards)), key=self.in_flight.__getitem__)
+        else:
+            shard = self._next
+        self._next = (shard + 1) % shards
+        return shard
+
+    def pubkey(self, shard: int) -> PublicKey:
+        return self.pubkeys[shard]
+
+    def label(self, shard: int) -> int:
+        # metrics and records are labelled by the shard number only when there is more than one shard
+        return self.shard_ids[shard] if self.shards > 1 else None
+
+    def acquire(self, shard: int) -> None:
+        self.in_flight[shard] += 1
+        self.sent[shard] += 1
+
+    def release(self, shard: int) -> None:
+        self.in_flight[shard] -= 1
+
+    def __str__(self) -> str:
+        return f'ShardSelector(strategy={self.strategy}, sent={self.sent}, in flight={self.in_flight})'
+
+
+class ShardCounters:
+    # The last known counter value of every shard (by slot), the counter total is the sum of the shards
+    def __init__(self, pubkeys: list) -> None:
+        self.shards: dict = {str(pubkey): shard for shard, pubkey in enumerate(pubkeys)}
+        self.counters: list = [None] * len(pubkeys)
+        self.slots: list = [-1] * len(pubkeys)
+
+    def shard_of(self, pubkey) -> int:
+        return self.shards.get(str(pubkey))
+
+    def update(self, shard: int, counter: int, slot: int = None) -> None:
+        if slot is None or slot >= self.slots[shard]:
+            self.counters[shard] = counter
+            self.slots[shard] = slot if slot is not None else self.slots[shard]
+
+    def total(self) -> int:
+        return sum(counter for counter in self.counters if counter is not None)
+
+    def __str__(self) -> str:
+        return f'total={self.total()} over {len(self.counters)} shards {self.counters}'
@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+from datetime import datetime
+from solana.rpc.async_api import AsyncClient
+from solana.rpc.commitment import Processed
+
+from capture import CaptureWriter
+from ws_subscriptions import SubscriptionManager, Subscription, to_monotonic
+
+DEFAULT_SLOT_TIME = 0.4  # seconds of a slot until the clock has seen two of them
+
+
+def decode_slot_notification(received_at: float, params: dict) -> tuple[float, int]:
+    return received_at, params['result']['slot']
+
+
+class SlotClock:
+    # Local arrival time of the slots, the time base of the slot accurate latencies.
+    #
+    # The blockTime and the on-chain timestamps have seconds precision only, the slots come every
+    # ~400ms. The clock listens to slotSubscribe and keeps the first (monotonic) arrival time of the last
+    # 'capacity' slots in a ring buffer, in increasing slot order. While no slot is notified for
+    # 'poll_interval' seconds (no websocket, the subscription stalled) the slot is polled with getSlot,
+    # its arrival is taken in the middle of the request. A slot that was not seen (skipped by the leader,
+    # between two polls) gets its time interpolated from its neighbours, a slot out of the buffer
+    # is extrapolated with the mean slot time. Any event, a send time or a slot from a status or
+    # a notification, is converted to slots (fractional) and to the local time its slot arrived at.
+    def __init__(
+        self,
+        client: AsyncClient,
+        ws_url: str = None,
+        capacity: int = 4096,
+        poll_interval: float = 1.0,
+        capture: CaptureWriter = None
+    ) -> None:
+        if capacity < 2:
+            raise ValueError(f'Slot clock capacity has to be at least 2 but it is {capacity}')
+        self.client: AsyncClient = client
+        self.manager: SubscriptionManager = SubscriptionManager(
+            ws_url, sockets=1, verbose=False, capture=capture
+        ) if ws_url else None
+        self.capacity: int = capacity
+        self.poll_interval: float = poll_interval
+        self.stats: dict = {'notified': 0, 'polled': 0, 'poll errors': 0, 'out of order': 0}
+        self.size: int = 0
+        self._slots: list = [0] * capacity
+        self._times: list = [0.0] * capacity
+        self._head: int = 0  # index the next slot is written to
+        self._subscription: Subscription = None
+        self._task: asyncio.Task = None
+
+    async def start(self) -> SlotClock:
+        if self.manager is not None:
+            await self.manager.start()
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    async def _subscribe(self) -> None:
+        # waits for the websocket to connect, the slot is polled meanwhile
+        try:
+            self._subscription = await self.manager.slot_subscribe(queue_size=64, decoder=decode_slot_notification)
+        except Exception as e:
+            print(f'ERROR: cannot subscribe slots at {self.manager.ws_url}, the slot is polled: {e}')
+
+    async def _run(self) -> None:
+        subscribing = asyncio.get_running_loop().create_task(self._subscribe()) if self.manager is not None else None
+        try:
+            while True:
+                if self._subscription is None or not self._subscription.active:
+                    await self._poll()
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                try:
+                    notifications = await asyncio.wait_for(self._subscription.get(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    await self._poll()
+                    continue
+                except ConnectionError:
+                    continue  # closed with the manager, the slot is polled
+                for received_at, slot in notifications:
+                    self.stats['notified'] += 1
+                    self.observe(slot, received_at)
+        finally:
+            if subscribing is not None:
+                subscribing.cancel()
+
+    async def _poll(self) -> None:
+        sent_at = time.monotonic()
+        try:
+            response = await self.client.get_slot(Processed)
+        except Exception as e:
+            self.stats['poll errors'] += 1
+            print(f'ERROR: cannot poll the slot: {e}')
+            return
+        if 'result' not in response:
+            self.stats['poll errors'] += 1
+            return
+        self.stats['polled'] += 1
+        # the node answered with the slot it had somewhere within the round trip
+        self.observe(response['result'], (sent_at + time.monotonic()) / 2)
+
+    def _index(self, position: int) -> int:
+        # position 0 is the oldest slot of the buffer
+        return (self._head - self.size + position) % self.capacity
+
+    def _search(self, values: list, value: float) -> int:
+        # position of the first value not lower than 'value', the buffer is ordered by slot and by time
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if values[self._index(middle)] < value:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def observe(self, slot: int, at: float = None) -> bool:
+        # only the first arrival of a newer slot counts, a late (forked, polled) one is ignored
+        at = time.monotonic() if at is None else at
+        if self.size:
+            newest = self._index(self.size - 1)
+            if slot <= self._slots[newest]:
+                if slot < self._slots[newest]:
+                    self.stats['out of order'] += 1
+                return False
+            at = max(at, self._times[newest])
+        self._slots[self._head] = slot
+        self._times[self._head] = at
+        self._head = (self._head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        return True
+
+    def newest_slot(self) -> int:
+        return self._slots[self._index(self.size - 1)] if self.size else None
+
+    def slot_time(self) -> float:
+        # mean seconds per slot over the buffer
+        if self.size < 2:
+            return DEFAULT_SLOT_TIME
+        oldest, newest = self._index(0), self._index(self.size - 1)
+        elapsed = self._times[newest] - self._times[oldest]
+        return elapsed / (self._slots[newest] - self._slots[oldest]) if elapsed > 0 else DEFAULT_SLOT_TIME
+
+    def time_of(self, slot: int) -> float:
+        # monotonic time the slot arrived (or would arrive) at, None until a slot is seen
+        if not self.size:
+            return None
+        position = self._search(self._slots, slot)
+        if position == self.size or (position == 0 and self._slots[self._index(0)] != slot):
+            edge = self._index(self.size - 1 if position == self.size else 0)
+            return self._times[edge] + (slot - self._slots[edge]) * self.slot_time()
+        after = self._index(position)
+        if self._slots[after] == slot:
+            return self._times[after]
+        before = self._index(position - 1)
+        share = (slot - self._slots[before]) / (self._slots[after] - self._slots[before])
+        return self._times[before] + share * (self._times[after] - self._times[before])
+
+    def slot_at(self, at: float = None) -> float:
+        # fractional slot at the monotonic time, e.g., 1000.5 halfway between the arrivals of 1000 and 1001
+        at = time.monotonic() if at is None else at
+        if not self.size:
+            return None
+        position = self._search(self._times, at)
+        if position == self.size or (position == 0 and self._times[self._index(0)] != at):
+            edge = self._index(self.size - 1 if position == self.size else 0)
+            return self._slots[edge] + (at - self._times[edge]) / self.slot_time()
+        after = self._index(position)
+        if self._times[after] == at or position == 0:
+            return float(self._slots[after])
+        before = self._index(position - 1)
+        share = (at - self._times[before]) / (self._times[after] - self._times[before])
+        return self._slots[before] + share * (self._slots[after] - self._slots[before])
+
+    def slot_of(self, wall_time: datetime) -> float:
+        # fractional slot at a datetime.utcnow() time of the client, e.g., a send
+        return self.slot_at(to_monotonic(wall_time))
+
+    def slot_delta(self, wall_time: datetime, slot: int) -> float:
+        # slots from the client time to the slot, e.g., from the send to the slot the transaction landed in
+        start_slot = self.slot_of(wall_time)
+        return None if start_slot is None else slot - start_slot
+
+    def latency(self, wall_time: datetime, slot: int) -> float:
+        # seconds from the client time to the local arrival of the slot, interpolated between the slots seen
+        arrived_at = self.time_of(slot)
+        return None if arrived_at is None else arrived_at - to_monotonic(wall_time)
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.manager is not None:
+            await self.manager.close()
+        print(f'Slot clock: {self}')
+
+    async def __aenter__(self) -> SlotClock:
+        return await self.start()
+
+    async def __aexit__(self, _exc_type, _exc, _tb) -> None:
+        await self.close()
+
+    def __str__(self):
+        return (f'SlotClock(slots={self.size}, newest={self.newest_slot()}, slot time={self.slot_time() * 1000:.1f}ms, '
+            f'{self.stats})')
@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+from datetime import datetime, date
+from solana.rpc.async_api import AsyncClient
+from solana.rpc.commitment import Processed, Confirmed, Finalized
+
+from capture import CaptureWriter
+from confirmation_tracker import COMMITMENT_RANKS
+from ws_subscriptions import SubscriptionManager, Subscription
+
+STAGE_COMMITMENTS = (Processed, Confirmed, Finalized)
+
+
+class StageTimeline:
+    # When the transaction was seen at each commitment level and in which slot, None for a stage not reached.
+    # A transaction signed again (new blockhash) has more signatures, the stages are of the one that landed.
+    __slots__ = ('txn_id', 'signatures', 'landed_txn_id', 'arrived_at', 'slots', 'err', 'polled')
+
+    def __init__(self, txn_id: str) -> None:
+        self.txn_id: str = txn_id  # the first signature, the key of the timeline
+        self.signatures: list = [txn_id]
+        self.landed_txn_id: str = None  # the signature the first stage was seen for
+        self.arrived_at: dict = {}  # commitment -> datetime
+        self.slots: dict = {}  # commitment -> slot
+        self.err = None
+        self.polled: bool = False  # some stage was observed by polling, its time is the poll time
+
+    def record(self, commitment, at: date, slot: int, err = None, txn_id: str = None) -> None:
+        if self.landed_txn_id is None:
+            self.landed_txn_id = txn_id or self.txn_id
+        commitment = str(commitment)
+        if commitment not in self.arrived_at:
+            self.arrived_at[commitment] = at
+            self.slots[commitment] = slot
+        if err is not None:
+            self.err = err
+
+    def reached(self, commitment) -> bool:
+        return str(commitment) in self.arrived_at
+
+    def is_finalized(self) -> bool:
+        return self.reached(Finalized)
+
+    def __str__(self):
+        return f'StageTimeline(txn_id={self.txn_id}, signatures={len(self.signatures)}, ' + ', '.join(
+            f'{commitment}={self.arrived_at.get(commitment)}@{self.slots.get(commitment)}'
+            for commitment in map(str, STAGE_COMMITMENTS)
+        ) + f', err={self.err}, polled={self.polled})'
+
+
+class StageTimelineTracker:
+    # Arrival of transactions at the processed, confirmed and finalized commitment.
+    #
+    # Every tracked signature is subscribed with signatureSubscribe once per commitment level,
+    # the notification time and its context slot are recorded. Only while no websocket is connected
+    # (or the subscription fails) the stages not reached yet are polled with getSignatureStatuses,
+    # the interval doubles from 'min_interval' to 'max_interval'. The polls of concurrently tracked
+    # signatures share the JSON-RPC batches of the client. The timeline is returned when the transaction
+    # is finalized or 'timeout' seconds passed. A transaction signed again is told with 'add_signature',
+    # the new signature is followed as well, the stages are recorded for whichever signature gets there first.
+    def __init__(
+        self,
+        client: AsyncClient,
+        ws_url: str = None,
+        sockets: int = 1,
+        timeout: float = 60.0,
+        min_interval: float = 0.4,
+        max_interval: float = 4.0,
+        capture: CaptureWriter = None
+    ) -> None:
+        self.client: AsyncClient = client
+        self.manager: SubscriptionManager = SubscriptionManager(
+            ws_url, sockets=sockets, queue_size=1, verbose=False, capture=capture
+        ) if ws_url else None
+        self.timeout: float = timeout
+        self.min_interval: float = min_interval
+        self.max_interval: float = max(max_interval, min_interval)
+        self._tasks: dict = {}  # first signature -> task tracking the transaction
+        self._timelines: dict = {}  # any signature of a tracked transaction -> its timeline
+        self._watches: dict = {}  # first signature -> (deadline, tasks waiting for the notifications)
+
+    async def start(self) -> StageTimelineTracker:
+        if self.manager is not None:
+            await self.manager.start()
+            try:
+                await asyncio.wait_for(self.manager.connections[0].connected.wait(), timeout=self.max_interval)
+            except asyncio.TimeoutError:
+                print(f'ERROR: websocket {self.manager.ws_url} is not connected, transaction stages are polled')
+        return self
+
+    def _ws_connected(self) -> bool:
+        return self.manager is not None and any(c.connected.is_set() for c in self.manager.connections)
+
+    def track(self, txn_id: str) -> asyncio.Task:
+        # the same transaction sent again (same blockhash and data) has the same signature, it is tracked once
+        if txn_id in self._tasks:
+            return self._tasks[txn_id]
+        task = self._tasks[txn_id] = asyncio.get_running_loop().create_task(self._track(txn_id))
+        task.add_done_callback(lambda _: self._tasks.pop(txn_id, None))
+        return task
+
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    def add_signature(self, txn_id: str, new_txn_id: str) -> None:
+        # the transaction of 'txn_id' was signed again, the new signature may land instead
+        timeline = self._timelines.get(txn_id)
+        if timeline is None or new_txn_id in timeline.signatures or timeline.is_finalized():
+            return
+        timeline.signatures.append(new_txn_id)
+        self._timelines[new_txn_id] = timeline
+        deadline, watches = self._watches[timeline.txn_id]
+        if self._ws_connected():
+            watches |= self._watch(timeline, new_txn_id, deadline)
+
+    def _watch(self, timeline: StageTimeline, txn_id: str, deadline: float) -> set:
+        return {
+            asyncio.get_running_loop().create_task(self._wait_for_notification(timeline, txn_id, commitment, deadline))
+            for commitment in STAGE_COMMITMENTS
+        }
+
+    async def _track(self, txn_id: str) -> StageTimeline:
+        timeline = StageTimeline(txn_id)
+        deadline = time.monotonic() + self.timeout
+        watches = self._watch(timeline, txn_id, deadline) if self._ws_connected() else set()
+        self._timelines[txn_id] = timeline
+        self._watches[txn_id] = (deadline, watches)
+        try:
+            # the watches of the signatures added meanwhile are waited for too
+            while watches:
+                done = {watch for watch in watches if watch.done()}
+                watches -= done
+                if not done:
+                    await asyncio.wait(watches, return_when=asyncio.FIRST_COMPLETED)
+            if not timeline.is_finalized() and time.monotonic() < deadline:
+                await self._poll(timeline, deadline)
+            return timeline
+        finally:
+            for watch in watches:
+                watch.cancel()
+            for signature in timeline.signatures:
+                self._timelines.pop(signature, None)
+            del self._watches[txn_id]
+
+    async def _wait_for_notification(self, timeline: StageTimeline, txn_id: str, commitment, deadline: float) -> None:
+        try:
+            subscription: Subscription = await self.manager.signature_subscribe(txn_id, commitment)
+        except Exception as e:
+            print(f'ERROR: cannot subscribe {txn_id} at {commitment}, the status is polled: {e}')
+            return
+        try:
+            # the notification is waited for while the socket is up, a dropped socket leaves it to the polling,
+            # another signature of the transaction may reach the stage first
+            while time.monotonic() < deadline and self._ws_connected() and not timeline.reached(commitment):
+                try:
+                    received_at, notification = await asyncio.wait_for(
+                        subscription.get(), timeout=min(deadline - time.monotonic(), self.max_interval)
+                    )
+                except asyncio.TimeoutError:
+                    continue
+                except ConnectionError:
+                    return  # closed with the manager
+                result = notification['result']
+                timeline.record(commitment, received_at, result['context']['slot'], result['value'].get('err'), txn_id)
+                return
+        finally:
+            await self.manager.unsubscribe(subscription)
+
+    async def _poll(self, timeline: StageTimeline, deadline: float) -> None:
+        interval = self.min_interval
+        while not timeline.is_finalized():
+            await asyncio.sleep(min(interval, max(deadline - time.monotonic(), 0)))
+            if time.monotonic() >= deadline:
+                return
+            interval = min(interval * 2, self.max_interval)
+            # all the signatures of the transaction in one request, at most one of them lands
+            signatures = list(timeline.signatures)
+            try:
+                response = await self.client.get_signature_statuses(signatures)
+            except Exception as e:
+                print(f'ERROR: cannot poll status of {timeline.txn_id}: {e}')
+                continue
+            received_at = datetime.utcnow()
+            statuses = response.get('result', {}).get('value') or []
+            landed = [
+                (signature, status) for signature, status in zip(signatures, statuses)
+                if status is not None and status.get('confirmationStatus') is not None
+            ]
+            if not landed:
+                continue
+            txn_id, status = max(landed, key=lambda landed_status: COMMITMENT_RANKS[landed_status[1]['confirmationStatus']])
+            # a poll sees only the highest commitment, the lower stages not seen yet were reached by then
+            rank = COMMITMENT_RANKS[status['confirmationStatus']]
+            for commitment in STAGE_COMMITMENTS[:rank + 1]:
+                if not timeline.reached(commitment):
+                    timeline.polled = True
+                    timeline.record(commitment, received_at, status['slot'], status.get('err'), txn_id)
+
+    async def close(self) -> None:
+        # the stages of all the tracked transactions are waited for, up to the timeout
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks.values()), return_exceptions=True)
+        if self.manager is not None:
+            await self.manager.close()
+
+    async def __aenter__(self) -> StageTimelineTracker:
+        return await self.start()
+
+    async def __aexit__(self, _exc_type, _exc, _tb) -> None:
+        await self.close()
@@ -0,0 +1,78 @@
+import base64
+import contextlib
+import os
+import sys
+
+import pytest
+from aiohttp import web
+from solana.blockhash import Blockhash
+from solana.keypair import Keypair
+
+# the client modules are flat scripts next to this directory, not a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_validator import MockValidator, MockAccount, DEFAULT_FUND_LAMPORTS  # noqa: E402
+
+
+class FakeClock:
+    # stands for time.monotonic, moved by the test only
+    def __init__(self, now: float = 1000.0) -> None:
+        self.now: float = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def fake_clock(monkeypatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr('time.monotonic', clock)
+    return clock
+
+
+class MockCluster:
+    # in-process mock validator with a funded payer and the counter program, driven by JSON-RPC requests
+    def __init__(self) -> None:
+        self.validator: MockValidator = MockValidator(slot_time=0.01, latency=0, jitter=0, confirm_slots=1, finalize_slots=2, seed=0)
+        self.payer: Keypair = Keypair()
+        self.program: Keypair = Keypair()
+        self.validator.accounts[str(self.payer.public_key)] = MockAccount(DEFAULT_FUND_LAMPORTS)
+        self.validator.add_program(str(self.program.public_key))
+
+    def request(self, method: str, *params):
+        response = self.validator.handle_request({'jsonrpc': '2.0', 'id': 1, 'method': method, 'params': list(params)})
+        assert 'error' not in response, response
+        return response['result']
+
+    def send(self, txn, *signers, skip_preflight: bool = False) -> str:
+        txn.recent_blockhash = Blockhash(self.validator.blockhash)
+        txn.sign(self.payer, *signers)
+        return self.request('sendTransaction', base64.b64encode(txn.serialize()).decode(),
+            {'encoding': 'base64', 'skipPreflight': skip_preflight})
+
+    def lamports(self, pubkey) -> int:
+        return self.validator.accounts[str(pubkey)].lamports
+
+
+@pytest.fixture
+def mock_cluster() -> MockCluster:
+    return MockCluster()
+
+
+@contextlib.asynccontextmanager
+async def serve_mock(validator: MockValidator, port: int = 0):
+    # the mock validator on a local port (any free one by default), yields the HTTP and the websocket URL
+    app = web.Application()
+    app.router.add_post('/', validator.rpc_handler)
+    app.router.add_get('/', validator.ws_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', port)
+    await site.start()
+    await validator.start()
+    port = runner.addresses[0][1]
+    try:
+        yield f'http://127.0.0.1:{port}', f'ws://127.0.0.1:{port}'
+    finally:
+        await validator.close()
+        await runner.cleanup()
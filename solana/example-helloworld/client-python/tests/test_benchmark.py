@@ -0,0 +1,24 @@
+from argparse import Namespace
+
+from benchmark import get_benchmarks, run, compare
+
+
+def test_every_benchmark_runs():
+    for name, operation in get_benchmarks().items():
+        operation()
+
+
+def test_run_measures_the_filtered_benchmarks():
+    results = run(Namespace(filter='decode_counter_account', rounds=1, round_time=0.001))
+    assert list(results) == ['decode_counter_account']
+    result = results['decode_counter_account']
+    assert result['ops_per_sec'] > 0 and result['calls_per_round'] >= 1
+    assert result['peak_bytes_per_op'] >= 0
+
+
+def test_compare_fails_on_regression():
+    baseline = {'op': {'ops_per_sec': 1000, 'peak_bytes_per_op': 100}}
+    assert compare({'op': {'ops_per_sec': 950, 'peak_bytes_per_op': 100}}, baseline, max_regression=10)
+    assert not compare({'op': {'ops_per_sec': 850, 'peak_bytes_per_op': 100}}, baseline, max_regression=10)
+    # a benchmark new since the baseline is not a regression
+    assert compare({'new': {'ops_per_sec': 1, 'peak_bytes_per_op': 0}}, baseline, max_regression=10)
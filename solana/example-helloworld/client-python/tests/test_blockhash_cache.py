@@ -0,0 +1,112 @@
+import asyncio
+import base64
+
+import pytest
+from solana.keypair import Keypair
+from solana.rpc.core import RPCException
+from solana.system_program import transfer, TransferParams
+from solana.transaction import Transaction
+
+from blockhash_cache import RecentBlockhashCache, is_blockhash_not_found
+
+
+class FakeClient:
+    # answers the blockhash requests with a new blockhash every time, getLatestBlockhash may be unknown
+    def __init__(self, latest_supported: bool = True) -> None:
+        self.latest_supported: bool = latest_supported
+        self.calls: list = []
+        self.answer: asyncio.Event = None
+
+    async def _blockhash(self, method: str, value: dict) -> dict:
+        self.calls.append(method)
+        if self.answer is not None:
+            await self.answer.wait()
+        value['blockhash'] = str(Keypair().public_key)
+        return {'jsonrpc': '2.0', 'id': len(self.calls), 'result': {'context': {'slot': len(self.calls)}, 'value': value}}
+
+    async def get_latest_blockhash(self, commitment=None) -> dict:
+        if not self.latest_supported:
+            self.calls.append('getLatestBlockhash')
+            return {'jsonrpc': '2.0', 'id': len(self.calls), 'error': {'code': -32601, 'message': 'Method not found'}}
+        return await self._blockhash('getLatestBlockhash', {'lastValidBlockHeight': 300})
+
+    async def get_fees(self, commitment=None) -> dict:
+        return await self._blockhash('getFees', {
+            'feeCalculator': {'lamportsPerSignature': 10000}, 'lastValidSlot': 310, 'lastValidBlockHeight': 300
+        })
+
+
+def test_concurrent_refreshes_share_one_request():
+    client = FakeClient()
+
+    async def run():
+        client.answer = asyncio.Event()
+        cache = RecentBlockhashCache(client)
+        refreshes = [asyncio.ensure_future(cache.refresh()) for _ in range(5)]
+        await asyncio.sleep(0)
+        client.answer.set()
+        return await asyncio.gather(*refreshes)
+    results = asyncio.run(run())
+    assert client.calls == ['getLatestBlockhash']
+    assert all(result is results[0] for result in results)
+    assert results[0].last_valid_block_height == 300 and results[0].lamports_per_signature == 5000
+
+
+def test_blockhash_older_than_max_age_is_fetched_again(fake_clock):
+    client = FakeClient()
+
+    async def run():
+        cache = RecentBlockhashCache(client, max_age=60.0)
+        first = (await cache.refresh()).blockhash
+        fake_clock.now += 59.0
+        assert cache.get() == first and await cache.get_or_refresh() == first
+        fake_clock.now += 2.0
+        with pytest.raises(ValueError):
+            cache.get()
+        second = await cache.get_or_refresh()
+        return first, second, cache.get()
+    first, second, current = asyncio.run(run())
+    assert second != first and current == second
+    assert client.calls == ['getLatestBlockhash', 'getLatestBlockhash']
+
+
+def test_invalidated_blockhash_is_not_served():
+    async def run():
+        cache = RecentBlockhashCache(FakeClient())
+        blockhash = (await cache.refresh()).blockhash
+        cache.invalidate(blockhash)
+        with pytest.raises(ValueError):
+            cache.get()
+        return blockhash, await cache.get_or_refresh()
+    invalidated, fresh = asyncio.run(run())
+    assert fresh != invalidated
+
+
+def test_falls_back_to_get_fees_when_latest_blockhash_is_unknown():
+    client = FakeClient(latest_supported=False)
+
+    async def run():
+        cache = RecentBlockhashCache(client)
+        first = await cache.refresh()
+        await cache.get_or_refresh()
+        cache.invalidate()
+        return first, await cache.refresh()
+    first, second = asyncio.run(run())
+    assert client.calls == ['getLatestBlockhash', 'getFees', 'getFees']
+    assert first.lamports_per_signature == 10000 and first.last_valid_slot == 310
+    assert second.blockhash != first.blockhash
+
+
+def test_blockhash_not_found_is_matched_by_the_rpc_error(mock_cluster):
+    txn = Transaction(recent_blockhash=str(Keypair().public_key), fee_payer=mock_cluster.payer.public_key).add(
+        transfer(TransferParams(from_pubkey=mock_cluster.payer.public_key, to_pubkey=Keypair().public_key, lamports=1))
+    )
+    txn.sign(mock_cluster.payer)
+    response = mock_cluster.validator.handle_request({'jsonrpc': '2.0', 'id': 1, 'method': 'sendTransaction',
+        'params': [base64.b64encode(txn.serialize()).decode(), {'encoding': 'base64'}]})
+    assert is_blockhash_not_found(RPCException(response['error']))
+    # other preflight failures, bare messages and other exceptions are not
+    assert not is_blockhash_not_found(RPCException({'code': -32002, 'message': 'Transaction simulation failed',
+        'data': {'err': 'AccountNotFound'}}))
+    assert not is_blockhash_not_found(RPCException('Blockhash not found'))
+    assert not is_blockhash_not_found(ValueError({'code': -32002, 'data': {'err': 'BlockhashNotFound'}}))
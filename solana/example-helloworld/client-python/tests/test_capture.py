@@ -0,0 +1,51 @@
+from capture import (
+    CaptureReader, CaptureWriter, CaptureRecord, KIND_STREAM, KIND_HTTP_REQUEST, KIND_HTTP_RESPONSE, KIND_WS_RECEIVE
+)
+
+
+def write_capture(path) -> CaptureWriter:
+    writer = CaptureWriter(str(path))
+    http, ws = writer.stream('http://127.0.0.1:8899'), writer.stream('ws://127.0.0.1:8900')
+    exchange = writer.exchange_id()
+    writer.write(KIND_HTTP_REQUEST, http, exchange, b'{"id":1,"method":"getSlot"}', at=10.0)
+    writer.write(KIND_HTTP_RESPONSE, http, exchange, b'{"id":1,"result":5}', at=10.25)
+    writer.write(KIND_WS_RECEIVE, ws, 3, b'{"method":"slotNotification"}', at=11.0)
+    writer.close()
+    return writer
+
+
+def test_write_and_read(tmp_path):
+    path = tmp_path / 'run.cap'
+    writer = write_capture(path)
+    reader = CaptureReader(str(path))
+    records = list(reader)
+    assert writer.records == len(records) == 5
+    assert [record.kind for record in records if record.kind == KIND_STREAM] == [KIND_STREAM] * 2
+    assert records[2:] == [
+        CaptureRecord(KIND_HTTP_REQUEST, 0, 10.0, 1, b'{"id":1,"method":"getSlot"}'),
+        CaptureRecord(KIND_HTTP_RESPONSE, 0, 10.25, 1, b'{"id":1,"result":5}'),
+        CaptureRecord(KIND_WS_RECEIVE, 1, 11.0, 3, b'{"method":"slotNotification"}'),
+    ]
+    assert reader.streams == {0: 'http://127.0.0.1:8899', 1: 'ws://127.0.0.1:8900'}
+    assert not reader.truncated
+    assert (reader.wall_time(11.0) - reader.wall_time(10.0)).total_seconds() == 1.0
+
+
+def test_stream_is_written_once(tmp_path):
+    writer = CaptureWriter(str(tmp_path / 'run.cap'))
+    assert writer.stream('ws://a') == writer.stream('ws://a') == 0
+    assert writer.stream('ws://a', new=True) == 1
+    writer.close()
+    assert writer.records == 2
+
+
+def test_truncated_record_is_ignored(tmp_path):
+    path = tmp_path / 'run.cap'
+    write_capture(path)
+    with open(path, 'r+b') as capture_file:
+        capture_file.truncate(path.stat().st_size - 3)
+    reader = CaptureReader(str(path))
+    records = list(reader)
+    assert reader.truncated
+    assert len(records) == 4
+    assert records[-1].kind == KIND_HTTP_RESPONSE
@@ -0,0 +1,78 @@
+import asyncio
+import time
+
+from datetime import datetime, timedelta
+
+from confirmation_tracker import ConfirmationTracker, ConfirmationResult
+
+
+class StatusClient:
+    # answers getSignatureStatuses from a dict, a signature not in it is not known to the cluster
+    def __init__(self, statuses: dict) -> None:
+        self.statuses: dict = statuses
+        self.block_time_slots: list = []
+
+    async def get_signature_statuses(self, txn_ids: list) -> dict:
+        return {'result': {'value': [self.statuses.get(txn_id) for txn_id in txn_ids]}}
+
+    async def get_block_time(self, slot: int) -> dict:
+        self.block_time_slots.append(slot)
+        return {'result': 1651406400 + slot}
+
+
+def test_failed_transaction_is_not_confirmed():
+    async def confirm() -> list:
+        client = StatusClient({
+            'ok': {'slot': 10, 'confirmationStatus': 'confirmed', 'err': None},
+            'failed': {'slot': 11, 'confirmationStatus': 'confirmed', 'err': {'InstructionError': [0, 'IncorrectProgramId']}},
+        })
+        async with ConfirmationTracker(client, min_interval=0.01, timeout=0.5) as tracker:
+            results = await asyncio.gather(tracker.track('ok'), tracker.track('failed'), tracker.track('unknown'))
+            return (*results, client.block_time_slots)
+
+    ok, failed, unknown, block_time_slots = asyncio.run(confirm())
+    assert ok.is_confirmed() and ok.is_landed() and not ok.is_failed()
+    assert not failed.is_confirmed() and failed.is_landed() and failed.is_failed()
+    assert failed.slot == 11 and failed.block_time is None
+    # the block time is not asked for the slot of the failed transaction
+    assert block_time_slots == [10]
+    assert not unknown.is_confirmed() and not unknown.is_landed() and not unknown.is_failed()
+
+
+def test_result_without_confirmation_time_is_not_landed():
+    result = ConfirmationResult('txn', err={'InstructionError': [0, 'Custom']})
+    assert not result.is_landed() and not result.is_failed()
+
+
+def test_expired_in_deadline_order():
+    async def confirm() -> tuple:
+        client = StatusClient({'ok': {'slot': 10, 'confirmationStatus': 'confirmed', 'err': None}})
+        async with ConfirmationTracker(client, min_interval=0.01, timeout=5) as tracker:
+            late = tracker.track('late', timeout=0.2)
+            early = tracker.track('early', timeout=0.05)
+            ok = tracker.track('ok', timeout=0.1)
+            resolved = await asyncio.gather(early, ok)
+            waiting = tracker.pending()
+            resolved.append(await late)
+            return resolved, waiting, tracker.pending(), len(tracker._deadlines)
+
+    (early, ok, late), waiting, pending, deadlines = asyncio.run(confirm())
+    assert not early.is_landed() and ok.is_confirmed() and not late.is_landed()
+    assert (waiting, pending, deadlines) == (1, 0, 0)
+
+
+def test_block_time_is_utc_in_any_time_zone(monkeypatch):
+    monkeypatch.setenv('TZ', 'America/New_York')
+    time.tzset()
+    try:
+        async def confirm() -> ConfirmationResult:
+            client = StatusClient({'ok': {'slot': 10, 'confirmationStatus': 'confirmed', 'err': None}})
+            async with ConfirmationTracker(client, min_interval=0.01, timeout=0.5) as tracker:
+                return await tracker.track('ok')
+
+        result = asyncio.run(confirm())
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+    # comparable to the datetime.utcnow() the client starts the latencies at
+    assert result.block_time == datetime(1970, 1, 1) + timedelta(seconds=1651406410)
@@ -0,0 +1,130 @@
+from datetime import datetime
+
+from correlation import TimingWheel, CorrelationStore, correlation_key, join_key, split_correlation_key
+
+
+def test_key_expires_after_timeout(fake_clock):
+    wheel = TimingWheel(timeout=10, tick=1)
+    wheel.schedule(1)
+    fake_clock.now += 9.5
+    assert wheel.advance() == []
+    fake_clock.now += 1
+    assert wheel.advance() == [1]
+    assert len(wheel) == 0
+
+
+def test_lagging_wheel_does_not_expire_fresh_key(fake_clock):
+    wheel = TimingWheel(timeout=2, tick=1)
+    fake_clock.now = 1000.5
+    wheel.advance()
+    # the wheel is not advanced for two ticks, the key is scheduled meanwhile
+    fake_clock.now = 1002.2
+    wheel.schedule(7)
+    fake_clock.now = 1002.3
+    assert wheel.advance() == []
+    fake_clock.now = 1004.1
+    assert wheel.advance() == [7]
+
+
+def test_wheel_lagging_more_than_a_revolution(fake_clock):
+    wheel = TimingWheel(timeout=3, tick=1)
+    wheel.schedule(1)
+    fake_clock.now += 20
+    wheel.schedule(2)
+    assert wheel.advance() == [1]
+    fake_clock.now += 4
+    assert wheel.advance() == [2]
+
+
+def test_reschedule_and_cancel(fake_clock):
+    wheel = TimingWheel(timeout=5, tick=1)
+    wheel.schedule(1)
+    wheel.schedule(2)
+    fake_clock.now += 3
+    wheel.schedule(1)
+    wheel.cancel(2)
+    fake_clock.now += 3
+    assert wheel.advance() == []
+    fake_clock.now += 3
+    assert wheel.advance() == [1]
+
+
+def test_correlation_key_round_trip():
+    key = correlation_key(42, 'provider-a')
+    assert split_correlation_key(key) == (42, 'provider-a')
+    assert correlation_key(43, 'provider-a') != key
+    assert correlation_key(42, 'provider-b') != key
+
+
+def test_join_key_has_seconds_precision():
+    client_time = datetime(2022, 5, 1, 12, 0, 30, 250000)
+    assert join_key(client_time.replace(microsecond=0), 'provider-a') == join_key(client_time, 'provider-a')
+    assert join_key(client_time, 'provider-b') != join_key(client_time, 'provider-a')
+    assert join_key(client_time, 'provider-a', 1) != join_key(client_time, 'provider-a', 2)
+
+
+class Record:
+    def __init__(self, key: int = None, complete: bool = False, joins: tuple = None, notified: bool = False) -> None:
+        self.key = key
+        self.complete = complete
+        self.joins = joins
+        self.notified = notified
+        self.sends = [key] if key is not None else []
+
+    def id(self) -> int:
+        return self.key
+
+    def join_key(self) -> tuple:
+        return self.joins
+
+    def merge(self, other):
+        self.key = self.key if self.key is not None else other.key
+        self.joins = self.joins or other.joins
+        self.complete = self.complete or other.complete
+        self.notified = self.notified or other.notified
+        self.sends += other.sends
+        return self
+
+
+def test_store_completes_and_expires(fake_clock):
+    completed, expired = [], []
+    store = CorrelationStore(lambda r: r.complete, completed.append, expired.append, timeout=5)
+    store.update(Record(1))
+    store.update(Record(2))
+    store.update(Record(1, complete=True))
+    assert [r.key for r in completed] == [1]
+    fake_clock.now += 6
+    store.expire()
+    assert [r.key for r in expired] == [2]
+    assert len(store) == 0
+
+
+def test_sends_of_the_same_second_are_kept_apart(fake_clock):
+    completed = []
+    store = CorrelationStore(lambda r: r.notified, completed.append, lambda r: None, timeout=5)
+    for key in (1, 2, 3):
+        store.update(Record(key, joins=('second', None)))
+    assert len(store) == 3
+    for _ in range(3):
+        store.update(Record(joins=('second', None), notified=True))
+    # the notifications are joined in the send order, no record is lost
+    assert [r.key for r in completed] == [1, 2, 3]
+    assert store.joined == 3
+    assert store.ambiguous_joins == 2
+    assert len(store) == 0
+
+
+def test_notification_waits_for_its_send(fake_clock):
+    completed, expired = [], []
+    store = CorrelationStore(lambda r: r.notified and r.sends, completed.append, expired.append, timeout=5)
+    store.update(Record(joins=('second', 1), notified=True))
+    store.update(Record(joins=('other', 1), notified=True))
+    assert len(store) == 2
+    store.update(Record(7, joins=('second', 1)))
+    assert [r.key for r in completed] == [7]
+    assert store.ambiguous_joins == 0
+    fake_clock.now += 6
+    store.expire()
+    # the notification nobody sent for expires as any record
+    assert [r.joins for r in expired] == [('other', 1)]
+    assert len(store) == 0
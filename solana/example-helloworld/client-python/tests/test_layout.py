@@ -0,0 +1,42 @@
+from datetime import datetime
+
+import pytest
+
+import layout
+
+
+def test_counter_account_round_trip():
+    data = layout.encode_counter_account(42, 1651406400, 1651406399)
+    assert len(data) == layout.COUNTER_ACCOUNT_SIZE == layout.COUNTER_ACCOUNT.sizeof()
+    account = layout.decode_counter_account(data)
+    assert account == (42, 1651406400, 1651406399)
+    # the fast codec reads the same bytes as the construct layout
+    parsed = layout.COUNTER_ACCOUNT.parse(data)
+    assert parsed.counter == account.counter
+    assert parsed.timestamp == account.timestamp_datetime()
+    assert parsed.client_timestamp == account.client_timestamp_datetime()
+
+
+def test_decode_counter_account_at_offset():
+    data = b'\x00' * 3 + layout.encode_counter_account(7, -1, 0)
+    assert layout.decode_counter_account(data, offset=3) == (7, -1, 0)
+    with pytest.raises(ValueError):
+        layout.decode_counter_account(data[:-1], offset=3)
+
+
+def test_counter_instruction_matches_construct_layout():
+    client_time = datetime(2022, 5, 1, 12, 0, 30, 250000)
+    data = layout.encode_counter_instruction(client_time)
+    assert data == layout.COUNTER_INSTRUCTION.build({'client_timestamp': client_time})
+    assert layout.encode_counter_instruction(int(client_time.timestamp())) == data
+    assert layout.COUNTER_INSTRUCTION_FORMAT.unpack(data) == (1, int(client_time.timestamp()))
+
+
+def test_decode_counter_accounts_in_bulk():
+    buffers = [layout.encode_counter_account(counter, 1000 + counter, 2000 + counter) for counter in range(5)]
+    accounts = layout.decode_counter_accounts(buffers)
+    assert accounts['counter'].tolist() == list(range(5))
+    assert accounts['client_timestamp'].tolist() == [2000 + counter for counter in range(5)]
+    assert layout.to_datetimes(accounts['timestamp'][:1]) == [datetime.fromtimestamp(1000)]
+    with pytest.raises(ValueError):
+        layout.decode_counter_accounts(buffers + [b'\x00'])
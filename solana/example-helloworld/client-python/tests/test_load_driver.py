@@ -0,0 +1,108 @@
+import asyncio
+import json
+import queue
+import sqlite3
+import sys
+import threading
+from argparse import Namespace
+
+from solana.keypair import Keypair
+
+import hello_client
+from conftest import serve_mock
+from load_driver import LoadCoordinator, worker_share
+from metrics import LogHistogram, MetricsRegistry
+from mock_validator import MockAccount, MockValidator, DEFAULT_FUND_LAMPORTS
+
+
+def histogram(*seconds) -> LogHistogram:
+    result = LogHistogram()
+    for value in seconds:
+        result.record(value)
+    return result
+
+
+def test_worker_share_splits_the_total():
+    assert [worker_share(10, worker, 3) for worker in range(3)] == [4, 3, 3]
+    assert [worker_share(1.5, worker, 3) for worker in range(3)] == [0.5, 0.5, 0.5]
+
+
+def test_summaries_of_the_workers_are_merged():
+    registry = MetricsRegistry()
+    coordinator = LoadCoordinator(None, Namespace(), 2, registry=registry)
+    confirmed = ('confirmed', 'onering', 'confirmed', '')
+    coordinator._merge({'load_stats': {'sent': 3, 'confirmed': 2}, 'sending_time': 2.0,
+        'histograms': {confirmed: histogram(0.1, 0.2)}, 'wins': {'accept': {'onering': 3}}})
+    coordinator._merge({'load_stats': {'sent': 2, 'confirmed': 2}, 'sending_time': 3.0,
+        'histograms': {confirmed: histogram(0.4), ('rpc_accept', 'onering', 'confirmed', ''): histogram(0.01)},
+        'wins': {'accept': {'onering': 2}}})
+    assert coordinator.load_stats == {'sent': 5, 'confirmed': 4}
+    assert coordinator.sending_time == 3.0
+    assert coordinator.wins == {'accept': {'onering': 5}}
+    merged = registry.histograms[confirmed]
+    assert merged.count == 3 and abs(merged.sum - 0.7) < 1e-9
+    assert merged.min == 0.1 and merged.max == 0.4
+    assert abs(merged.quantile(1.0) - 0.4) / 0.4 < 0.02
+    assert registry.histograms[('rpc_accept', 'onering', 'confirmed', '')].count == 1
+
+
+class MockValidatorThread:
+    # the mock validator served from its own event loop, the load coordinator blocks the main thread
+    def __init__(self, validator: MockValidator) -> None:
+        self.validator: MockValidator = validator
+        self._urls: queue.Queue = queue.Queue()
+        self._loop: asyncio.AbstractEventLoop = None
+        self._stop: asyncio.Event = None
+        self._thread: threading.Thread = threading.Thread(target=lambda: asyncio.run(self._serve()), daemon=True)
+
+    async def _serve(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        async with serve_mock(self.validator) as urls:
+            self._urls.put(urls)
+            await self._stop.wait()
+
+    def __enter__(self) -> tuple:
+        self._thread.start()
+        return self._urls.get(timeout=10)
+
+    def __exit__(self, _exc_type, _exc, _tb) -> None:
+        self._loop.call_soon_threadsafe(self._stop.set)
+        self._thread.join(timeout=10)
+
+
+def write_keypair(path, keypair: Keypair) -> str:
+    path.write_text(json.dumps(list(keypair.secret_key)))
+    return str(path)
+
+
+def test_two_workers_send_their_share_to_the_mock_validator(tmp_path, monkeypatch, capsys):
+    payer, program = Keypair(), Keypair()
+    validator = MockValidator(slot_time=0.01, latency=0, jitter=0, confirm_slots=1, finalize_slots=2, seed=0)
+    validator.accounts[str(payer.public_key)] = MockAccount(DEFAULT_FUND_LAMPORTS)
+    validator.add_program(str(program.public_key))
+    db = tmp_path / 'results.db'
+    registry = MetricsRegistry()
+    monkeypatch.setattr(hello_client, 'METRICS', registry)
+    with MockValidatorThread(validator) as (url, ws):
+        monkeypatch.setattr(sys, 'argv', ['hello_client.py', '-k', write_keypair(tmp_path / 'payer.json', payer),
+            '-p', write_keypair(tmp_path / 'program.json', program), '--url', url, '--ws', ws, '--load',
+            '--workers', '2', '--shards', '2', '--txn-count', '9', '--tps', '30', '--sleep-time', '0',
+            '--bootstrap-cache', '', '--db', str(db), '--db-flush-interval-ms', '50', '--metrics-port', '0',
+            '--metrics-summary-interval', '0'])
+        # the client takes the event loop of the thread and closes it at the end
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        hello_client.main_load_workers(hello_client.get_args())
+        asyncio.set_event_loop(None)
+    out = capsys.readouterr().out
+    assert "Load finished: {'sent': 9, 'failed': 0, 'confirmed': 9" in out
+    assert 'by 2 workers' in out and 'ERROR' not in out
+    assert validator.stats['landed'] >= 9
+    # one data account shard per worker, the rows of the sends reach the sink of the coordinator
+    with sqlite3.connect(db) as connection:
+        shards = dict(connection.execute(
+            "SELECT shard, COUNT(*) FROM transaction_processing_data WHERE txn_id IS NOT NULL GROUP BY shard"
+        ).fetchall())
+    assert shards == {0: 5, 1: 4}
+    confirmed = [histogram for key, histogram in registry.histograms.items() if key[0] == 'confirmed']
+    assert sum(histogram.count for histogram in confirmed) == 9
@@ -0,0 +1,45 @@
+import math
+
+import pytest
+
+from metrics import LogHistogram
+
+
+def test_quantiles_within_precision():
+    histogram = LogHistogram(precision=0.01)
+    values = [index / 1000 for index in range(1, 10001)]  # 1ms .. 10s
+    for value in values:
+        histogram.record(value)
+    for q in (0.5, 0.9, 0.99):
+        exact = values[math.ceil(q * len(values)) - 1]
+        assert histogram.quantile(q) == pytest.approx(exact, rel=0.01)
+    assert histogram.quantile(1.0) == histogram.max == 10.0
+    assert histogram.min == 0.001
+    assert histogram.count == len(values)
+    assert histogram.sum == pytest.approx(sum(values))
+
+
+def test_values_out_of_range():
+    histogram = LogHistogram(lowest=0.001, highest=10)
+    assert math.isnan(histogram.quantile(0.5))
+    histogram.record(-0.5)
+    histogram.record(0)
+    histogram.record(100)
+    assert histogram.quantile(0.1) == -0.5
+    # a value over 'highest' counts to the last bucket, only the max is exact
+    assert histogram.quantile(1.0) == pytest.approx(10, rel=0.01)
+    assert histogram.max == 100
+
+
+def test_merge():
+    first, second = LogHistogram(), LogHistogram()
+    for value in range(1, 51):
+        first.record(value / 100)
+    for value in range(51, 101):
+        second.record(value / 100)
+    merged = first.merge(second)
+    assert merged.count == 100
+    assert (merged.min, merged.max) == (0.01, 1.0)
+    assert merged.quantile(0.5) == pytest.approx(0.5, rel=0.01)
+    with pytest.raises(ValueError):
+        merged.merge(LogHistogram(precision=0.1))
@@ -0,0 +1,109 @@
+import asyncio
+import base64
+
+from solana.blockhash import Blockhash
+from solana.keypair import Keypair
+from solana.system_program import create_account_with_seed, CreateAccountWithSeedParams
+from solana.transaction import Transaction
+
+import layout
+from mock_validator import MockAccount, LAMPORTS_PER_SIGNATURE
+from transactions import get_counter_txn, get_data_account_pubkey, get_data_account_seed
+
+
+def create_data_account_txn(cluster) -> Transaction:
+    return Transaction(fee_payer=cluster.payer.public_key).add(create_account_with_seed(CreateAccountWithSeedParams(
+        from_pubkey=cluster.payer.public_key,
+        base_pubkey=cluster.payer.public_key,
+        new_account_pubkey=get_data_account_pubkey(cluster.payer.public_key, cluster.program.public_key),
+        seed=get_data_account_seed(),
+        lamports=10**6,
+        space=layout.COUNTER_ACCOUNT_SIZE,
+        program_id=cluster.program.public_key
+    )))
+
+
+async def land(cluster, *signatures) -> list:
+    # no latency, the transactions land on the next turn of the loop
+    await asyncio.sleep(0.01)
+    return cluster.request('getSignatureStatuses', list(signatures))['value']
+
+
+def test_counter_transaction_increments_counter(mock_cluster):
+    data_pubkey = get_data_account_pubkey(mock_cluster.payer.public_key, mock_cluster.program.public_key)
+
+    async def run():
+        create = mock_cluster.send(create_data_account_txn(mock_cluster))
+        # the data account does not exist before the create lands, the simulation would fail
+        increment = mock_cluster.send(
+            get_counter_txn(mock_cluster.payer.public_key, mock_cluster.program.public_key, data_pubkey),
+            mock_cluster.program, skip_preflight=True
+        )
+        return await land(mock_cluster, create, increment)
+
+    created, incremented = asyncio.run(run())
+    assert created['err'] is None and incremented['err'] is None
+    account = layout.decode_counter_account(mock_cluster.validator.accounts[str(data_pubkey)].data)
+    assert account.counter == 1
+
+
+def test_failed_transaction_is_rolled_back_and_charged(mock_cluster):
+    data_pubkey = get_data_account_pubkey(mock_cluster.payer.public_key, mock_cluster.program.public_key)
+    # the data account exists already, creating it again fails after the payer was debited
+    mock_cluster.validator.accounts[str(data_pubkey)] = MockAccount(
+        10**6, layout.encode_counter_account(0, 0, 0), str(mock_cluster.program.public_key)
+    )
+    balance = mock_cluster.lamports(mock_cluster.payer.public_key)
+
+    async def run():
+        return await land(mock_cluster, mock_cluster.send(create_data_account_txn(mock_cluster), skip_preflight=True))
+
+    failed, = asyncio.run(run())
+    assert failed['err'] is not None
+    assert mock_cluster.lamports(mock_cluster.payer.public_key) == balance - LAMPORTS_PER_SIGNATURE
+    assert mock_cluster.lamports(data_pubkey) == 10**6
+
+
+def test_preflight_refuses_a_failing_transaction_without_charging(mock_cluster):
+    data_pubkey = get_data_account_pubkey(mock_cluster.payer.public_key, mock_cluster.program.public_key)
+    txn = get_counter_txn(mock_cluster.payer.public_key, mock_cluster.program.public_key, data_pubkey)
+    txn.recent_blockhash = Blockhash(mock_cluster.validator.blockhash)
+    txn.sign(mock_cluster.payer, mock_cluster.program)
+    balance = mock_cluster.lamports(mock_cluster.payer.public_key)
+    response = mock_cluster.validator.handle_request({'jsonrpc': '2.0', 'id': 1, 'method': 'sendTransaction',
+        'params': [base64.b64encode(txn.serialize()).decode(), {'encoding': 'base64'}]})
+    assert response['error']['code'] == -32002
+    assert response['error']['data']['err'] == {'InstructionError': [0, 'IncorrectProgramId']}
+    assert mock_cluster.validator.stats['sent'] == 0 and not mock_cluster.validator.pending
+    assert mock_cluster.lamports(mock_cluster.payer.public_key) == balance
+
+
+def test_skipped_preflight_with_unknown_blockhash_never_lands(mock_cluster):
+    txn = create_data_account_txn(mock_cluster)
+    txn.recent_blockhash = Blockhash(str(Keypair().public_key))
+    txn.sign(mock_cluster.payer)
+
+    async def run():
+        signature = mock_cluster.request('sendTransaction', base64.b64encode(txn.serialize()).decode(),
+            {'encoding': 'base64', 'skipPreflight': True})
+        return await land(mock_cluster, signature)
+    assert asyncio.run(run()) == [None]
+    assert mock_cluster.validator.stats['sent'] == 1 and mock_cluster.validator.stats['landed'] == 0
+
+
+def test_skipped_slots_have_no_block(mock_cluster):
+    validator = mock_cluster.validator
+    validator.skip_rate = 0.5
+
+    async def run():
+        await validator.start()
+        await asyncio.sleep(0.3)
+        await validator.close()
+    asyncio.run(run())
+    assert validator.skipped_slots
+    assert mock_cluster.request('getBlockHeight') == validator.slot - len(validator.skipped_slots)
+    latest = mock_cluster.request('getLatestBlockhash')['value']
+    assert latest['lastValidBlockHeight'] == validator.block_height + 150
+    skipped = min(validator.skipped_slots)
+    response = validator.handle_request({'jsonrpc': '2.0', 'id': 1, 'method': 'getBlockTime', 'params': [skipped]})
+    assert response['error']['code'] == -32007
@@ -0,0 +1,68 @@
+import asyncio
+
+from solana.keypair import Keypair
+from solana.rpc.commitment import Confirmed
+from solana.system_program import transfer, TransferParams
+from solana.transaction import Transaction
+
+from blockhash_cache import RecentBlockhashCache
+from confirmation_tracker import ConfirmationTracker
+from conftest import serve_mock
+from rebroadcaster import Rebroadcaster
+from rpc_session import RpcSession
+
+
+def rebroadcast(cluster, drop_until_resigned: bool, max_resigns: int, timeout: float) -> tuple:
+    # a transfer rebroadcast against the mock validator dropping every send until it is signed again
+    cluster.validator.drop_rate = 1.0
+    receiver = Keypair().public_key
+
+    def sign(blockhash) -> Transaction:
+        txn = Transaction(recent_blockhash=blockhash, fee_payer=cluster.payer.public_key).add(transfer(TransferParams(
+            from_pubkey=cluster.payer.public_key, to_pubkey=receiver, lamports=1000
+        )))
+        txn.sign(cluster.payer)
+        return txn
+
+    def on_resign(txn_id: str, new_txn_id: str) -> None:
+        if drop_until_resigned:
+            cluster.validator.drop_rate = 0.0
+
+    async def run():
+        async with serve_mock(cluster.validator) as (url, _), RpcSession() as session:
+            client = session.client(url, Confirmed)
+            async with RecentBlockhashCache(client, refresh_interval=0.1) as blockhash_cache, \
+                    ConfirmationTracker(client, min_interval=0.01, max_interval=0.05, timeout=timeout) as tracker:
+                rebroadcaster = Rebroadcaster(
+                    client, tracker, blockhash_cache, interval=0.05, max_resigns=max_resigns, timeout=timeout,
+                    on_resign=on_resign
+                )
+                broadcast = await rebroadcaster.send(sign)
+                result = await rebroadcaster.track(broadcast.txn_id)
+                pending = tracker.pending()
+                await rebroadcaster.close()
+                return broadcast, result, pending, rebroadcaster.stats
+    return asyncio.run(run())
+
+
+def test_re_signed_transaction_lands_and_its_siblings_are_untracked(mock_cluster):
+    # a blockhash expires after 150 slots, 0.75 seconds of the mock
+    mock_cluster.validator.slot_time = 0.005
+    broadcast, result, pending, stats = rebroadcast(mock_cluster, drop_until_resigned=True, max_resigns=3, timeout=10)
+    assert result.is_confirmed()
+    assert broadcast.resigns == 1 and len(broadcast.signatures) == 2
+    assert result.txn_id == broadcast.signatures[1] and result.sends == broadcast.sends
+    assert broadcast.sends > 2  # resent while the first blockhash was valid
+    # the first signature is not polled until the timeout
+    assert pending == 0
+    assert stats['resigns'] == 1 and stats['expired'] == 0
+
+
+def test_gives_up_after_the_last_blockhash_expires(mock_cluster):
+    mock_cluster.validator.slot_time = 0.005
+    broadcast, result, pending, stats = rebroadcast(mock_cluster, drop_until_resigned=False, max_resigns=1, timeout=2.5)
+    assert not result.is_landed()
+    # signed once more only, then resent with the expired blockhash until the timeout
+    assert broadcast.resigns == 1 and result.txn_id == broadcast.signatures[-1]
+    assert pending == 0
+    assert stats['expired'] == 1 and stats['resigns'] == 1
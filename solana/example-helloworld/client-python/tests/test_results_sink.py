@@ -0,0 +1,77 @@
+import asyncio
+import sqlite3
+from datetime import datetime
+
+from processing_data import TransactionProcessingData
+from results_sink import ADDED_COLUMNS, SqliteResultsSink
+
+
+def record(send_id: int) -> TransactionProcessingData:
+    return TransactionProcessingData(datetime(2022, 6, 1, 12, 0, send_id), 'onering', started_at=datetime.utcnow(),
+        txn_id=f'signature{send_id}', send_id=send_id)
+
+
+def rows(path) -> list:
+    with sqlite3.connect(path) as connection:
+        return connection.execute('SELECT status, send_id, txn_id FROM transaction_processing_data ORDER BY id').fetchall()
+
+
+def test_full_batch_is_written_without_waiting_for_the_interval(tmp_path):
+    path = tmp_path / 'results.db'
+
+    async def run():
+        async with SqliteResultsSink(str(path), batch_size=3, flush_interval=60.0) as sink:
+            for send_id in range(4):
+                sink.put(record(send_id))
+            for _ in range(100):
+                if sink.written:
+                    break
+                await asyncio.sleep(0.01)
+            return sink.written, rows(path)
+    written, written_rows = asyncio.run(run())
+    assert written == 3
+    assert written_rows == [('completed', send_id, f'signature{send_id}') for send_id in range(3)]
+
+
+def test_partial_batch_is_written_after_the_interval(tmp_path):
+    path = tmp_path / 'results.db'
+
+    async def run():
+        async with SqliteResultsSink(str(path), batch_size=100, flush_interval=0.05) as sink:
+            sink.put(record(1), 'expired')
+            await asyncio.sleep(0.3)
+            return rows(path)
+    assert asyncio.run(run()) == [('expired', 1, 'signature1')]
+
+
+def test_close_writes_the_queued_records(tmp_path):
+    path = tmp_path / 'results.db'
+
+    async def run():
+        sink = await SqliteResultsSink(str(path), batch_size=100, flush_interval=60.0).start()
+        for send_id in range(5):
+            sink.put(record(send_id))
+        await sink.close()
+        return sink
+    sink = asyncio.run(run())
+    assert sink.written == 5 and sink.dropped == 0
+    assert [row[1] for row in rows(path)] == list(range(5))
+
+
+def test_database_of_an_older_run_gets_the_added_columns(tmp_path):
+    path = tmp_path / 'results.db'
+    with sqlite3.connect(path) as connection:
+        connection.execute('CREATE TABLE transaction_processing_data (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+            'status TEXT NOT NULL, client_time REAL, provider TEXT, txn_id TEXT, started_at REAL, finished_at REAL, '
+            'txnblock_time REAL, blockchain_time REAL, blockchain_counter INTEGER, ws_time REAL, '
+            'processing_data_updated REAL)')
+        connection.execute("INSERT INTO transaction_processing_data (status, txn_id) VALUES ('completed', 'old')")
+
+    async def run():
+        async with SqliteResultsSink(str(path), flush_interval=0.01) as sink:
+            sink.put(record(7))
+    asyncio.run(run())
+    with sqlite3.connect(path) as connection:
+        columns = {row[1] for row in connection.execute('PRAGMA table_info(transaction_processing_data)')}
+    assert set(ADDED_COLUMNS) <= columns
+    assert rows(path) == [('completed', None, 'old'), ('completed', 7, 'signature7')]
@@ -0,0 +1,105 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from rpc_batch import BatchRpcTransport, BatchingHTTPProvider
+
+ENDPOINT = 'http://rpc.test'
+
+
+class FakeNode:
+    # answers every call with its params, batches are answered in reverse order
+    def __init__(self, accept_batches: bool = True, drop_id: int = None) -> None:
+        self.accept_batches: bool = accept_batches
+        self.drop_id: int = drop_id
+        self.posts: list = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        self.posts.append(body)
+        if isinstance(body, dict):
+            return httpx.Response(200, json=self.answer(body))
+        if not self.accept_batches:
+            return httpx.Response(200, json={'jsonrpc': '2.0', 'id': None,
+                'error': {'code': -32600, 'message': 'batch requests are not allowed'}})
+        return httpx.Response(200, json=[self.answer(call) for call in reversed(body) if call['id'] != self.drop_id])
+
+    def answer(self, call: dict) -> dict:
+        return {'jsonrpc': '2.0', 'id': call['id'], 'result': {'value': call['params']}}
+
+
+def run_calls(node: FakeNode, calls: list, max_batch: int = 20) -> tuple:
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(node)) as http:
+            transport = BatchRpcTransport(http, ENDPOINT, max_batch=max_batch, max_delay=0.001)
+            results = await asyncio.gather(
+                *[transport.call('getBalance', *params) for params in calls], return_exceptions=True
+            )
+            await transport.close()
+            return results, transport
+    return asyncio.run(run())
+
+
+def test_calls_are_split_into_batches_and_matched_by_id():
+    node = FakeNode()
+    results, transport = run_calls(node, [[f'account{index}'] for index in range(5)], max_batch=2)
+    assert [len(post) for post in node.posts] == [2, 2, 1]
+    assert [result['result']['value'] for result in results] == [[f'account{index}'] for index in range(5)]
+    assert (transport.stats.posts, transport.stats.calls) == (3, 5)
+
+
+def test_call_missing_in_the_batch_response_fails():
+    node = FakeNode(drop_id=2)
+    results, _ = run_calls(node, [['account0'], ['account1'], ['account2']])
+    assert results[0]['result']['value'] == ['account0']
+    assert isinstance(results[1], ValueError)
+    assert results[2]['result']['value'] == ['account2']
+
+
+def test_refused_batch_falls_back_to_single_calls():
+    node = FakeNode(accept_batches=False)
+    results, transport = run_calls(node, [['account0'], ['account1']])
+    assert [result['result']['value'] for result in results] == [['account0'], ['account1']]
+    assert transport.refused and not transport.batches('getBalance')
+    assert transport.stats.single_posts == 2
+    assert [type(post) for post in node.posts] == [list, dict, dict]
+
+
+def test_coalesced_calls_get_their_own_result():
+    node = FakeNode()
+    results, transport = run_calls(node, [['account0'], ['account0']])
+    assert len(node.posts) == 1 and len(node.posts[0]) == 1
+    assert transport.stats.coalesced == 1
+    assert results[0] == results[1] and results[0] is not results[1]
+    results[0]['result']['value'].append('changed')
+    assert results[1]['result']['value'] == ['account0']
+
+
+@pytest.mark.parametrize('status', [400, 413])
+def test_batch_refused_with_http_error_falls_back(status):
+    def refuse(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        if isinstance(body, list):
+            return httpx.Response(status, text='batch requests are not supported')
+        return httpx.Response(200, json=FakeNode().answer(body))
+    results, transport = run_calls(refuse, [['account0']])
+    assert results[0]['result']['value'] == ['account0'] and transport.refused
+
+
+def test_provider_sends_calls_on_their_own_once_batches_are_refused():
+    node = FakeNode(accept_batches=False)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(node)) as http:
+            transport = BatchRpcTransport(http, ENDPOINT, max_batch=20)
+            provider = BatchingHTTPProvider(ENDPOINT, transport)
+            first = await provider.make_request('getBalance', 'account0')
+            second = await provider.make_request('getBalance', 'account1')
+            await transport.close()
+            return first, second
+    first, second = asyncio.run(run())
+    assert (first['result']['value'], second['result']['value']) == (['account0'], ['account1'])
+    # the refused batch, its call alone, the second call alone without a batch attempt
+    assert [type(post) for post in node.posts] == [list, dict, dict]
@@ -0,0 +1,28 @@
+import asyncio
+
+from solana.rpc.commitment import Finalized
+
+from conftest import serve_mock
+from rpc_batch import PooledHTTPProvider
+from rpc_session import RpcSession
+
+
+def test_clients_share_the_pooled_connection(mock_cluster):
+    async def run():
+        async with serve_mock(mock_cluster.validator) as (url, _):
+            session = RpcSession(max_connections=2)
+            client = session.client(url)
+            other_client = session.client(url, Finalized)
+            for _ in range(5):
+                await client.get_slot()
+            await other_client.get_balance(mock_cluster.payer.public_key)
+            replaced = list(session._replaced_providers)
+            stats = session.stats()[url]
+            provider = client._provider
+            await session.close()
+            return stats, provider, replaced
+    stats, provider, replaced = asyncio.run(run())
+    assert (stats.requests, stats.connections, stats.reused()) == (6, 1, 5)
+    assert isinstance(provider, PooledHTTPProvider)
+    # the sessions the AsyncClients opened on their own are closed with the session
+    assert len(replaced) == 2 and all(provider.session.is_closed for provider in replaced)
@@ -0,0 +1,76 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from solana.keypair import Keypair
+
+from presigner import PresignedTxnPipeline
+from shards import ShardSelector, SHARD_LEAST_IN_FLIGHT, SHARD_ROUND_ROBIN
+
+
+def pubkeys(count: int) -> list:
+    return [Keypair().public_key for _ in range(count)]
+
+
+def test_round_robin_takes_the_shards_in_turns():
+    selector = ShardSelector(pubkeys(3), SHARD_ROUND_ROBIN)
+    selector.acquire(1)
+    assert [selector.select() for _ in range(7)] == [0, 1, 2, 0, 1, 2, 0]
+
+
+def test_least_in_flight_takes_the_shard_with_fewest_in_flight():
+    selector = ShardSelector(pubkeys(3), SHARD_LEAST_IN_FLIGHT)
+    selector.acquire(0)
+    selector.acquire(0)
+    selector.acquire(2)
+    assert selector.select() == 1
+    selector.acquire(1)
+    selector.acquire(1)
+    assert selector.select() == 2
+    selector.release(0)
+    selector.release(0)
+    assert selector.select() == 0
+    assert selector.sent == [2, 2, 1] and selector.in_flight == [0, 2, 1]
+
+
+def test_least_in_flight_ties_are_taken_in_turns():
+    selector = ShardSelector(pubkeys(3), SHARD_LEAST_IN_FLIGHT)
+    assert [selector.select() for _ in range(4)] == [0, 1, 2, 0]
+
+
+def test_unknown_strategy_is_refused():
+    with pytest.raises(ValueError):
+        ShardSelector(pubkeys(2), 'random')
+
+
+def test_label_is_the_shard_id_only_with_more_shards():
+    assert ShardSelector(pubkeys(1)).label(0) is None
+    assert ShardSelector(pubkeys(2), shard_ids=[4, 5], shards=6).label(1) == 5
+
+
+class FixedBlockhash:
+    def __init__(self) -> None:
+        self.blockhash: str = str(Keypair().public_key)
+
+    async def get_or_refresh(self) -> str:
+        return self.blockhash
+
+
+def test_presigned_transactions_follow_the_selector():
+    selector = ShardSelector(pubkeys(3), SHARD_LEAST_IN_FLIGHT)
+    # shard 0 is busy, least-in-flight picks from the others only
+    selector.acquire(0)
+    selector.acquire(0)
+
+    async def run():
+        pipeline = PresignedTxnPipeline(
+            Keypair(), Keypair(), selector, FixedBlockhash(), ThreadPoolExecutor(max_workers=2), queue_size=6
+        )
+        async with pipeline:
+            shards = []
+            for _ in range(4):
+                presigned = await pipeline.get()
+                shards.append(presigned.shard)
+                selector.acquire(presigned.shard)
+            return shards
+    assert asyncio.run(run()) == [1, 2, 1, 2]
@@ -0,0 +1,49 @@
+import pytest
+
+from slot_clock import SlotClock, DEFAULT_SLOT_TIME
+
+
+def test_time_of_a_slot_not_seen_is_interpolated():
+    clock = SlotClock(client=None)
+    clock.observe(100, 10.0)
+    clock.observe(104, 11.6)  # 101 .. 103 were skipped (or between the polls)
+    assert clock.time_of(100) == 10.0
+    assert clock.time_of(102) == pytest.approx(10.8)
+    assert clock.slot_at(10.8) == pytest.approx(102)
+    assert clock.slot_time() == pytest.approx(0.4)
+
+
+def test_slots_out_of_the_buffer_are_extrapolated():
+    clock = SlotClock(client=None)
+    assert clock.time_of(1) is None and clock.slot_at(1.0) is None
+    clock.observe(10, 1.0)
+    # a single slot, the mean slot time is not known yet
+    assert clock.time_of(12) == pytest.approx(1.0 + 2 * DEFAULT_SLOT_TIME)
+    clock.observe(20, 2.0)
+    assert clock.time_of(30) == pytest.approx(3.0)
+    assert clock.time_of(5) == pytest.approx(0.5)
+    assert clock.slot_at(2.5) == pytest.approx(25)
+
+
+def test_only_first_arrival_of_newer_slot_counts():
+    clock = SlotClock(client=None)
+    assert clock.observe(10, 1.0)
+    assert not clock.observe(10, 1.2)
+    assert not clock.observe(9, 1.3)
+    assert clock.stats['out of order'] == 1
+    # a slot polled late does not go back in time
+    assert clock.observe(11, 0.5)
+    assert clock.time_of(11) == 1.0
+
+
+def test_ring_buffer_keeps_newest_slots():
+    clock = SlotClock(client=None, capacity=4)
+    for slot in range(10):
+        clock.observe(slot, slot * 0.5)
+    assert clock.size == 4
+    assert clock.newest_slot() == 9
+    assert clock.time_of(7) == 3.5
+    # slot 2 is out of the buffer, extrapolated from the oldest one kept
+    assert clock.time_of(2) == pytest.approx(1.0)
+    with pytest.raises(ValueError):
+        SlotClock(client=None, capacity=1)
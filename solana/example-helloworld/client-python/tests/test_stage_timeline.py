@@ -0,0 +1,42 @@
+import asyncio
+
+from stage_timeline import StageTimelineTracker
+
+
+class StatusClient:
+    # the re-signed transaction lands, its first signature never does
+    async def get_signature_statuses(self, txn_ids: list) -> dict:
+        return {'result': {'value': [
+            {'slot': 7, 'confirmationStatus': 'finalized', 'err': None} if txn_id == 'second' else None
+            for txn_id in txn_ids
+        ]}}
+
+
+def test_stages_of_the_re_signed_signature():
+    async def track():
+        tracker = StageTimelineTracker(StatusClient(), min_interval=0.01, max_interval=0.02, timeout=1)
+        timeline = tracker.track('first')
+        await asyncio.sleep(0.05)
+        tracker.add_signature('first', 'second')
+        return await timeline
+
+    timeline = asyncio.run(track())
+    assert timeline.txn_id == 'first'
+    assert timeline.signatures == ['first', 'second']
+    assert timeline.landed_txn_id == 'second'
+    assert timeline.is_finalized() and timeline.polled
+    assert timeline.slots == {'processed': 7, 'confirmed': 7, 'finalized': 7}
+
+
+def test_signature_tracked_twice_shares_the_timeline():
+    async def track():
+        tracker = StageTimelineTracker(StatusClient(), min_interval=0.01, max_interval=0.02, timeout=1)
+        first, again = tracker.track('second'), tracker.track('second')
+        pending = tracker.pending()
+        timelines = await asyncio.gather(first, again)
+        await tracker.close()
+        return first is again, pending, timelines, tracker.pending()
+
+    same_task, pending, (timeline, again), pending_after = asyncio.run(track())
+    assert same_task and pending == 1 and pending_after == 0
+    assert timeline is again and timeline.is_finalized()
@@ -0,0 +1,81 @@
+import asyncio
+import socket
+
+from conftest import serve_mock
+from ws_subscriptions import SubscriptionManager
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+async def next_slot(subscription) -> int:
+    _, notification = await asyncio.wait_for(subscription.get(), timeout=5)
+    return notification['result']['slot']
+
+
+def test_dropped_socket_is_reconnected_and_resubscribed(mock_cluster):
+    async def run():
+        async with serve_mock(mock_cluster.validator) as (_, ws_url), \
+                SubscriptionManager(ws_url, reconnect_delay=0.05, verbose=False) as manager:
+            subscription = await manager.slot_subscribe()
+            await next_slot(subscription)
+            first_server_id = subscription.server_id
+            await manager.connections[0].ws.close()
+            while subscription.server_id == first_server_id:
+                await next_slot(subscription)
+            slot = await next_slot(subscription)
+            return first_server_id, subscription.server_id, slot, len(mock_cluster.validator.slot_subscriptions)
+
+    first_server_id, server_id, slot, server_subscriptions = asyncio.run(run())
+    assert server_id != first_server_id and slot > 0
+    # the subscription of the dropped socket is gone at the server, only the restored one is notified
+    assert server_subscriptions == 1
+
+
+def test_subscription_postponed_until_the_socket_connects(mock_cluster):
+    port = free_port()
+
+    async def run():
+        manager = await SubscriptionManager(f'ws://127.0.0.1:{port}', reconnect_delay=0.05, connect_timeout=0.2,
+            verbose=False).start()
+        # nothing listens yet, the subscription does not wait for the socket longer than the connect timeout
+        subscription = await asyncio.wait_for(manager.slot_subscribe(), timeout=2)
+        postponed = subscription.server_id is None and subscription.active
+        async with serve_mock(mock_cluster.validator, port):
+            slot = await next_slot(subscription)
+            await manager.close()
+        return postponed, slot
+
+    postponed, slot = asyncio.run(run())
+    assert postponed and slot > 0
+
+
+def test_close_wakes_the_consumers(mock_cluster):
+    async def run():
+        async with serve_mock(mock_cluster.validator) as (_, ws_url):
+            manager = await SubscriptionManager(ws_url, verbose=False).start()
+            subscription = await manager.slot_subscribe()
+            batches = await manager.slot_subscribe(decoder=lambda received_at, params: params['result']['slot'])
+
+            async def consume() -> int:
+                return len([notification async for notification in subscription])
+
+            async def consume_batches() -> int:
+                slots = 0
+                while True:
+                    try:
+                        slots += len(await batches.get())
+                    except ConnectionError:
+                        return slots
+
+            consumers = asyncio.gather(consume(), consume_batches())
+            await asyncio.sleep(0.1)
+            await manager.close()
+            return await asyncio.wait_for(consumers, timeout=1), subscription.active, batches.active
+
+    (consumed, consumed_slots), active, batches_active = asyncio.run(run())
+    assert consumed > 0 and consumed_slots > 0
+    assert not active and not batches_active
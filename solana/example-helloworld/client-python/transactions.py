@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import os
+import layout
+
+from solana.publickey import PublicKey
+from solana.transaction import Transaction, TransactionInstruction, AccountMeta
+from solana.blockhash import Blockhash
+from datetime import datetime, date
+
+DERIVED_ADDRESS_SEED = 'HELLOWORLD'
+
+def get_data_account_seed(shard: int = 0) -> str:
+    # shard 0 is the original data account, the other shards get their number appended
+    return f'{DERIVED_ADDRESS_SEED}-{shard}' if shard else DERIVED_ADDRESS_SEED
+
+def get_data_account_pubkey(public_key: PublicKey, program_key: PublicKey, shard: int = 0) -> PublicKey:
+    # getting data pubkey
+    return PublicKey.create_with_seed(
+        from_public_key=public_key,
+        seed = get_data_account_seed(shard),
+        program_id=program_key
+    )
+
+def get_counter_txn(
+    public_key: PublicKey,
+    program_key: PublicKey,
+    program_data_key: PublicKey,
+    client_time: date = datetime.utcnow(),
+    recent_blockhash:Blockhash = None,
+    nonce_key: PublicKey = None
+) -> Transaction:
+    keys = [
+        AccountMeta(pubkey=program_data_key, is_signer=False, is_writable=True),
+        AccountMeta(pubkey=program_key, is_signer=True, is_writable=False)
+    ]
+    if nonce_key:
+        keys.append(AccountMeta(pubkey=nonce_key, is_signer=False, is_writable=False))
+    counter_instruction = TransactionInstruction(
+        keys=keys,
+        program_id=program_key,
+        data=layout.encode_counter_instruction(client_time)
+    )
+    return Transaction(
+        recent_blockhash=recent_blockhash,
+        nonce_info=None,
+        fee_payer=public_key,
+    ).add(counter_instruction)
+
+def get_delete_data_account_txn(public_key: PublicKey, program_key: PublicKey, recent_blockhash:Blockhash = None) -> Transaction:
+    program_data_key = get_data_account_pubkey(public_key, program_key)
+    delete_account_instruction = TransactionInstruction(
+        keys=[
+            AccountMeta(pubkey=program_data_key, is_signer=False, is_writable=True),
+            AccountMeta(pubkey=program_key, is_signer=True, is_writable=False),
+            AccountMeta(pubkey=public_key, is_signer=True, is_writable=True),
+        ],
+        program_id=program_key,
+        data=layout.DELETE_ACCOUNT_INSTRUCTION_BYTES
+    )
+    return Transaction(
+        recent_blockhash=recent_blockhash,
+        nonce_info=None,
+        fee_payer=public_key,
+    ).add(delete_account_instruction)
+
+def get_txn_nonce_key() -> PublicKey:
+    # The counter instruction data carries the client timestamp in seconds only, two counter transactions
+    # created in the same second with the same blockhash would be byte-to-byte identical and the second one
+    # would be deduplicated by the validator. The program reads only the first two accounts, a random
+    # read-only account appended to the instruction makes the transaction unique without touching the program.
+    return PublicKey(os.urandom(32))
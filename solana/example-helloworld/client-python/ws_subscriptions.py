@@ -0,0 +1,366 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+import struct
+import time
+import aiohttp
+
+from collections import deque
+from datetime import datetime
+from typing import Callable
+from solana.rpc.commitment import Commitment, Processed
+
+from capture import CaptureWriter, KIND_WS_SEND, KIND_WS_RECEIVE
+
+try:
+    import orjson
+    json_loads = orjson.loads  # optional, a few times faster than json for the notification sized messages
+except ImportError:
+    json_loads = json.loads
+
+# notifications after which the server drops the subscription on its own
+ONE_SHOT_NOTIFICATIONS = {'signatureNotification'}
+
+# receive times are taken with the monotonic clock, the wall clock time is derived from it only when needed
+_WALL_CLOCK_OFFSET = time.time() - time.monotonic()
+_EPOCH = datetime(1970, 1, 1)
+
+
+def to_wall_time(monotonic: float) -> datetime:
+    # same (naive UTC) time as datetime.utcnow() at the monotonic time
+    return datetime.utcfromtimestamp(_WALL_CLOCK_OFFSET + monotonic)
+
+
+def to_monotonic(wall_time: datetime) -> float:
+    # monotonic time of a (naive UTC) datetime.utcnow() time, the inverse of to_wall_time
+    return (wall_time - _EPOCH).total_seconds() - _WALL_CLOCK_OFFSET
+
+
+def ws_request(request_id: int, method: str, params: list) -> dict:
+    return {
+        "jsonrpc": "2.0",
+        "id": request_id,
+        "method": method,
+        "params": params,
+    }
+
+
+class Subscription:
+    # Client side of one subscription. Notifications are delivered through a bounded queue
+    # as (received_at, params) tuples, when the consumer is too slow the oldest notification
+    # is dropped so the socket reader is never blocked. A closed subscription (unsubscribed,
+    # one-shot notified or closed with its manager) wakes its consumers up, 'get' raises
+    # ConnectionError once the queued notifications are taken and the iteration stops.
+    def __init__(self, method: str, params: list, queue_size: int) -> None:
+        self.method: str = method
+        self.params: list = params
+        self.queue_size: int = queue_size
+        self.queue: asyncio.Queue = asyncio.Queue()  # bounded by 'deliver', the closing None always fits in
+        self.server_id: int = None
+        self.dropped: int = 0
+        self.active: bool = True
+        self._connection: _WsConnection = None
+
+    def deliver(self, received_at: float, params: dict) -> None:
+        if self.queue.qsize() >= self.queue_size:
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait((to_wall_time(received_at), params))
+
+    def close(self) -> None:
+        if self.active:
+            self.active = False
+            self.queue.put_nowait(None)
+
+    def queued(self) -> int:
+        return self.queue.qsize() if self.active else max(self.queue.qsize() - 1, 0)
+
+    async def get(self) -> tuple[datetime, dict]:
+        notification = await self.queue.get()
+        if notification is None:
+            self.queue.put_nowait(None)  # for the other consumers
+            raise ConnectionError(f'{self} is closed')
+        return notification
+
+    def __aiter__(self) -> Subscription:
+        return self
+
+    async def __anext__(self) -> tuple[datetime, dict]:
+        try:
+            return await self.get()
+        except ConnectionError:
+            raise StopAsyncIteration
+
+    def __str__(self):
+        return (f'Subscription(method={self.method}, params={self.params}, server_id={self.server_id}, '
+            f'queued={self.queued()}, dropped={self.dropped})')
+
+
+class BatchSubscription(Subscription):
+    # Subscription of the low overhead ingestion path.
+    #
+    # Every notification is decoded right by the socket reader with 'decoder(received_at, params)'
+    # to a fixed-size tuple, 'received_at' is the monotonic receive time. The consumer gets all
+    # the tuples received since its previous call as one batch (a list), one wake up serves many
+    # notifications. Up to 'queue_size' tuples wait, the oldest ones are dropped for a slow consumer.
+    def __init__(self, method: str, params: list, queue_size: int, decoder: Callable) -> None:
+        super().__init__(method, params, 1)
+        self.decoder: Callable = decoder
+        self.pending: deque = deque(maxlen=queue_size)
+        self.decode_errors: int = 0
+        self._ready: asyncio.Event = asyncio.Event()
+
+    def deliver(self, received_at: float, params: dict) -> None:
+        try:
+            decoded = self.decoder(received_at, params)
+        except (KeyError, IndexError, TypeError, ValueError, struct.error) as e:
+            self.decode_errors += 1
+            print(f'ERROR: cannot decode notification of {self}: {e!r}')
+            return
+        if len(self.pending) == self.pending.maxlen:
+            self.dropped += 1
+        self.pending.append(decoded)
+        self._ready.set()
+
+    def close(self) -> None:
+        self.active = False
+        self._ready.set()
+
+    def queued(self) -> int:
+        return len(self.pending)
+
+    async def get(self) -> list:
+        await self._ready.wait()
+        if not self.pending and not self.active:
+            raise ConnectionError(f'{self} is closed')
+        if self.active:
+            self._ready.clear()
+        batch = list(self.pending)
+        self.pending.clear()
+        return batch
+
+
+class _WsConnection:
+    def __init__(self, manager: SubscriptionManager, index: int) -> None:
+        self.manager: SubscriptionManager = manager
+        self.index: int = index
+        self.ws: aiohttp.ClientWebSocketResponse = None
+        self.subscriptions: set = set()
+        self.by_server_id: dict = {}  # server subscription id -> Subscription
+        self.to_restore: set = set()  # subscriptions that were active when the connection dropped
+        self.pending: dict = {}  # request id -> (future, Subscription)
+        self.connected: asyncio.Event = asyncio.Event()
+        self.task: asyncio.Task = None
+        self.capture_stream: int = manager.capture.stream(manager.ws_url, new=True) if manager.capture else None
+
+    async def request(self, method: str, params: list, subscription: Subscription = None):
+        try:
+            await asyncio.wait_for(self.connected.wait(), timeout=self.manager.connect_timeout)
+        except asyncio.TimeoutError:
+            raise ConnectionError(f'ws [{self.index}] {self.manager.ws_url} is not connected in {self.manager.connect_timeout} seconds')
+        request_id = next(self.manager.request_ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = (future, subscription)
+        try:
+            message = json.dumps(ws_request(request_id, method, params))
+            if self.manager.capture:
+                self.manager.capture.write(KIND_WS_SEND, self.capture_stream, request_id, message.encode())
+            await self.ws.send_str(message)
+            return await asyncio.wait_for(future, timeout=self.manager.request_timeout)
+        finally:
+            self.pending.pop(request_id, None)
+
+    async def subscribe(self, subscription: Subscription) -> int:
+        subscription._connection = self
+        self.subscriptions.add(subscription)
+        server_id = await self.request(subscription.method, subscription.params, subscription)
+        if self.manager.verbose:
+            print(f'ws [{self.index}] subscribed: {subscription}')
+        return server_id
+
+    async def _resubscribe(self, subscription: Subscription) -> None:
+        try:
+            await self.subscribe(subscription)
+        except Exception as e:
+            print(f'ERROR: ws [{self.index}] cannot resubscribe {subscription}: {e}')
+
+    async def run(self) -> None:
+        delay = self.manager.reconnect_delay
+        while True:
+            try:
+                async with self.manager.http_session.ws_connect(self.manager.ws_url, heartbeat=self.manager.heartbeat) as ws:
+                    self.ws = ws
+                    self.connected.set()
+                    delay = self.manager.reconnect_delay
+                    resubscribes = [
+                        asyncio.create_task(self._resubscribe(subscription))
+                        for subscription in self.to_restore if subscription in self.subscriptions
+                    ]
+                    self.to_restore = set()
+                    await self._read(ws)
+                    for resubscribe in resubscribes:
+                        resubscribe.cancel()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f'ERROR: ws [{self.index}] {self.manager.ws_url} connection failure: {e}')
+            self.connected.clear()
+            self.by_server_id.clear()
+            self.to_restore = set(self.subscriptions)
+            for future, _ in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError(f'ws [{self.index}] connection dropped'))
+            print(f'ws [{self.index}] reconnecting in {delay} seconds, {len(self.subscriptions)} subscriptions to restore')
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.manager.max_reconnect_delay)
+
+    async def _read(self, ws: aiohttp.ClientWebSocketResponse) -> None:
+        async for msg in ws:
+            received_at = time.monotonic()  # first, the message handling does not add to the measured latency
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                continue
+            data = json_loads(msg.data)
+            if self.manager.capture:
+                self.manager.capture.write(
+                    KIND_WS_RECEIVE, self.capture_stream,
+                    data.get('id') or data.get('params', {}).get('subscription') or 0, msg.data.encode(), received_at
+                )
+            if 'id' in data:
+                self._on_response(data)
+                continue
+            subscription = self.by_server_id.get(data.get('params', {}).get('subscription'))
+            if subscription is None:
+                continue  # e.g., notification of a subscription that has just been unsubscribed
+            subscription.deliver(received_at, data['params'])
+            if data['method'] in ONE_SHOT_NOTIFICATIONS:
+                self._forget(subscription)
+
+    def _on_response(self, data: dict) -> None:
+        future, subscription = self.pending.get(data['id'], (None, None))
+        if future is None or future.done():
+            return
+        if 'error' in data:
+            future.set_exception(ValueError(f'ws request failed: {data["error"]}'))
+            return
+        if subscription is not None:
+            subscription.server_id = data['result']
+            self.by_server_id[subscription.server_id] = subscription
+        future.set_result(data['result'])
+
+    def _forget(self, subscription: Subscription) -> None:
+        self.subscriptions.discard(subscription)
+        if self.by_server_id.get(subscription.server_id) is subscription:
+            del self.by_server_id[subscription.server_id]
+        subscription.close()
+
+
+class SubscriptionManager:
+    # Multiplexes account/signature/slot subscriptions over a small pool of websockets.
+    #
+    # Server subscription ids are mapped to the subscriptions in a dict per socket and
+    # every notification is put to the bounded queue of its subscription. A dropped socket
+    # is reconnected with a backoff and all its active subscriptions are subscribed again.
+    # With a 'decoder' the subscription is a BatchSubscription delivering decoded tuples in batches.
+    # A subscription made while the socket is not connected in 'connect_timeout' seconds is postponed,
+    # it is subscribed when the socket connects.
+    def __init__(
+        self,
+        ws_url: str,
+        sockets: int = 1,
+        queue_size: int = 1000,
+        request_timeout: float = 30.0,
+        connect_timeout: float = 10.0,
+        reconnect_delay: float = 1.0,
+        max_reconnect_delay: float = 30.0,
+        heartbeat: float = 30.0,
+        verbose: bool = True,  # every subscription is printed
+        capture: CaptureWriter = None
+    ) -> None:
+        self.ws_url: str = ws_url
+        self.capture: CaptureWriter = capture
+        self.queue_size: int = queue_size
+        self.request_timeout: float = request_timeout
+        self.connect_timeout: float = connect_timeout
+        self.reconnect_delay: float = reconnect_delay
+        self.max_reconnect_delay: float = max_reconnect_delay
+        self.heartbeat: float = heartbeat
+        self.verbose: bool = verbose
+        self.request_ids = itertools.count(1)
+        self.http_session: aiohttp.ClientSession = None
+        self.connections: list = [_WsConnection(self, index) for index in range(max(sockets, 1))]
+
+    async def start(self) -> SubscriptionManager:
+        if self.http_session is None:
+            self.http_session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=None, connect=self.connect_timeout)
+            )
+            for connection in self.connections:
+                connection.task = asyncio.get_running_loop().create_task(connection.run())
+        return self
+
+    async def subscribe(self, method: str, params: list, queue_size: int = None, decoder: Callable = None) -> Subscription:
+        queue_size = queue_size if queue_size else self.queue_size
+        subscription = BatchSubscription(method, params, queue_size, decoder) if decoder \
+            else Subscription(method, params, queue_size)
+        connection = min(self.connections, key=lambda c: len(c.subscriptions))
+        try:
+            await connection.subscribe(subscription)
+        except ConnectionError as e:
+            # the subscription stays registered at the connection and it's restored after the (re)connect,
+            # a dropped socket has put it to restore already, a socket not connected in time has not
+            print(f'ws subscription {subscription} postponed to the reconnection: {e}')
+            if connection.connected.is_set():
+                await connection._resubscribe(subscription)
+            else:
+                connection.to_restore.add(subscription)
+        except Exception:
+            connection._forget(subscription)
+            raise
+        return subscription
+
+    async def account_subscribe(self, address: str, commitment: Commitment = Processed, **kwargs) -> Subscription:
+        return await self.subscribe(
+            'accountSubscribe', [str(address), {"encoding": "base64", "commitment": str(commitment)}], **kwargs
+        )
+
+    async def signature_subscribe(self, signature: str, commitment: Commitment = Processed, **kwargs) -> Subscription:
+        return await self.subscribe('signatureSubscribe', [str(signature), {"commitment": str(commitment)}], **kwargs)
+
+    async def slot_subscribe(self, **kwargs) -> Subscription:
+        return await self.subscribe('slotSubscribe', [], **kwargs)
+
+    async def unsubscribe(self, subscription: Subscription) -> None:
+        connection: _WsConnection = subscription._connection
+        if connection is None or not subscription.active:
+            return
+        server_id = subscription.server_id
+        connection._forget(subscription)
+        if server_id is not None and connection.connected.is_set():
+            try:
+                await connection.request(subscription.method.replace('Subscribe', 'Unsubscribe'), [server_id])
+            except Exception as e:
+                print(f'ERROR: cannot unsubscribe {subscription}: {e}')
+
+    def subscriptions(self) -> list:
+        return [subscription for connection in self.connections for subscription in connection.subscriptions]
+
+    async def close(self) -> None:
+        for connection in self.connections:
+            if connection.task is not None:
+                connection.task.cancel()
+        await asyncio.gather(*[c.task for c in self.connections if c.task is not None], return_exceptions=True)
+        for connection in self.connections:
+            connection.task = None
+            for subscription in connection.subscriptions:
+                subscription.close()
+        if self.http_session is not None:
+            await self.http_session.close()
+            self.http_session = None
+
+    async def __aenter__(self) -> SubscriptionManager:
+        return await self.start()
+
+    async def __aexit__(self, _exc_type, _exc, _tb) -> None:
+        await self.close()